@@ -0,0 +1,890 @@
+# coding: utf-8
+"""
+Benchmark pour throughput of built-in input, convert and output factories.
+
+Synthetic CSV file and SQLite table of configurable shape are generated in the
+work directory. Each input/convert/output combination is run in a separate
+process for each batch size. Rows/s and MB/s are measured over data
+processing only, excluding program startup, using the final progress record.
+Wall time, CPU time and peak RSS are measured over the whole process. Results
+are stored as JSON, which can be compared with a previous run to find
+regressions.
+
+MB/s is based on the size of the generated CSV file, as the logical data
+size.
+
+Run:
+python bench/bench_pour.py --rows=100000 --batch-sizes=100,1000,10000 \\
+    --result=bench_result.json --compare=bench_baseline.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+from argparse import ArgumentParser
+import csv
+import json
+import os
+import os.path
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+
+# Program file path
+PROG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'src',
+    'aoikpourtable',
+    'aoikpourtable.py')
+
+
+# Input specs.
+# Each spec is a tuple of (name, arguments factory). The arguments factory is
+# called with the bench context dict and returns a tuple of (command
+# arguments list, stdin file path or None).
+INPUT_SPECS = [
+    (
+        'empty',
+        lambda ctx: ([], None),
+    ),
+    (
+        'csv',
+        lambda ctx: ([
+            '--input=' + ctx['csv_path'],
+            '--input-factory=aoikpourtable.csv_io::csv_input_factory',
+            '--input-args=quoting=QUOTE_MINIMAL',
+        ], None),
+    ),
+    (
+        'stdin',
+        lambda ctx: ([
+            '--input-factory=aoikpourtable.std_io::stdin_factory',
+        ], ctx['csv_path']),
+    ),
+    (
+        'db',
+        lambda ctx: ([
+            '--input=sqlite:///' + ctx['db_path'],
+            '--input-factory=aoikpourtable.db_io::select_factory',
+            '--input-args=table=src&columns=' + ctx['columns_text'],
+        ], None),
+    ),
+    (
+        'sqlite',
+        lambda ctx: ([
+            '--input=sqlite:///' + ctx['db_path'],
+            '--input-factory=aoikpourtable.sqlite_io::select_factory',
+            '--input-args=table=src&columns=' + ctx['columns_text'],
+        ], None),
+    ),
+    (
+        'gen',
+        lambda ctx: ([
+            '--input=gen',
+            '--input-factory=aoikpourtable.gen_io::input_factory',
+            '--input-args=' + ctx['gen_args'],
+        ], None),
+    ),
+]
+
+
+# Convert specs.
+# Each spec is a tuple of (name, arguments factory, input names the convert is
+# applicable to). None means applicable to all inputs.
+CONVERT_SPECS = [
+    (
+        'none',
+        lambda ctx: [],
+        None,
+    ),
+    (
+        'typed',
+        lambda ctx: ['--convert-args=' + ctx['convert_args']],
+        ('csv', 'db', 'sqlite'),
+    ),
+]
+
+
+# Output specs.
+# Each spec is a tuple of (name, arguments factory, input names the output is
+# applicable to). None means applicable to all inputs.
+OUTPUT_SPECS = [
+    (
+        'empty',
+        lambda ctx: [],
+        None,
+    ),
+    (
+        'csv',
+        lambda ctx: [
+            '--output=' + ctx['out_csv_path'],
+            '--output-factory=aoikpourtable.csv_io::csv_output_factory',
+            '--output-args=quoting=QUOTE_MINIMAL',
+        ],
+        ('csv', 'db', 'sqlite', 'gen'),
+    ),
+    (
+        'stdout',
+        lambda ctx: [
+            '--output-factory=aoikpourtable.std_io::stdout_factory',
+        ],
+        None,
+    ),
+    (
+        'db',
+        lambda ctx: [
+            '--output=sqlite:///' + ctx['out_db_path'],
+            '--output-factory=aoikpourtable.db_io::insert_factory',
+            '--output-args=table=dst&columns=' + ctx['columns_text'],
+        ],
+        ('csv', 'db', 'sqlite', 'gen'),
+    ),
+    (
+        'sqlite',
+        lambda ctx: [
+            '--output=sqlite:///' + ctx['out_db_path'],
+            '--output-factory=aoikpourtable.sqlite_io::insert_factory',
+            '--output-args=table=dst&columns=' + ctx['columns_text']
+            + '&pragma_journal_mode=OFF&pragma_synchronous=OFF',
+        ],
+        ('csv', 'db', 'sqlite', 'gen'),
+    ),
+]
+
+
+#
+def get_arg_parser():
+    """
+    Create an "ArgumentParser" instance for "main" function.
+
+    @return: An "ArgumentParser" instance.
+    """
+    # Create an "ArgumentParser" instance
+    arg_parser = ArgumentParser()
+
+    #
+    arg_parser.add_argument(
+        '--rows',
+        dest='row_count',
+        type=int,
+        default=100000,
+        metavar='N',
+        help='Number of rows to generate. Default is 100000.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--int-columns',
+        dest='int_column_count',
+        type=int,
+        default=2,
+        metavar='N',
+        help='Number of integer columns. Default is 2.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--str-columns',
+        dest='str_column_count',
+        type=int,
+        default=3,
+        metavar='N',
+        help='Number of string columns. Default is 3.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--str-width',
+        dest='str_width',
+        type=int,
+        default=16,
+        metavar='N',
+        help='Width of string columns. Default is 16.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--batch-sizes',
+        dest='batch_sizes_text',
+        default='100,1000,10000',
+        metavar='M,N',
+        help='Batch sizes to run. Default is "100,1000,10000".',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--only',
+        dest='only_text',
+        default=None,
+        metavar='TEXT',
+        help=('Only run combinations whose name contains TEXT, e.g.'
+              ' "csv-none-db".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Run each combination N times and keep the fastest run.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--seed',
+        dest='seed',
+        type=int,
+        default=0,
+        metavar='N',
+        help='Random seed for data generation. Default is 0.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--work-dir',
+        dest='work_dir',
+        default=None,
+        metavar='DIR',
+        help='Directory for generated data. Default is a temporary directory.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--result',
+        dest='result_path',
+        default=None,
+        metavar='FILE',
+        help='Write results as JSON to this file.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--compare',
+        dest='compare_path',
+        default=None,
+        metavar='FILE',
+        help='Compare results with a previous results JSON file.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--threshold',
+        dest='threshold',
+        type=float,
+        default=0.1,
+        metavar='RATIO',
+        help=('Report a regression when rows/s drops by more than RATIO'
+              ' compared with "--compare" file. Default is 0.1.'),
+    )
+
+    # Return an "ArgumentParser" instance
+    return arg_parser
+
+
+#
+def generate_data(ctx, seed):
+    """
+    Generate synthetic CSV file and SQLite table.
+
+    @param ctx: Bench context dict.
+
+    @param seed: Random seed.
+
+    @return: None.
+    """
+    # Create random generator
+    rand = random.Random(seed)
+
+    # Get string characters
+    chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+    # Get string width
+    str_width = ctx['str_width']
+
+    # Get column names
+    column_name_s = ctx['column_name_s']
+
+    # Get integer column count
+    int_column_count = ctx['int_column_count']
+
+    # Open CSV file
+    if IS_PY2:
+        csv_file = open(ctx['csv_path'], mode='wb')
+    else:
+        csv_file = open(ctx['csv_path'], mode='w', newline='')
+
+    # Open SQLite database
+    db_conn = sqlite3.connect(ctx['db_path'])
+
+    # Create table
+    db_conn.execute('DROP TABLE IF EXISTS src')
+
+    db_conn.execute('CREATE TABLE src ({})'.format(', '.join(
+        '{} {}'.format(
+            column_name,
+            'INTEGER' if index < int_column_count else 'TEXT')
+        for index, column_name in enumerate(column_name_s))))
+
+    # Get insert statement
+    insert_sql = 'INSERT INTO src VALUES ({})'.format(
+        ', '.join('?' * len(column_name_s)))
+
+    # Get CSV writer
+    csv_writer = csv.writer(csv_file, lineterminator='\n')
+
+    # Rows of one chunk
+    row_s = []
+
+    # For each row index
+    for row_index in range(ctx['row_count']):
+        # Create row
+        row = [rand.randint(0, 1 << 31) for _ in range(int_column_count)]
+
+        row.extend(
+            ''.join(rand.choice(chars) for _ in range(str_width))
+            for _ in range(len(column_name_s) - int_column_count))
+
+        # Add row to chunk
+        row_s.append(row)
+
+        # If chunk is full, or this is the last row
+        if len(row_s) >= 10000 or row_index == ctx['row_count'] - 1:
+            # Write chunk to CSV file
+            csv_writer.writerows(row_s)
+
+            # Write chunk to SQLite table
+            db_conn.executemany(insert_sql, row_s)
+
+            # Empty chunk
+            row_s = []
+
+    # Close files
+    csv_file.close()
+
+    db_conn.commit()
+
+    db_conn.close()
+
+
+#
+def reset_output(ctx):
+    """
+    Remove output files and progress file, and create an empty output table.
+
+    @param ctx: Bench context dict.
+
+    @return: None.
+    """
+    # For each output file path and the progress file path.
+    # Remove the progress file so that a failed run does not read the
+    # previous run's records.
+    for path in [
+        ctx['out_csv_path'], ctx['out_db_path'], ctx['progress_path'],
+    ]:
+        # If the file exists
+        if os.path.exists(path):
+            # Remove the file
+            os.remove(path)
+
+    # Open output database
+    db_conn = sqlite3.connect(ctx['out_db_path'])
+
+    # Create output table
+    db_conn.execute('CREATE TABLE dst ({})'.format(
+        ', '.join(ctx['column_name_s'])))
+
+    # Close output database
+    db_conn.commit()
+
+    db_conn.close()
+
+
+#
+def read_loop_dura(ctx):
+    """
+    Read data processing seconds from the final record in progress file.
+
+    @param ctx: Bench context dict.
+
+    @return: Data processing seconds, or None if there is no final record,
+    e.g. the run failed.
+    """
+    # If progress file not exists
+    if not os.path.exists(ctx['progress_path']):
+        # Return None
+        return None
+
+    # Open progress file
+    with open(ctx['progress_path'], 'r') as progress_file:
+        # Get the last line
+        last_line = progress_file.read().strip().split('\n')[-1]
+
+    # If progress file is empty
+    if not last_line:
+        # Return None
+        return None
+
+    # Get the last record
+    record = json.loads(last_line)
+
+    # If the last record is not the final record
+    if not record.get('final', False):
+        # Return None
+        return None
+
+    # Return data processing seconds
+    return record['past']
+
+
+#
+def run_once(cmd_arg_s, stdin_path, stderr_path):
+    """
+    Run the program once in a child process.
+
+    @param cmd_arg_s: Command arguments list.
+
+    @param stdin_path: File path to use as stdin, or None.
+
+    @param stderr_path: File path to write stderr to.
+
+    @return: Run info dict, in the format:
+    {
+        'exit_code': ...,
+        'wall': ...,
+        'cpu': ...,
+        'rss_kb': ...,
+        'has_error': ...,
+    }
+    "cpu" and "rss_kb" are None if not supported by the platform.
+    "has_error" is True if stderr contains an error message. The program
+    exits with code 0 on some errors, so the exit code alone is not enough.
+    """
+    # Open stdin file
+    stdin_file = open(stdin_path, 'rb') if stdin_path else None
+
+    # Open null device for stdout
+    null_file = open(os.devnull, 'wb')
+
+    # Open stderr file
+    stderr_file = open(stderr_path, 'wb')
+
+    # Get starting time
+    start_time = time.time()
+
+    # Start child process
+    proc = subprocess.Popen(
+        [sys.executable, PROG_PATH] + cmd_arg_s,
+        stdin=stdin_file,
+        stdout=null_file,
+        stderr=stderr_file)
+
+    # If "os.wait4" is available
+    if hasattr(os, 'wait4'):
+        # Wait for the child process and get its resource usage
+        _, status, rusage = os.wait4(proc.pid, 0)
+
+        # Get exit code
+        exit_code = status >> 8
+
+        # Get CPU time
+        cpu_time = rusage.ru_utime + rusage.ru_stime
+
+        # Get peak RSS, in KB on Linux, in bytes on macOS
+        rss_kb = rusage.ru_maxrss
+
+        if sys.platform == 'darwin':
+            rss_kb //= 1024
+
+        # Tell "proc" the child process has been reaped
+        proc.returncode = exit_code
+
+    # If "os.wait4" is not available, e.g. on Windows
+    else:
+        # Wait for the child process
+        exit_code = proc.wait()
+
+        # CPU time and peak RSS are not supported
+        cpu_time = None
+
+        rss_kb = None
+
+    # Get ending time
+    end_time = time.time()
+
+    # Close files
+    if stdin_file is not None:
+        stdin_file.close()
+
+    null_file.close()
+
+    stderr_file.close()
+
+    # Read stderr
+    with open(stderr_path, 'rb') as stderr_file:
+        stderr_data = stderr_file.read()
+
+    # Return run info dict
+    return {
+        'exit_code': exit_code,
+        'wall': end_time - start_time,
+        'cpu': cpu_time,
+        'rss_kb': rss_kb,
+        'has_error': b'# Error' in stderr_data,
+    }
+
+
+#
+def run_bench(ctx, batch_size_s, only_text, repeat):
+    """
+    Run all combinations.
+
+    @param ctx: Bench context dict.
+
+    @param batch_size_s: Batch sizes list.
+
+    @param only_text: Only run combinations whose name contains this text.
+
+    @param repeat: Run each combination this many times and keep the fastest.
+
+    @return: Results list.
+    """
+    # Results list
+    result_s = []
+
+    # Get CSV file size in MB, used as the logical data size
+    data_mb = os.path.getsize(ctx['csv_path']) / (1024.0 * 1024.0)
+
+    # For each input spec
+    for input_name, input_args_factory in INPUT_SPECS:
+        # For each convert spec
+        for convert_name, convert_args_factory, convert_inputs \
+                in CONVERT_SPECS:
+            # If the convert is not applicable to the input
+            if convert_inputs is not None and input_name not in convert_inputs:
+                continue
+
+            # For each output spec
+            for output_name, output_args_factory, output_inputs \
+                    in OUTPUT_SPECS:
+                # If the output is not applicable to the input
+                if output_inputs is not None \
+                        and input_name not in output_inputs:
+                    continue
+
+                # For each batch size
+                for batch_size in batch_size_s:
+                    # Get combination name
+                    name = '{}-{}-{}-{}'.format(
+                        input_name, convert_name, output_name, batch_size)
+
+                    # If the combination is not selected
+                    if only_text and only_text not in name:
+                        continue
+
+                    # Get input arguments
+                    input_arg_s, stdin_path = input_args_factory(ctx)
+
+                    # Get command arguments
+                    cmd_arg_s = input_arg_s \
+                        + convert_args_factory(ctx) \
+                        + output_args_factory(ctx) \
+                        + [
+                            '--limit-rows={}'.format(ctx['row_count']),
+                            '--batch-size={}'.format(batch_size),
+                            '--progress-interval=3600',
+                            '--progress-file=' + ctx['progress_path'],
+                        ]
+
+                    # Fastest run info
+                    best_run_info = None
+
+                    # For each repeat
+                    for _ in range(repeat):
+                        # Reset output
+                        reset_output(ctx)
+
+                        # Run once
+                        run_info = run_once(
+                            cmd_arg_s, stdin_path, ctx['stderr_path'])
+
+                        # Get data processing seconds from the final
+                        # progress record, which excludes program startup
+                        run_info['loop'] = read_loop_dura(ctx)
+
+                        # Get failure reason. None if the run succeeded.
+                        if run_info['exit_code'] != 0:
+                            run_info['error'] = 'exit code {}'.format(
+                                run_info['exit_code'])
+                        elif run_info['has_error']:
+                            run_info['error'] = 'error in stderr'
+                        elif run_info['loop'] is None:
+                            run_info['error'] = 'no final progress record'
+                        else:
+                            run_info['error'] = None
+
+                        # If the run failed
+                        if run_info['error'] is not None:
+                            # Keep the failed run and stop repeating
+                            best_run_info = run_info
+
+                            break
+
+                        # If the run is the fastest
+                        if best_run_info is None \
+                                or run_info['loop'] < best_run_info['loop']:
+                            # Keep the run
+                            best_run_info = run_info
+
+                    # Get result dict
+                    result = {
+                        'name': name,
+                        'input': input_name,
+                        'convert': convert_name,
+                        'output': output_name,
+                        'batch_size': batch_size,
+                        'rows': ctx['row_count'],
+                        'exit_code': best_run_info['exit_code'],
+                        'error': best_run_info['error'],
+                        'wall': best_run_info['wall'],
+                        'loop': best_run_info['loop'],
+                        'cpu': best_run_info['cpu'],
+                        'rss_kb': best_run_info['rss_kb'],
+                        'rows_per_s': None,
+                        'mb_per_s': None,
+                    }
+
+                    # If the run succeeded
+                    if best_run_info['error'] is None:
+                        # Get loop duration, avoid division by zero
+                        loop_dura = max(best_run_info['loop'], 1e-9)
+
+                        # Set rates
+                        result['rows_per_s'] = ctx['row_count'] / loop_dura
+
+                        if input_name != 'empty':
+                            result['mb_per_s'] = data_mb / loop_dura
+
+                    # Add result to list
+                    result_s.append(result)
+
+                    # Print result
+                    print_result(result)
+
+    # Return results list
+    return result_s
+
+
+#
+def print_result(result):
+    """
+    Print one result.
+
+    @param result: Result dict.
+
+    @return: None.
+    """
+    # If the run failed
+    if result['error'] is not None:
+        # Print message
+        sys.stdout.write('{:32} FAILED, {}\n'.format(
+            result['name'], result['error']))
+
+        # Flush so that progress is visible
+        sys.stdout.flush()
+
+        return
+
+    # Print message
+    sys.stdout.write(
+        '{:32} {:>10.0f} rows/s {:>8} MB/s {:>7.2f}s wall {:>8} cpu'
+        ' {:>10} KB\n'.format(
+            result['name'],
+            result['rows_per_s'],
+            '-' if result['mb_per_s'] is None
+            else '{:.2f}'.format(result['mb_per_s']),
+            result['wall'],
+            '-' if result['cpu'] is None else '{:.2f}s'.format(result['cpu']),
+            '-' if result['rss_kb'] is None else result['rss_kb']))
+
+    # Flush so that progress is visible
+    sys.stdout.flush()
+
+
+#
+def compare_results(result_s, baseline_s, threshold):
+    """
+    Compare results with baseline results.
+
+    @param result_s: Results list.
+
+    @param baseline_s: Baseline results list.
+
+    @param threshold: Regression threshold ratio.
+
+    @return: Number of regressions.
+    """
+    # Map name to baseline result
+    name_to_baseline = dict((x['name'], x) for x in baseline_s)
+
+    # Regression count
+    regression_count = 0
+
+    # Print header
+    sys.stdout.write('\nCompared with baseline:\n')
+
+    # For each result
+    for result in result_s:
+        # Get baseline result
+        baseline = name_to_baseline.get(result['name'], None)
+
+        # If baseline result not exists, or either run failed.
+        # Baseline results written before "error" was added only have
+        # "exit_code".
+        if baseline is None \
+                or baseline.get('error', None) is not None \
+                or baseline['exit_code'] != 0 \
+                or result['error'] is not None:
+            continue
+
+        # Get ratio of rows/s
+        ratio = result['rows_per_s'] / baseline['rows_per_s']
+
+        # Whether this is a regression
+        is_regression = ratio < 1.0 - threshold
+
+        # If this is a regression
+        if is_regression:
+            # Increment regression count
+            regression_count += 1
+
+        # Print message
+        sys.stdout.write('{:32} {:>7.2f}x{}\n'.format(
+            result['name'],
+            ratio,
+            '  REGRESSION' if is_regression else ''))
+
+    # Return regression count
+    return regression_count
+
+
+#
+def main(args=None):
+    """
+    Program entry function.
+
+    @param args: Command arguments list.
+
+    @return: Exit code.
+    """
+    # Parse arguments
+    args = get_arg_parser().parse_args(args)
+
+    # Get work directory
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='aoikpourtable_bench_')
+
+    # If work directory not exists
+    if not os.path.isdir(work_dir):
+        # Create work directory
+        os.makedirs(work_dir)
+
+    # Get column count
+    column_count = args.int_column_count + args.str_column_count
+
+    # Get column names
+    column_name_s = ['c{}'.format(x + 1) for x in range(column_count)]
+
+    # Create bench context dict
+    ctx = {
+        'row_count': args.row_count,
+        'int_column_count': args.int_column_count,
+        'str_width': args.str_width,
+        'column_name_s': column_name_s,
+        'columns_text': ','.join(column_name_s),
+        'convert_args': ','.join(
+            ['i'] * args.int_column_count + ['s'] * args.str_column_count),
+        'gen_args': 'columns={}&seed={}&pool=10'.format(
+            ','.join(
+                ['i:0:{}'.format(1 << 31)] * args.int_column_count
+                + ['s:{}'.format(args.str_width)] * args.str_column_count),
+            args.seed),
+        'csv_path': os.path.join(work_dir, 'src.csv'),
+        'db_path': os.path.join(work_dir, 'src.db'),
+        'out_csv_path': os.path.join(work_dir, 'dst.csv'),
+        'out_db_path': os.path.join(work_dir, 'dst.db'),
+        'progress_path': os.path.join(work_dir, 'progress.jsonl'),
+        'stderr_path': os.path.join(work_dir, 'stderr.txt'),
+    }
+
+    # Print message
+    sys.stdout.write('Work dir: {}\n'.format(work_dir))
+
+    # Generate data
+    generate_data(ctx, args.seed)
+
+    # Get batch sizes
+    batch_size_s = [int(x) for x in args.batch_sizes_text.split(',')]
+
+    # Run all combinations
+    result_s = run_bench(
+        ctx,
+        batch_size_s=batch_size_s,
+        only_text=args.only_text,
+        repeat=max(args.repeat, 1))
+
+    # Create results dict
+    results_info = {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rows': args.row_count,
+            'int_columns': args.int_column_count,
+            'str_columns': args.str_column_count,
+            'str_width': args.str_width,
+            'csv_bytes': os.path.getsize(ctx['csv_path']),
+        },
+        'results': result_s,
+    }
+
+    # If result file path is specified
+    if args.result_path:
+        # Write results
+        with open(args.result_path, 'w') as result_file:
+            json.dump(results_info, result_file, indent=2, sort_keys=True)
+
+    # Exit code
+    exit_code = 0
+
+    # If compare file path is specified
+    if args.compare_path:
+        # Read baseline results
+        with open(args.compare_path, 'r') as compare_file:
+            baseline_s = json.load(compare_file)['results']
+
+        # Compare results with baseline results
+        regression_count = compare_results(
+            result_s, baseline_s, args.threshold)
+
+        # If there are regressions
+        if regression_count:
+            # Set exit code
+            exit_code = 1
+
+    # Return exit code
+    return exit_code
+
+
+# If this module is the main module
+if __name__ == '__main__':
+    # Call "main" function
+    sys.exit(main())
@@ -50,6 +50,14 @@ setup(
         'SQLAlchemy>=0.8, >=0.9, >=1.0'
     ],
 
+    extras_require={
+        # For "async_db_io", which also requires Python 3
+        'async': [
+            'SQLAlchemy>=1.4',
+            'aiosqlite',
+        ],
+    },
+
     entry_points={
         'console_scripts': [
             'aoikpourtable=aoikpourtable.aoikpourtable:main',
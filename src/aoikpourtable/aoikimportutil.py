@@ -105,7 +105,8 @@ def add_to_sys_modules(mod_name, mod_obj=None):
         parent_mod_obj = cur_mod_obj
 
 #/
-def import_module_by_code(mod_code, mod_name, sys_add=True, sys_use=True):
+def import_module_by_code(mod_code, mod_name, sys_add=True, sys_use=True,
+    code_path=None):
     """Create a module object by code.
     @param mod_code: the code that the module contains.
 
@@ -120,6 +121,10 @@ def import_module_by_code(mod_code, mod_name, sys_add=True, sys_use=True):
     If |sys_add| is on, and if |mod_name| is |a.b.c| while modules
      |a| and |a.b| are not existing, empty modules will be created
      for |a| and |a.b| as well.
+
+    @param code_path: the file path the code comes from.
+    If given, it is used as the code objects' file name, so that tracebacks
+     and profilers show the real file instead of |<string>|.
     """
     #/
     mod_obj_old = sys.modules.get(mod_name, None)
@@ -131,6 +136,10 @@ def import_module_by_code(mod_code, mod_name, sys_add=True, sys_use=True):
     #/
     mod_obj = imp.new_module(mod_name)
 
+    #/
+    if code_path:
+        mod_code = compile(mod_code, code_path, 'exec')
+
     #/ 3plQeic
     exec_(mod_code, mod_obj.__dict__, mod_obj.__dict__)
 
@@ -329,6 +338,7 @@ def import_module_by_path(mod_path, mod_name, sys_add=True, sys_use=True):
         mod_name=mod_name,
         sys_use=sys_use,
         sys_add=sys_add,
+        code_path=mod_path,
     )
     ## raise error
 
@@ -0,0 +1,80 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import sys
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+
+#
+def insert_factory(uri, query, args, cmd_args):
+    """
+    Output factory that inserts rows with SQLAlchemy's async engine, keeping
+    several batches in flight while the main loop keeps producing.
+
+    Requires Python 3 and SQLAlchemy 1.4+, with an asyncio driver in the URI,
+    e.g. "postgresql+asyncpg://...", "mysql+aiomysql://..." or
+    "sqlite+aiosqlite:///...".
+
+    An event loop runs in a background thread. The output function hands a
+    copy of the batch to the loop and returns right away, unless the
+    in-flight window is full, in which case it waits for a batch to finish.
+    Each batch is inserted with "executemany" in its own transaction.
+
+    A failed batch is reported by the next output function call or on
+    context exit, not by the call that handed it off, so checkpoint and
+    reject file are not supported.
+
+    Output arguments:
+    - table: Table name.
+    - schema: Schema name.
+    - columns: Comma-separated column names.
+    - window: Maximum number of batches in flight. Default is 4.
+    - pool_size: Connection pool size. Default is the window.
+    - ordered: If true, batches commit in the order they are handed off, and
+      a batch after a failed batch is rolled back, so that committed rows are
+      always a prefix of the input. Default is false.
+
+    Requires the "async" extra: "pip install AoikPourTable[async]". The
+    implementation is in "async_db_io_py3", because its syntax can not be
+    compiled by Python 2.
+
+    @param uri: Output URI.
+
+    @param query: Output query.
+
+    @param args: Output arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: An insert function context object.
+    """
+    # If Python 2
+    if IS_PY2:
+        # Raise exception
+        raise ValueError('Async output requires Python 3.')
+
+    try:
+        # Import here because it is needed only for async output.
+        # This saves startup time.
+        import sqlalchemy.ext.asyncio  # noqa: F401
+    except ImportError:
+        # Get SQLAlchemy version
+        import sqlalchemy
+
+        # Raise exception
+        raise ValueError((
+            'Async output requires SQLAlchemy 1.4+ with an asyncio driver,'
+            ' but SQLAlchemy is {}. Install with'
+            ' "pip install AoikPourTable[async]".').format(
+                sqlalchemy.__version__))
+
+    # Import here because it uses Python 3 syntax.
+    # This saves startup time.
+    from .async_db_io_py3 import insert_factory as py3_insert_factory
+
+    # Return insert function context object
+    return py3_insert_factory(uri, query, args, cmd_args)
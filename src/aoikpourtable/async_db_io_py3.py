@@ -0,0 +1,325 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime
+import threading
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .db_io import check_unknown_args
+from .db_io import make_table
+from .print_util import print_stderr
+from .uri_util import uri_query_to_args
+
+
+#
+def insert_factory(uri, query, args, cmd_args):
+    """
+    Implementation of "async_db_io.insert_factory". See there for output
+    arguments.
+
+    This module uses Python 3 syntax, so it is imported only after
+    "async_db_io.insert_factory" has checked the requirements.
+
+    @param uri: Output URI.
+
+    @param query: Output query.
+
+    @param args: Output arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: An insert function context object.
+    """
+    # Print message
+    print_stderr('{:20}{}'.format('Output:', uri))
+
+    # If checkpoint is used
+    if cmd_args.get('checkpoint_file_path', None):
+        # Raise exception, because a batch is not committed yet when the
+        # output function returns
+        raise ValueError('Async output does not support checkpoint.')
+
+    # If reject file is used
+    if cmd_args.get('reject_file_path', None):
+        # Raise exception, because a failed batch is reported after its
+        # output function call returns, so it can not be bisected
+        raise ValueError('Async output does not support reject file.')
+
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get schema name
+    schema_name = args_dict.pop('schema', None)
+
+    # Get table name
+    table_name = args_dict.pop('table', None)
+
+    # If table name is not specified
+    if not table_name:
+        # Raise exception
+        raise ValueError(
+            '"table" argument is not specified in output arguments: {}'
+            .format(args))
+
+    # Get columns argument
+    dst_columns_text = args_dict.pop('columns', None)
+
+    # If columns argument is not specified
+    if not dst_columns_text:
+        # Raise exception
+        raise ValueError(
+            '"columns" argument is not specified in output arguments: {}'
+            .format(args))
+
+    # Split columns argument into column names
+    dst_column_name_s = dst_columns_text.split(',')
+
+    # Get in-flight window
+    window = int(args_dict.pop('window', '4'))
+
+    # Get pool size
+    pool_size = int(args_dict.pop('pool_size', window))
+
+    # Get ordered commit flag
+    is_ordered = args_dict.pop('ordered', '0') not in ('', '0', 'false')
+
+    # Ensure all arguments are known
+    check_unknown_args(args_dict, args, 'output')
+
+    # If window is not valid
+    if window <= 0 or pool_size <= 0:
+        # Raise exception
+        raise ValueError(
+            '"window" and "pool_size" arguments must be greater than 0: {}'
+            .format(args))
+
+    # Get table object
+    table = make_table(
+        table_name=table_name,
+        column_name_s=dst_column_name_s,
+        schema_name=schema_name,
+    )
+
+    # Get statement object
+    insert_obj = table.insert()
+
+    # Print message
+    print_stderr('{:20}{}'.format('Schema:', schema_name))
+
+    print_stderr('{:20}{}'.format('Table:', table_name))
+
+    print_stderr('{:20}{}'.format('Statement:', insert_obj))
+
+    print_stderr('{:20}{} batch{} in flight, pool size {}{}'.format(
+        'Async:',
+        window,
+        '' if window <= 1 else 'es',
+        pool_size,
+        ', ordered commit' if is_ordered else ''))
+
+    # Create event loop
+    loop = asyncio.new_event_loop()
+
+    # Create event loop thread
+    loop_thread = threading.Thread(target=loop.run_forever)
+
+    # Do not keep the process alive if the main thread exits abnormally
+    loop_thread.daemon = True
+
+    # Start event loop thread
+    loop_thread.start()
+
+    # Get engine options.
+    # SQLite uses a pool class that does not take pool size.
+    if uri.startswith('sqlite'):
+        engine_kwargs = {}
+    else:
+        engine_kwargs = {
+            'pool_size': pool_size,
+            'max_overflow': 0,
+        }
+
+    # Create coroutine that creates engine in the event loop
+    async def create_engine_coro():
+        return create_async_engine(uri, **engine_kwargs)
+
+    # Create engine
+    engine = asyncio.run_coroutine_threadsafe(
+        create_engine_coro(), loop).result()
+
+    # Whether to wait for the previous batch before executing, or only
+    # before committing, for ordered commit. SQLite allows one writer at a
+    # time, so a batch holding the write lock while waiting for the previous
+    # batch would deadlock. Other databases execute batches concurrently.
+    wait_before_execute = is_ordered and engine.dialect.name == 'sqlite'
+
+    wait_before_commit = is_ordered and not wait_before_execute
+
+    # Semaphore that bounds the number of batches in flight.
+    # It is acquired by the main thread so that the main loop waits when the
+    # window is full.
+    window_semaphore = threading.BoundedSemaphore(window)
+
+    # Async state dict.
+    # Use a dict so that the functions below can update it.
+    state = {
+        # Futures of batches in flight, in hand-off order
+        'futures': [],
+        # The first exception raised by a batch
+        'exc': None,
+        # Future of the last batch, awaited by the next batch for ordered
+        # commit. Only accessed in the event loop thread.
+        'tail': None,
+    }
+
+    # Create coroutine that inserts a batch
+    async def insert_coro(param_s):
+        # Get the previous batch's future, and set this batch's future as the
+        # tail. Coroutines start in hand-off order, so the chain follows the
+        # hand-off order.
+        prev_future = state['tail']
+
+        done_future = loop.create_future()
+
+        state['tail'] = done_future
+
+        try:
+            # Get a connection and begin transaction
+            async with engine.connect() as connec:
+                # Begin transaction
+                transac = await connec.begin()
+
+                try:
+                    # If the previous batch should finish before executing
+                    if wait_before_execute and prev_future is not None:
+                        # Wait for the previous batch to finish.
+                        # Raise its exception if it failed.
+                        await prev_future
+
+                    # Execute statement
+                    await connec.execute(insert_obj, param_s)
+
+                    # If the previous batch should finish before committing
+                    if wait_before_commit and prev_future is not None:
+                        # Wait for the previous batch to finish.
+                        # Raise its exception if it failed.
+                        await prev_future
+                except BaseException:
+                    # Roll back transaction
+                    await transac.rollback()
+
+                    # Raise the exception
+                    raise
+
+                # Commit transaction
+                await transac.commit()
+        except BaseException as exc:
+            # Set this batch's result
+            done_future.set_exception(exc)
+
+            # Mark the exception as retrieved, because the next batch may not
+            # wait for it
+            done_future.exception()
+
+            # Raise the exception
+            raise
+
+        # Set this batch's result
+        done_future.set_result(None)
+
+    # Create future callback
+    def future_done_callback(future):
+        # Release a window slot
+        window_semaphore.release()
+
+    # Create function that raises the first exception of finished batches
+    def raise_finished_exc():
+        # Futures of batches still in flight
+        future_s = []
+
+        # For each future
+        for future in state['futures']:
+            # If the batch is not finished
+            if not future.done():
+                # Keep it
+                future_s.append(future)
+
+            # If the batch failed and no exception is kept yet
+            elif future.exception() is not None and state['exc'] is None:
+                # Keep the exception
+                state['exc'] = future.exception()
+
+        # Update futures list
+        state['futures'] = future_s
+
+        # If a batch failed
+        if state['exc'] is not None:
+            # Raise the exception
+            raise state['exc']
+
+    # Create output function
+    def insert_func(rows):
+        # Raise exception of finished batches, if any
+        raise_finished_exc()
+
+        # Get parameters dict for each row.
+        # This copies the rows, because the caller may reuse the rows list.
+        param_s = [dict(zip(dst_column_name_s, row)) for row in rows]
+
+        # Wait for a window slot
+        window_semaphore.acquire()
+
+        # Hand off the batch to the event loop
+        future = asyncio.run_coroutine_threadsafe(insert_coro(param_s), loop)
+
+        # Release the window slot when the batch finishes
+        future.add_done_callback(future_done_callback)
+
+        # Add to futures list
+        state['futures'].append(future)
+
+    # Create context factory
+    @contextmanager
+    def output_context_factory():
+        try:
+            # Yield insert function
+            yield insert_func
+        finally:
+            # Get starting time
+            drain_start_time = datetime.utcnow()
+
+            # For each future
+            for future in state['futures']:
+                # Wait for the batch to finish, ignoring exception here
+                try:
+                    future.result()
+                except BaseException:
+                    pass
+
+            # Print message
+            print_stderr('{:20}{:.3f}s'.format(
+                'Drain:',
+                (datetime.utcnow() - drain_start_time).total_seconds()))
+
+            # Close connection pool
+            asyncio.run_coroutine_threadsafe(
+                engine.dispose(), loop).result()
+
+            # Stop event loop
+            loop.call_soon_threadsafe(loop.stop)
+
+            # Wait for event loop thread to exit
+            loop_thread.join()
+
+            # Close event loop
+            loop.close()
+
+        # Raise exception of finished batches, if any
+        raise_finished_exc()
+
+    # Return context object
+    return output_context_factory()
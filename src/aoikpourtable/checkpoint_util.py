@@ -0,0 +1,87 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import json
+import os
+import sys
+
+
+#
+def checkpoint_read(checkpoint_file_path):
+    """
+    Read checkpoint info dict from checkpoint file.
+
+    @param checkpoint_file_path: Checkpoint file path.
+
+    @return: Checkpoint info dict, or None if the checkpoint file not exists.
+    Checkpoint info dict is in the format:
+    {
+        'ordinal': ...,
+        'position': ...,
+        'input_uri': ...,
+        'output_uri': ...,
+    }
+    "ordinal" is the last committed row ordinal, one-based.
+    "position" is the input-specific position after the last committed row,
+    e.g. a byte offset. None if the input does not support positions.
+    """
+    # If checkpoint file not exists
+    if not os.path.isfile(checkpoint_file_path):
+        # Return None
+        return None
+
+    # Open checkpoint file
+    with open(checkpoint_file_path, mode='r') as checkpoint_file:
+        # Read checkpoint info dict
+        checkpoint_info = json.load(checkpoint_file)
+
+    # Return checkpoint info dict
+    return checkpoint_info
+
+
+#
+def checkpoint_write(checkpoint_file_path, checkpoint_info):
+    """
+    Write checkpoint info dict to checkpoint file atomically.
+
+    The info dict is first written to a temporary file, which is then renamed
+    to the checkpoint file. This way the checkpoint file always contains a
+    complete checkpoint, even if the program dies during writing.
+
+    @param checkpoint_file_path: Checkpoint file path.
+
+    @param checkpoint_info: Checkpoint info dict. See "checkpoint_read".
+
+    @return: None.
+    """
+    # Get temporary file path
+    temp_file_path = checkpoint_file_path + '.tmp'
+
+    # Open temporary file
+    with open(temp_file_path, mode='w') as temp_file:
+        # Write checkpoint info dict
+        json.dump(checkpoint_info, temp_file, sort_keys=True)
+
+        # Flush Python buffer
+        temp_file.flush()
+
+        # Flush OS buffer
+        os.fsync(temp_file.fileno())
+
+    # If "os.replace" is available, i.e. Python 3.3+
+    if hasattr(os, 'replace'):
+        # Rename temporary file to checkpoint file atomically
+        os.replace(temp_file_path, checkpoint_file_path)
+
+    # If "os.replace" is not available
+    else:
+        # If the platform is Windows
+        if sys.platform.startswith('win') \
+                and os.path.exists(checkpoint_file_path):
+            # Remove checkpoint file because "os.rename" on Windows does not
+            # override existing file
+            os.remove(checkpoint_file_path)
+
+        # Rename temporary file to checkpoint file
+        os.rename(temp_file_path, checkpoint_file_path)
@@ -2,7 +2,9 @@
 #
 from __future__ import absolute_import
 
+import codecs
 import csv
+import os
 import sys
 
 from .print_util import print_stderr
@@ -13,6 +15,13 @@ from .uri_util import uri_query_to_args
 IS_PY2 = (sys.version_info[0] == 2)
 
 
+#
+if IS_PY2:
+    from cStringIO import StringIO
+else:
+    from io import StringIO
+
+
 # Map quoting mode names to int values
 _quoting_map = {
     'QUOTE_ALL': csv.QUOTE_ALL,
@@ -22,11 +31,148 @@ _quoting_map = {
 }
 
 
+#
+def get_binary_format(
+        encoding, lineterminator, delimiter, quotechar, quoting):
+    """
+    Get binary format descriptor of CSV options, used to decide whether raw
+    records can be passed from input to output as is.
+
+    The descriptor compares arguments, not the bytes in the file. Records are
+    copied byte for byte, so the output keeps the input's actual quoting and
+    line ends, e.g. CRLF line ends and minimal quoting.
+
+    @param encoding: Encoding.
+
+    @param lineterminator: Line terminator.
+
+    @param delimiter: Delimiter.
+
+    @param quotechar: Quote character.
+
+    @param quoting: Quoting mode name.
+
+    @return: Binary format descriptor, a tuple.
+    """
+    # Return binary format descriptor.
+    # Normalize encoding name so that e.g. "UTF8" equals "utf-8".
+    return (
+        'csv',
+        codecs.lookup(encoding).name,
+        lineterminator,
+        delimiter,
+        quotechar,
+        quoting,
+    )
+
+
+#
+def csv_record_generator(input_file, quotechar, position_info):
+    """
+    Generator that yields raw CSV records as bytes, without parsing fields.
+
+    A record ends at a line end outside quotes. Quotes are counted per
+    record, so a quoted field that contains line ends spans multiple lines.
+    Escaped quotes are doubled so they do not change the parity.
+
+    @param input_file: Input file object opened in binary mode.
+
+    @param quotechar: Quote character. None means quotes are not special, e.g.
+    with "QUOTE_NONE", so every line end ends a record.
+
+    @param position_info: Position info dict. Its "position" value is
+    updated to the byte offset after each yielded record.
+
+    @return: A generator.
+    """
+    # Get quote character bytes. None if quotes are not special.
+    quote_bytes = None if quotechar is None else quotechar.encode('ascii')
+
+    # Get function that reads a block of lines
+    readlines = input_file.readlines
+
+    # Lines of a record that is not finished yet
+    pending_line_s = []
+
+    # Number of quotes in the pending lines
+    pending_quote_count = 0
+
+    # Get position
+    position = position_info['position']
+
+    # Repeat
+    while True:
+        # Read a block of lines
+        line_s = readlines(1 << 20)
+
+        # If end of file
+        if not line_s:
+            # Stop
+            break
+
+        # For each line
+        for line in line_s:
+            # If no record is pending and the line has no quote
+            if not pending_line_s \
+                    and (quote_bytes is None or quote_bytes not in line):
+                # Add line length to position
+                position += len(line)
+
+                position_info['position'] = position
+
+                # Yield the line as a record
+                yield line
+
+                # Go to next line
+                continue
+
+            # Add the line to pending lines
+            pending_line_s.append(line)
+
+            # Add number of quotes
+            pending_quote_count += line.count(quote_bytes)
+
+            # If quotes are not balanced, the record continues on next line
+            if pending_quote_count % 2:
+                # Go to next line
+                continue
+
+            # Get the record
+            record = b''.join(pending_line_s)
+
+            # Reset pending state
+            pending_line_s = []
+
+            pending_quote_count = 0
+
+            # Add record length to position
+            position += len(record)
+
+            position_info['position'] = position
+
+            # Yield the record
+            yield record
+
+    # If a record is pending at end of file, e.g. unbalanced quotes
+    if pending_line_s:
+        # Get the record
+        record = b''.join(pending_line_s)
+
+        # Add record length to position
+        position_info['position'] = position + len(record)
+
+        # Yield the record as is
+        yield record
+
+
 #
 def csv_input_factory(uri, query, args, cmd_args):
     """
     Input factory that produces a CSV reader.
 
+    If binary transport is used, the input object yields raw records as
+    bytes instead of parsed rows.
+
     @param uri: Input URI.
 
     @param query: Input query.
@@ -35,7 +181,8 @@ def csv_input_factory(uri, query, args, cmd_args):
 
     @param cmd_args: Command arguments dict.
 
-    @return: A CSV reader.
+    @return: A CSV reader, or a factory info dict if checkpoint, resume or
+    binary transport is used.
     """
     # Print message
     print_stderr('{:20}{}'.format('Input:', uri))
@@ -76,22 +223,124 @@ def csv_input_factory(uri, query, args, cmd_args):
     # Get quoting mode int
     quoting_int = _quoting_map[quoting]
 
-    # Open input file
-    if IS_PY2:
-        input_file = open(uri, mode='r')
+    # Get position to resume from
+    resume_position = cmd_args.get('resume_position', None)
+
+    # Whether to yield raw records instead of parsed rows
+    is_binary = cmd_args.get('binary_transport', False)
+
+    # If binary transport is used and escape character is given
+    if is_binary and 'escapechar' in args_dict:
+        # Raise exception, because an escaped quote or line end can not be
+        # told apart without parsing fields
+        raise ValueError(
+            '"escapechar" can not be used with binary transport.')
+
+    # If checkpoint, resume and binary transport are not used
+    if not cmd_args.get('checkpoint_file_path', None) \
+            and resume_position is None and not is_binary:
+        # Open input file
+        if IS_PY2:
+            input_file = open(uri, mode='r')
+        else:
+            input_file = open(uri, mode='r', encoding=encoding)
+
+        # Get CSV reader
+        csv_reader = csv.reader(
+            input_file,
+            lineterminator=lineterminator,
+            delimiter=delimiter,
+            quotechar=quotechar,
+            quoting=quoting_int)
+
+        # Return CSV reader
+        return csv_reader
+
+    # If the encoding does not encode newline and quote as single ASCII bytes,
+    # e.g. "utf-16". Lines are split and quotes are counted on raw bytes, which
+    # would break multibyte characters of such encodings.
+    if '\n"'.encode(encoding) != b'\n"':
+        # Raise exception
+        raise ValueError((
+            'Encoding "{}" can not be used with checkpoint, resume or binary'
+            ' transport, because it is not ASCII-compatible.').format(
+                encoding))
+
+    # Open input file in binary mode so that byte offset can be tracked
+    input_file = open(uri, mode='rb')
+
+    # Position info dict.
+    # Use a dict so that the generator below can update it.
+    position_info = {
+        'position': 0,
+    }
+
+    # If position to resume from is given
+    if resume_position is not None:
+        # Seek to the position
+        input_file.seek(resume_position)
+
+        # Set position
+        position_info['position'] = resume_position
+
+    # If binary transport is used
+    if is_binary:
+        # Get raw record generator.
+        # With "QUOTE_NONE", quotes are ordinary characters, so they must not
+        # be counted to find record ends.
+        input_obj = csv_record_generator(
+            input_file,
+            None if quoting_int == csv.QUOTE_NONE else quotechar,
+            position_info)
+
+    # If binary transport is not used
     else:
-        input_file = open(uri, mode='r', encoding=encoding)
-
-    # Get CSV reader
-    csv_reader = csv.reader(
-        input_file,
-        lineterminator=lineterminator,
-        delimiter=delimiter,
-        quotechar=quotechar,
-        quoting=quoting_int)
-
-    # Return CSV reader
-    return csv_reader
+        # Create generator factory
+        def line_generator_factory():
+            # For each line
+            for line in input_file:
+                # Add line length to position.
+                # The CSV reader reads lines only when it needs them, so after
+                # a row is yielded the position is right after the row.
+                position_info['position'] += len(line)
+
+                # Yield the line
+                if IS_PY2:
+                    yield line
+                else:
+                    yield line.decode(encoding)
+
+        # Get CSV reader
+        input_obj = csv.reader(
+            line_generator_factory(),
+            lineterminator=lineterminator,
+            delimiter=delimiter,
+            quotechar=quotechar,
+            quoting=quoting_int)
+
+    # Create position function
+    def position_func():
+        return position_info['position']
+
+    # Get factory info dict
+    factory_info = {
+        'input_obj': input_obj,
+        'position_func': position_func,
+    }
+
+    # If binary transport is used
+    if is_binary:
+        # Tell program framework the format of raw records
+        factory_info['binary_format'] = get_binary_format(
+            encoding, lineterminator, delimiter, quotechar, quoting)
+
+    # If position to resume from is given
+    if resume_position is not None:
+        # The first row is the starting row
+        factory_info['first_row_ordinal'] = cmd_args['start_row_ordinal']
+
+    # Return factory info dict
+    return factory_info
 
 
 #
@@ -107,7 +356,8 @@ def csv_output_factory(uri, query, args, cmd_args):
 
     @param cmd_args: Command arguments dict.
 
-    @return: An output function that writes to a file.
+    @return: An output function that writes to a file, or a factory info
+    dict if binary transport is used.
     """
     # Print message
     print_stderr('{:20}{}'.format('Output', uri))
@@ -148,15 +398,56 @@ def csv_output_factory(uri, query, args, cmd_args):
     # Get quoting mode int
     quoting_int = _quoting_map[quoting]
 
+    # Get open mode.
+    # Append to the output file when resuming from a checkpoint.
+    open_mode = 'a' if cmd_args.get('is_resume', False) else 'w'
+
+    # Whether to flush each batch to disk.
+    # This is needed when checkpoint is used, because the checkpoint records a
+    # batch as committed once the output function returns.
+    need_sync = bool(cmd_args.get('checkpoint_file_path', None))
+
+    # If binary transport is used
+    if cmd_args.get('binary_transport', False):
+        # Open output file in binary mode
+        output_file = open(uri, mode=open_mode + 'b')
+
+        # Create output function that writes raw records as is
+        def binary_output_func(rows):
+            # Write the batch's records in one call
+            output_file.write(b''.join(rows))
+
+            # If need to flush each batch to disk
+            if need_sync:
+                # Flush Python buffer
+                output_file.flush()
+
+                # Flush OS buffer
+                os.fsync(output_file.fileno())
+
+        # Return factory info dict
+        return {
+            'output_obj': binary_output_func,
+            # Tell program framework the format of raw records
+            'binary_format': get_binary_format(
+                encoding, lineterminator, delimiter, quotechar, quoting),
+        }
+
     # Open output file
     if IS_PY2:
-        output_file = open(uri, mode='w')
+        output_file = open(uri, mode=open_mode)
     else:
-        output_file = open(uri, mode='w', encoding=encoding)
+        output_file = open(uri, mode=open_mode, encoding=encoding)
+
+    # Create buffer.
+    # Rows of one batch are formatted into the buffer first, then written to
+    # the output file in one call. This way a row that fails formatting does
+    # not leave a partially written batch in the output file.
+    buffer_file = StringIO()
 
     # Get CSV writer
     csv_writer = csv.writer(
-        output_file,
+        buffer_file,
         lineterminator=lineterminator,
         delimiter=delimiter,
         quotechar=quotechar,
@@ -164,7 +455,24 @@ def csv_output_factory(uri, query, args, cmd_args):
 
     # Create output function
     def output_func(rows):
+        # Empty the buffer
+        buffer_file.seek(0)
+
+        buffer_file.truncate()
+
+        # Format rows into the buffer
         csv_writer.writerows(rows)
 
+        # Write the buffer to output file
+        output_file.write(buffer_file.getvalue())
+
+        # If need to flush each batch to disk
+        if need_sync:
+            # Flush Python buffer
+            output_file.flush()
+
+            # Flush OS buffer
+            os.fsync(output_file.fileno())
+
     # Return output function
     return output_func
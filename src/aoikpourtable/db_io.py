@@ -3,25 +3,77 @@
 from __future__ import absolute_import
 
 from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
 import itertools
+import re
+import sys
 
+from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import column
 from sqlalchemy import create_engine
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import inspect
+from sqlalchemy import Integer
+from sqlalchemy import Interval
 from sqlalchemy import MetaData
+from sqlalchemy import Numeric
+from sqlalchemy import select
 from sqlalchemy import String
 from sqlalchemy import Table
 from sqlalchemy import text
+from sqlalchemy import Time
 
 from .print_util import print_stderr
 from .uri_util import uri_query_to_args
 
 
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    _STR_TYPES = (str, unicode)  # noqa: F821
+else:
+    _STR_TYPES = (str,)
+
+
+# Engine options that can be given in arguments.
+# Map argument name to value parse function.
+_ENGINE_OPTION_PARSERS = {
+    'pool_size': int,
+    'max_overflow': int,
+    'pool_timeout': float,
+    'pool_recycle': int,
+    'pool_pre_ping': lambda x: x.lower() in ('1', 'true', 'yes'),
+    'isolation_level': str,
+    'executemany_mode': str,
+}
+
+# Prefix of arguments that are passed to the driver's connect function
+_CONNECT_ARG_PREFIX = 'connect_args.'
+
+# Cache of engines.
+# Map tuple of (URI, engine options) to engine object.
+_ENGINE_CACHE = {}
+
+# Cache of reflected columns.
+# Map tuple of (URI, schema name, table name) to list of (column name, column
+# type).
+_REFLECT_CACHE = {}
+
+
 #
 def make_table(
         table_name,
         column_name_s,
         schema_name=None,
-        metadata=None):
+        metadata=None,
+        column_type_map=None):
     """
     Make a SQLAlchemy Table object.
 
@@ -33,6 +85,9 @@ def make_table(
 
     @param metadata: Metadata object.
 
+    @param column_type_map: A dict that maps column name to column type.
+    Columns not in the dict use "String". None means all columns use "String".
+
     @return: Table object.
     """
     # If metadata object is not given
@@ -40,13 +95,24 @@ def make_table(
         # Create one
         metadata = MetaData()
 
+    # If column type map is not given
+    if column_type_map is None:
+        # Use empty map
+        column_type_map = {}
+
     # Create "Table" object
     table = Table(table_name, metadata, schema=schema_name)
 
     # For each column name
     for column_name in column_name_s:
+        # Get column type
+        column_type = column_type_map.get(column_name, None)
+
         # Create "Column" object
-        column = Column(column_name, String(), nullable=True)
+        column = Column(
+            column_name,
+            String() if column_type is None else column_type,
+            nullable=True)
 
         # Add "Column" object to "Table" object
         table.append_column(column)
@@ -55,6 +121,807 @@ def make_table(
     return table
 
 
+#
+def get_engine(uri, args_dict):
+    """
+    Get engine, creating it with engine options given in arguments.
+
+    Engine options are popped from the arguments dict. See
+    "_ENGINE_OPTION_PARSERS" for supported options. Arguments prefixed with
+    "connect_args." are passed to the driver's connect function, e.g.
+    "connect_args.connect_timeout=10". Values that are digits are passed as
+    int, others as string.
+
+    Engines are cached by URI and engine options, so input and output that
+    use the same database URI and options share one engine and its
+    connection pool.
+
+    @param uri: Database URI.
+
+    @param args_dict: Arguments dict.
+
+    @return: Engine object.
+    """
+    # Engine options dict
+    engine_kwargs = {}
+
+    # Driver connect arguments dict
+    connect_args = {}
+
+    # For each argument name
+    for arg_name in list(args_dict.keys()):
+        # Get value parse function
+        parse_func = _ENGINE_OPTION_PARSERS.get(arg_name, None)
+
+        # If the argument is an engine option
+        if parse_func is not None:
+            # Add engine option
+            engine_kwargs[arg_name] = parse_func(args_dict.pop(arg_name))
+
+        # If the argument is a driver connect argument
+        elif arg_name.startswith(_CONNECT_ARG_PREFIX):
+            # Get value
+            value = args_dict.pop(arg_name)
+
+            # Add driver connect argument
+            connect_args[arg_name[len(_CONNECT_ARG_PREFIX):]] = \
+                int(value) if value.isdigit() else value
+
+    # Get cache key
+    cache_key = (
+        uri,
+        tuple(sorted(engine_kwargs.items())),
+        tuple(sorted(connect_args.items())),
+    )
+
+    # If the database is SQLite and the driver's same-thread check is not
+    # configured
+    if uri.startswith('sqlite') and 'check_same_thread' not in connect_args:
+        # Allow a connection to be used by a thread other than the one that
+        # created it, e.g. a fan-out output worker or a job runner thread.
+        # A connection is still used by one thread at a time.
+        connect_args['check_same_thread'] = False
+
+    # If driver connect arguments are given
+    if connect_args:
+        # Add to engine options
+        engine_kwargs['connect_args'] = connect_args
+
+    # Get cached engine
+    engine = _ENGINE_CACHE.get(cache_key, None)
+
+    # If engine is cached
+    if engine is not None:
+        # Print message
+        print_stderr('{:20}{}'.format('Engine:', 'shared'))
+
+        # Return cached engine
+        return engine
+
+    # If engine options are given
+    if engine_kwargs:
+        # Print message
+        print_stderr('{:20}{}'.format('Engine:', ', '.join(
+            '{}={}'.format(key, engine_kwargs[key])
+            for key in sorted(engine_kwargs.keys()))))
+
+    # Create engine
+    engine = create_engine(uri, **engine_kwargs)
+
+    # Add to cache
+    _ENGINE_CACHE[cache_key] = engine
+
+    # Return engine
+    return engine
+
+
+#
+def check_unknown_args(args_dict, args, kind):
+    """
+    Raise exception if there are arguments not popped by the factory.
+
+    @param args_dict: Arguments dict.
+
+    @param args: Arguments string, for error message.
+
+    @param kind: "input" or "output", for error message.
+
+    @return: None.
+    """
+    # If there are unknown arguments
+    if args_dict:
+        # Raise exception
+        raise ValueError('Unknown argument in {} arguments: {}: {}'.format(
+            kind, ', '.join(sorted(args_dict.keys())), args))
+
+
+#
+def reflect_columns(engine, uri, schema_name, table_name):
+    """
+    Reflect columns of a table from database, with result cached so that each
+    table is reflected only once per process.
+
+    @param engine: Engine object.
+
+    @param uri: Database URI, used as cache key.
+
+    @param schema_name: Schema name.
+
+    @param table_name: Table name.
+
+    @return: List of (column name, column type), in table order.
+    """
+    # Get cache key
+    cache_key = (uri, schema_name, table_name)
+
+    # Get cached columns
+    column_info_s = _REFLECT_CACHE.get(cache_key, None)
+
+    # If columns are cached
+    if column_info_s is not None:
+        # Return cached columns
+        return column_info_s
+
+    # Reflect columns
+    column_info_s = [
+        (column_dict['name'], column_dict['type'])
+        for column_dict in inspect(engine).get_columns(
+            table_name, schema=schema_name)
+    ]
+
+    # If the table does not exist
+    if not column_info_s:
+        # Raise exception
+        raise ValueError('Table not found: {}'.format(table_name))
+
+    # Add to cache
+    _REFLECT_CACHE[cache_key] = column_info_s
+
+    # Return columns
+    return column_info_s
+
+
+#
+def get_table_columns(
+        engine, uri, args_dict, args, schema_name, table_name, kind):
+    """
+    Get column names and column types from arguments.
+
+    If "reflect" argument is true, column types are reflected from database,
+    and "columns" argument is optional, defaulting to all columns of the
+    table. Otherwise "columns" argument is required and all columns use
+    "String".
+
+    @param engine: Engine object.
+
+    @param uri: Database URI.
+
+    @param args_dict: Arguments dict.
+
+    @param args: Arguments string, for error message.
+
+    @param schema_name: Schema name.
+
+    @param table_name: Table name.
+
+    @param kind: "input" or "output", for error message.
+
+    @return: A tuple of 2 elements: (column names list, column type map).
+    Column type map is None if not reflected.
+    """
+    # Get reflect argument
+    need_reflect = args_dict.pop('reflect', '0') not in ('', '0', 'false')
+
+    # Get columns argument
+    dst_columns_text = args_dict.pop('columns', None)
+
+    # If not reflect
+    if not need_reflect:
+        # If columns argument is not specified
+        if not dst_columns_text:
+            # Raise exception
+            raise ValueError(
+                '"columns" argument is not specified in {} arguments: {}'
+                .format(kind, args))
+
+        # Return column names list, with no column type map
+        return dst_columns_text.split(','), None
+
+    # Reflect columns
+    column_info_s = reflect_columns(engine, uri, schema_name, table_name)
+
+    # Get column type map
+    column_type_map = dict(column_info_s)
+
+    # If columns argument is specified
+    if dst_columns_text:
+        # Split columns argument into column names
+        dst_column_name_s = dst_columns_text.split(',')
+
+        # For each column name
+        for column_name in dst_column_name_s:
+            # If the column is not in the table
+            if column_name not in column_type_map:
+                # Raise exception
+                raise ValueError('Column not found in table {}: {}'.format(
+                    table_name, column_name))
+    else:
+        # Use all columns of the table
+        dst_column_name_s = [x[0] for x in column_info_s]
+
+    # Print message
+    print_stderr('{:20}{}'.format('Reflect:', ', '.join(
+        '{} {}'.format(column_name, column_type_map[column_name])
+        for column_name in dst_column_name_s)))
+
+    # Return the tuple
+    return dst_column_name_s, column_type_map
+
+
+#
+def get_order_by_columns(args_dict):
+    """
+    Get "ORDER BY" columns from "order_by" argument.
+
+    @param args_dict: Arguments dict.
+
+    @return: List of column objects, empty if not specified.
+    """
+    # Get order-by argument
+    order_by_text = args_dict.pop('order_by', None)
+
+    # If order-by argument is not specified
+    if not order_by_text:
+        # Return empty list
+        return []
+
+    # Return column objects list
+    return [column(x) for x in order_by_text.split(',')]
+
+
+#
+def get_coerce_func(column_type):
+    """
+    Get function that coerces a string value to the column type's Python
+    value, so that the value is bound with the column type.
+
+    @param column_type: Column type object.
+
+    @return: Coerce function, or None if string values are bound as is.
+    """
+    # If the column type is integer
+    if isinstance(column_type, Integer):
+        # Use int
+        return int
+
+    # If the column type is float. Check before "Numeric" because "Float" is
+    # a subclass of it.
+    if isinstance(column_type, Float):
+        # Use float
+        return float
+
+    # If the column type is numeric
+    if isinstance(column_type, Numeric):
+        # Use Decimal
+        return Decimal
+
+    # Bind as is
+    return None
+
+
+#
+def make_coerce_rows_func(table):
+    """
+    Make function that coerces string values in rows to Python values of the
+    columns' types. Empty strings are coerced to None for these columns.
+
+    @param table: Table object.
+
+    @return: Function that takes a rows list and returns a rows list, or None
+    if no column needs coercing.
+    """
+    # Get coerce functions list, one for each column
+    coerce_func_s = [get_coerce_func(column.type) for column in table.columns]
+
+    # If no column needs coercing
+    if not any(coerce_func_s):
+        # Return None
+        return None
+
+    # Get coerce function and column index pairs
+    index_func_s = [
+        (index, func) for index, func in enumerate(coerce_func_s) if func]
+
+    # Create coerce function
+    def coerce_rows_func(rows):
+        # New rows list
+        new_row_s = []
+
+        # For each row
+        for row in rows:
+            # Copy the row
+            row = list(row)
+
+            # For each column that needs coercing
+            for index, func in index_func_s:
+                # Get value
+                value = row[index]
+
+                # If the value is a string
+                if isinstance(value, _STR_TYPES):
+                    # Coerce the value. Empty string means null.
+                    row[index] = func(value) if value else None
+
+            # Add the row
+            new_row_s.append(row)
+
+        # Return new rows list
+        return new_row_s
+
+    # Return coerce function
+    return coerce_rows_func
+
+
+#
+def make_upsert_obj(dialect, table, key_column_name_s):
+    """
+    Make upsert statement object for the dialect. Rows whose key columns
+    conflict with existing rows update the other columns of the existing
+    rows.
+
+    @param dialect: Dialect object.
+
+    @param table: Table object.
+
+    @param key_column_name_s: Key column names list. The key columns must
+    have a unique constraint or primary key.
+
+    @return: A tuple of 2 elements: (statement object, parameter names list).
+    Parameter names are in the table's column order, used to make a
+    parameters dict for each row.
+    """
+    # Get column names
+    column_name_s = [x.name for x in table.columns]
+
+    # For each key column name
+    for key_column_name in key_column_name_s:
+        # If the key column is not in the table
+        if key_column_name not in column_name_s:
+            # Raise exception
+            raise ValueError('Key column is not in columns: {}'.format(
+                key_column_name))
+
+    # Get names of columns to update
+    update_column_name_s = [
+        x for x in column_name_s if x not in key_column_name_s]
+
+    # Get dialect name
+    dialect_name = dialect.name
+
+    # If the dialect is PostgreSQL
+    if dialect_name == 'postgresql':
+        # Import here because it is needed only for PostgreSQL upsert, and
+        # needs SQLAlchemy 1.1 or later.
+        # This saves startup time.
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+        # Get "INSERT" statement object
+        stmt_obj = postgresql_insert(table)
+
+        # If there are columns to update
+        if update_column_name_s:
+            # Add "ON CONFLICT DO UPDATE"
+            stmt_obj = stmt_obj.on_conflict_do_update(
+                index_elements=key_column_name_s,
+                set_=dict(
+                    (x, stmt_obj.excluded[x]) for x in update_column_name_s))
+        else:
+            # Add "ON CONFLICT DO NOTHING"
+            stmt_obj = stmt_obj.on_conflict_do_nothing(
+                index_elements=key_column_name_s)
+
+        # Return the tuple
+        return stmt_obj, column_name_s
+
+    # If the dialect is MySQL
+    if dialect_name == 'mysql':
+        # Import here because it is needed only for MySQL upsert, and needs
+        # SQLAlchemy 1.2 or later.
+        # This saves startup time.
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        # Get "INSERT" statement object
+        stmt_obj = mysql_insert(table)
+
+        # Add "ON DUPLICATE KEY UPDATE".
+        # If all columns are key columns, update a key column to itself.
+        stmt_obj = stmt_obj.on_duplicate_key_update(dict(
+            (x, stmt_obj.inserted[x])
+            for x in update_column_name_s or key_column_name_s[:1]))
+
+        # Return the tuple
+        return stmt_obj, column_name_s
+
+    # If the dialect is SQLite
+    if dialect_name == 'sqlite':
+        # Get identifier quote function
+        quote = dialect.identifier_preparer.quote
+
+        # Get parameter names.
+        # Use generated names because column names may not be valid
+        # parameter names.
+        param_name_s = ['p{}'.format(x) for x in range(len(column_name_s))]
+
+        # Get "ON CONFLICT" action
+        if update_column_name_s:
+            action_text = 'DO UPDATE SET {}'.format(', '.join(
+                '{0} = excluded.{0}'.format(quote(x))
+                for x in update_column_name_s))
+        else:
+            action_text = 'DO NOTHING'
+
+        # Get statement text
+        stmt_text = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) {}'\
+            .format(
+                dialect.identifier_preparer.format_table(table),
+                ', '.join(quote(x) for x in column_name_s),
+                ', '.join(':' + x for x in param_name_s),
+                ', '.join(quote(x) for x in key_column_name_s),
+                action_text)
+
+        # Return the tuple
+        return text(stmt_text), param_name_s
+
+    # Raise exception
+    raise ValueError('Upsert is not supported for dialect: {}'.format(
+        dialect_name))
+
+
+#
+def swap_create_stage(connec, schema_name, table_name, stage_table_name):
+    """
+    Create a staging table like the target table, without secondary indexes.
+
+    The staging table is dropped first if it exists, e.g. left by a failed
+    run. The primary key is kept because not all dialects can add it after
+    load.
+
+    @param connec: Connection object.
+
+    @param schema_name: Schema name.
+
+    @param table_name: Target table name.
+
+    @param stage_table_name: Staging table name.
+
+    @return: A tuple of 2 elements: (target table object, staging table
+    object). The target table object is reflected with its indexes.
+    """
+    # Get MetaData object
+    metadata = MetaData()
+
+    # Reflect target table, with indexes
+    target_table = Table(
+        table_name,
+        metadata,
+        schema=schema_name,
+        autoload=True,
+        autoload_with=connec)
+
+    # Get staging table object, with copies of target table columns.
+    # Indexes are not copied.
+    stage_table = Table(
+        stage_table_name,
+        metadata,
+        *[x.copy() for x in target_table.columns],
+        schema=schema_name)
+
+    # If target table's primary key is named
+    if target_table.primary_key.name:
+        # Name staging table's primary key after it, so that the name can be
+        # restored after swap
+        stage_table.primary_key.name = \
+            target_table.primary_key.name + '__stage'
+
+    # Drop staging table if it exists
+    stage_table.drop(connec, checkfirst=True)
+
+    # Create staging table
+    stage_table.create(connec)
+
+    # Return the tuple
+    return target_table, stage_table
+
+
+#
+def swap_get_sequences(table):
+    """
+    Get sequences used by column defaults, e.g. of PostgreSQL "serial"
+    columns.
+
+    @param table: Table object, reflected.
+
+    @return: List of (column name, sequence name). Sequence name is as the
+    database quotes it in the default, e.g. "public.items_id_seq".
+    """
+    # Sequences list
+    sequence_s = []
+
+    # For each column
+    for column in table.columns:
+        # If the column has no server default
+        if column.server_default is None:
+            # Go to next column
+            continue
+
+        # Get default text
+        default_text = str(getattr(column.server_default, 'arg', ''))
+
+        # Match "nextval('seq_name'::regclass)"
+        match = re.match(
+            r"^\s*nextval\('((?:[^']|'')+)'(?:::regclass)?\)\s*$",
+            default_text)
+
+        # If the default uses a sequence
+        if match:
+            # Add to sequences list
+            sequence_s.append(
+                (column.name, match.group(1).replace("''", "'")))
+
+    # Return sequences list
+    return sequence_s
+
+
+#
+def swap_build_indexes(connec, target_table, stage_table):
+    """
+    Build target table's indexes on the staging table, after the staging
+    table is loaded.
+
+    For SQLite, index names are unique per database and indexes can not be
+    renamed, so indexes are built in "swap_tables" instead.
+
+    @param connec: Connection object.
+
+    @param target_table: Target table object, reflected with indexes.
+
+    @param stage_table: Staging table object.
+
+    @return: List of (staging index name, target index name).
+    """
+    # Get dialect name
+    dialect_name = connec.dialect.name
+
+    # Index names list
+    name_pair_s = []
+
+    # If the dialect is SQLite
+    if dialect_name == 'sqlite':
+        # Build indexes in "swap_tables"
+        return name_pair_s
+
+    # For each target table index, sorted by name so that the order is stable
+    for target_index in sorted(target_table.indexes, key=lambda x: x.name):
+        # Get staging index name.
+        # MySQL index names are unique per table so can be kept.
+        if dialect_name == 'mysql':
+            stage_index_name = target_index.name
+        else:
+            stage_index_name = target_index.name + '__stage'
+
+        # Get staging index object
+        stage_index = Index(
+            stage_index_name,
+            *[stage_table.c[x.name] for x in target_index.columns],
+            unique=target_index.unique)
+
+        # Get starting time
+        build_start_time = datetime.utcnow()
+
+        # Build the index
+        stage_index.create(connec)
+
+        # Print message
+        print_stderr('{:20}{}, {:.3f}s'.format(
+            'Index:',
+            target_index.name,
+            (datetime.utcnow() - build_start_time).total_seconds()))
+
+        # Add index names
+        name_pair_s.append((stage_index_name, target_index.name))
+
+    # Return index names list
+    return name_pair_s
+
+
+#
+def swap_tables(connec, target_table, stage_table, index_name_pair_s):
+    """
+    Swap the staging table into place of the target table atomically, and
+    drop the old target table.
+
+    @param connec: Connection object.
+
+    @param target_table: Target table object, reflected with indexes.
+
+    @param stage_table: Staging table object.
+
+    @param index_name_pair_s: List of (staging index name, target index name)
+    returned by "swap_build_indexes".
+
+    @return: None.
+    """
+    # Get dialect
+    dialect = connec.dialect
+
+    # Get identifier quote function
+    quote = dialect.identifier_preparer.quote
+
+    # Get quoted target table name
+    target_text = dialect.identifier_preparer.format_table(target_table)
+
+    # Get quoted staging table name
+    stage_text = dialect.identifier_preparer.format_table(stage_table)
+
+    # Get schema prefix of quoted names
+    schema_prefix = quote(target_table.schema) + '.' \
+        if target_table.schema else ''
+
+    # If the dialect is SQLite
+    if dialect.name == 'sqlite':
+        # Get statements that create target table's indexes, so that they
+        # are created exactly as before, e.g. partial indexes
+        index_sql_s = [
+            x[0] for x in connec.execute(
+                text(
+                    'SELECT sql FROM {}sqlite_master WHERE type = :type'
+                    ' AND tbl_name = :name AND sql IS NOT NULL'
+                    ' ORDER BY name'.format(schema_prefix)),
+                type='index',
+                name=target_table.name)
+        ]
+
+        # Get driver connection.
+        # The driver does not begin transaction before DDL statements, so
+        # use explicit "BEGIN" to make the swap atomic.
+        driver_connec = connec.connection
+
+        # Commit pending transaction
+        driver_connec.commit()
+
+        # Get driver isolation level
+        isolation_level = driver_connec.isolation_level
+
+        # Disable driver's implicit transaction handling
+        driver_connec.isolation_level = None
+
+        try:
+            # Get cursor
+            cursor = driver_connec.cursor()
+
+            # Begin transaction
+            cursor.execute('BEGIN')
+
+            try:
+                # Drop target table
+                cursor.execute('DROP TABLE {}'.format(target_text))
+
+                # Rename staging table to target table
+                cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+                    stage_text, quote(target_table.name)))
+
+                # For each index statement
+                for index_sql in index_sql_s:
+                    # Get starting time
+                    build_start_time = datetime.utcnow()
+
+                    # Create the index
+                    cursor.execute(index_sql)
+
+                    # Print message
+                    print_stderr('{:20}{}, {:.3f}s'.format(
+                        'Index:',
+                        index_sql,
+                        (datetime.utcnow() - build_start_time)
+                        .total_seconds()))
+            except Exception:
+                # Roll back transaction
+                cursor.execute('ROLLBACK')
+
+                # Raise the exception
+                raise
+
+            # Commit transaction
+            cursor.execute('COMMIT')
+        finally:
+            # Restore driver isolation level
+            driver_connec.isolation_level = isolation_level
+
+        # Return
+        return
+
+    # Get old target table name
+    old_table_name = target_table.name + '__old'
+
+    # Get quoted old target table name
+    old_text = schema_prefix + quote(old_table_name)
+
+    # If the dialect is MySQL
+    if dialect.name == 'mysql':
+        # Swap tables in one atomic statement
+        connec.execute(text('RENAME TABLE {} TO {}, {} TO {}'.format(
+            target_text, old_text, stage_text, target_text)))
+
+        # Drop old target table
+        connec.execute(text('DROP TABLE {}'.format(old_text)))
+
+        # Return
+        return
+
+    # If the dialect is PostgreSQL
+    if dialect.name == 'postgresql':
+        # Begin transaction.
+        # PostgreSQL DDL is transactional so the swap is atomic.
+        transac = connec.begin()
+
+        try:
+            # Rename target table to old table
+            connec.execute(text('ALTER TABLE {} RENAME TO {}'.format(
+                target_text, quote(old_table_name))))
+
+            # Rename staging table to target table
+            connec.execute(text('ALTER TABLE {} RENAME TO {}'.format(
+                stage_text, quote(target_table.name))))
+
+            # For each sequence used by column defaults.
+            # The staging table's columns copy the defaults, but a "serial"
+            # column's sequence is owned by the old table, so dropping the
+            # old table would fail on the dependent default. Give the
+            # sequence to the new table first.
+            for column_name, sequence_name in swap_get_sequences(
+                    target_table):
+                # Change the sequence's owner column
+                connec.execute(text(
+                    'ALTER SEQUENCE {} OWNED BY {}.{}'.format(
+                        sequence_name, target_text, quote(column_name))))
+
+            # Drop old table, which frees index and constraint names
+            connec.execute(text('DROP TABLE {}'.format(old_text)))
+
+            # For each index name pair
+            for stage_index_name, target_index_name in index_name_pair_s:
+                # Rename staging index to target index name
+                connec.execute(text('ALTER INDEX {}{} RENAME TO {}'.format(
+                    schema_prefix,
+                    quote(stage_index_name),
+                    quote(target_index_name))))
+
+            # If primary key is named
+            if stage_table.primary_key.name:
+                # Rename staging primary key to target primary key name
+                connec.execute(text(
+                    'ALTER TABLE {} RENAME CONSTRAINT {} TO {}'.format(
+                        target_text,
+                        quote(stage_table.primary_key.name),
+                        quote(target_table.primary_key.name))))
+        except Exception:
+            # Roll back transaction
+            transac.rollback()
+
+            # Raise the exception
+            raise
+
+        # Commit transaction
+        transac.commit()
+
+        # Return
+        return
+
+    # Raise exception
+    raise ValueError('Swap is not supported for dialect: {}'.format(
+        dialect.name))
+
+
 #
 def select_factory(uri, query, args, cmd_args):
     """
@@ -73,15 +940,18 @@ def select_factory(uri, query, args, cmd_args):
     # Print message
     print_stderr('{:20}'.format('Input:', uri))
 
-    # Get engine
-    engine = create_engine(uri)
-
     # Get arguments dict
     args_dict = uri_query_to_args(args, flatten=True)
 
+    # Get engine
+    engine = get_engine(uri, args_dict)
+
     # Whether support range control
     support_range_control = False
 
+    # Whether filter expression has been applied in the statement
+    support_where = False
+
     # If input query is specified
     if query:
         # Compile query to query object
@@ -112,29 +982,59 @@ def select_factory(uri, query, args, cmd_args):
         # Get MetaData object
         metadata = MetaData(engine)
 
-        # Get columns argument
-        dst_columns_text = args_dict.pop('columns', None)
-
-        # If columns argument is not specified
-        if not dst_columns_text:
-            raise ValueError(
-                '"columns" argument is not specified in input arguments: {}'\
-                .format(args))
-
-        # Split columns argument into column names
-        dst_column_name_s = dst_columns_text.split(',')
+        # Get column names and column types
+        dst_column_name_s, column_type_map = get_table_columns(
+            engine=engine,
+            uri=uri,
+            args_dict=args_dict,
+            args=args,
+            schema_name=schema_name,
+            table_name=table_name,
+            kind='input',
+        )
 
-        # Get table object
+        # Get table object.
+        # With reflected column types, result values are native types.
         table = make_table(
             table_name=table_name,
             column_name_s=dst_column_name_s,
             schema_name=schema_name,
             metadata=metadata,
+            column_type_map=column_type_map,
         )
 
         # Get query object
         stmt_obj = table.select()
 
+        # Get filter expression tree
+        where_node = cmd_args.get('where', None)
+
+        # If filter expression is given
+        if where_node is not None:
+            # Import here because it is needed only when filtering.
+            # This saves startup time.
+            from .where_util import resolve_where_columns
+            from .where_util import where_to_sqlalchemy
+
+            # Resolve column names to column indices
+            where_node = resolve_where_columns(where_node, dst_column_name_s)
+
+            # Add "WHERE" to statement, so that rows not matching are not
+            # transferred
+            stmt_obj = stmt_obj.where(where_to_sqlalchemy(
+                where_node, [table.c[x] for x in dst_column_name_s]))
+
+            # Tell program framework that filter has been done
+            support_where = True
+
+        # Get "ORDER BY" columns
+        order_by_column_s = get_order_by_columns(args_dict)
+
+        # If "ORDER BY" columns are specified
+        if order_by_column_s:
+            # Add "ORDER BY" to statement, so that range control is stable
+            stmt_obj = stmt_obj.order_by(*order_by_column_s)
+
         # Get starting row index
         start_row_index = cmd_args['start_row_index']
 
@@ -166,6 +1066,9 @@ def select_factory(uri, query, args, cmd_args):
     # Get repeat int
     repeat_int = int(repeat_text)
 
+    # Ensure all arguments are known
+    check_unknown_args(args_dict, args, 'input')
+
     # Create generator factory
     def resultset_generator_factory():
         # Set initial repeat count to 0
@@ -205,6 +1108,7 @@ def select_factory(uri, query, args, cmd_args):
     factory_info = {
         'input_obj': input_context,
         'support_range_control': support_range_control,
+        'support_where': support_where,
     }
 
     # Return factory info dict
@@ -245,54 +1149,169 @@ def insert_factory(uri, query, args, cmd_args):
             '"table" argument is not specified in output arguments: {}'\
             .format(args))
 
-    # Get columns argument
-    dst_columns_text = args_dict.pop('columns', None)
+    # Whether to insert with the driver's "executemany" instead of a
+    # multi-row "VALUES" statement. The dialect's "executemany_mode" only
+    # applies to the former.
+    use_executemany = 'executemany_mode' in args_dict
 
-    # If columns argument is not specified
-    if not dst_columns_text:
-        # Raise exception
-        raise ValueError(
-            '"columns" argument is not specified in output arguments: {}'\
-            .format(args))
+    # Get engine
+    engine = get_engine(uri, args_dict)
 
-    # Split columns argument into column names
-    dst_column_name_s = dst_columns_text.split(',')
+    # Get output mode
+    output_mode = args_dict.pop('mode', 'insert')
 
-    # Get engine
-    engine = create_engine(uri)
+    # Get key argument
+    key_text = args_dict.pop('key', None)
+
+    # Get staging table name argument
+    stage_table_name = args_dict.pop('stage_table', None) \
+        or table_name + '__stage'
+
+    # Open database connection.
+    # Use a compiled cache so that the statement is compiled only once.
+    connec = engine.connect().execution_options(compiled_cache={})
+
+    # Name of the table to insert into
+    insert_table_name = table_name
+
+    # If output mode is swap
+    if output_mode == 'swap':
+        # If checkpoint is used
+        if cmd_args.get('checkpoint_file_path', None):
+            # Raise exception, because the staging table is created anew
+            # for each run and can not be resumed
+            raise ValueError('Swap mode does not support checkpoint.')
+
+        # If the dialect is not supported
+        if engine.dialect.name not in ('sqlite', 'postgresql', 'mysql'):
+            # Raise exception
+            raise ValueError('Swap is not supported for dialect: {}'.format(
+                engine.dialect.name))
+
+        # Insert into staging table.
+        # The staging table is created when the context is entered, so that
+        # it is dropped on any error after that, and is not left behind if
+        # the context is never entered.
+        insert_table_name = stage_table_name
+
+        # Print message
+        print_stderr('{:20}{}'.format('Stage table:', stage_table_name))
+
+    # Get column names and column types
+    dst_column_name_s, column_type_map = get_table_columns(
+        engine=engine,
+        uri=uri,
+        args_dict=args_dict,
+        args=args,
+        schema_name=schema_name,
+        table_name=table_name,
+        kind='output',
+    )
+
+    # If column types are reflected
+    if column_type_map is not None:
+        # For each column name
+        for column_name in dst_column_name_s:
+            # If the column type is date, time or boolean
+            if isinstance(
+                    column_type_map[column_name],
+                    (Date, DateTime, Time, Interval, Boolean)):
+                # Bind as string and let the database cast it, because these
+                # types' bind processors do not accept strings
+                column_type_map[column_name] = String()
 
     # Get MetaData object
     metadata = MetaData(engine)
 
     # Get table object
     table = make_table(
-        table_name=table_name,
+        table_name=insert_table_name,
         column_name_s=dst_column_name_s,
         schema_name=schema_name,
         metadata=metadata,
+        column_type_map=column_type_map,
     )
 
+    # Get function that coerces string values to column types.
+    # None if column types are not reflected.
+    coerce_rows_func = None if column_type_map is None \
+        else make_coerce_rows_func(table)
+
+    # Ensure all arguments are known
+    check_unknown_args(args_dict, args, 'output')
+
     # Print message
     print_stderr('{:20}{}'.format('Schema:', schema_name))
 
     print_stderr('{:20}{}'.format('Table:', table_name))
 
-    # Get statement object
-    insert_obj = table.insert()
+    print_stderr('{:20}{}'.format('Mode:', output_mode))
+
+    # Parameter names, used to make a parameters dict for each row with
+    # "executemany"
+    param_name_s = dst_column_name_s
+
+    # If output mode is insert or swap
+    if output_mode in ('insert', 'swap'):
+        # Get statement object
+        insert_obj = table.insert()
+
+    # If output mode is upsert
+    elif output_mode == 'upsert':
+        # If key argument is not specified
+        if not key_text:
+            # Raise exception
+            raise ValueError(
+                '"key" argument is required for upsert mode: {}'.format(args))
+
+        # Get statement object and parameter names
+        insert_obj, param_name_s = make_upsert_obj(
+            engine.dialect, table, key_text.split(','))
+
+        # Upsert constructs do not support multi-row "VALUES" in all
+        # dialects, so use "executemany"
+        use_executemany = True
+
+    # If output mode is not valid
+    else:
+        # Raise exception
+        raise ValueError('Invalid output mode: {}'.format(output_mode))
 
     # Print message
     print_stderr('{:20}{}'.format('Statement:', insert_obj))
 
-    # Open database connection
-    connec = engine.connect()
-
     # Create output function
     def insert_func(rows):
         # Begin transaction
         transac = connec.begin()
 
-        # Execute statement
-        connec.execute(insert_obj.values(rows))
+        try:
+            # If need to coerce string values to column types
+            if coerce_rows_func is not None:
+                # Coerce string values
+                rows = coerce_rows_func(rows)
+
+            # If insert with "executemany"
+            if use_executemany:
+                # Execute statement with a parameters dict for each row
+                connec.execute(insert_obj, [
+                    dict(zip(param_name_s, row)) for row in rows])
+            else:
+                # If rows are not lists or tuples, e.g. row objects of
+                # db_io select, which multi-row "VALUES" can not bind
+                if rows and not isinstance(rows[0], (list, tuple)):
+                    # Convert rows to tuples
+                    rows = [tuple(row) for row in rows]
+
+                # Execute statement
+                connec.execute(insert_obj.values(rows))
+        except Exception:
+            # Roll back transaction so that the connection can be reused,
+            # e.g. by the caller to retry part of the rows.
+            transac.rollback()
+
+            # Raise the exception
+            raise
 
         # Commit transaction
         transac.commit()
@@ -300,14 +1319,290 @@ def insert_factory(uri, query, args, cmd_args):
     # Create context factory
     @contextmanager
     def output_context_factory():
-        # Yield insert function
-        yield insert_func
-
-        # Close database connection
-        connec.close()
+        # If output mode is not swap
+        if output_mode != 'swap':
+            # Yield insert function
+            yield insert_func
+
+            # Close database connection
+            connec.close()
+
+            # Return
+            return
+
+        # Staging table object. None if not created yet.
+        stage_table = None
+
+        try:
+            # Create staging table
+            target_table, stage_table = swap_create_stage(
+                connec, schema_name, table_name, stage_table_name)
+
+            # Yield insert function
+            yield insert_func
+
+            # Build indexes on the loaded staging table
+            index_name_pair_s = swap_build_indexes(
+                connec, target_table, stage_table)
+
+            # Swap staging table into place of target table
+            swap_tables(connec, target_table, stage_table, index_name_pair_s)
+
+            # Print message
+            print_stderr('{:20}{} -> {}'.format(
+                'Swap:', stage_table_name, table_name))
+        except BaseException:
+            # If staging table object is created
+            if stage_table is not None:
+                # Drop staging table, leaving target table untouched
+                stage_table.drop(connec, checkfirst=True)
+
+            # Raise the exception
+            raise
+        finally:
+            # Close database connection
+            connec.close()
 
     # Create context object
     output_context = output_context_factory()
 
     # Return context object
     return output_context
+
+
+#
+def pushdown_factory(
+        input_uri,
+        input_args,
+        output_uri,
+        output_args,
+        only_column_index_s,
+        cmd_args):
+    """
+    Pushdown factory that produces a function that copies rows with a
+    server-side "INSERT INTO ... SELECT ..." statement, for input and output
+    on the same database.
+
+    Input and output arguments are the same as those of "select_factory" and
+    "insert_factory". If input argument "order_by" is given, the copy is done
+    in chunks of batch size, otherwise in one statement, because chunks by
+    "OFFSET" are only stable with an order.
+
+    @param input_uri: Input URI.
+
+    @param input_args: Input arguments string.
+
+    @param output_uri: Output URI.
+
+    @param output_args: Output arguments string.
+
+    @param only_column_index_s: Zero-based input column indices to copy. None
+    means all input columns.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Pushdown info dict, in the format:
+    {
+        'pushdown_obj': ...,
+        'chunk_size': ...,
+    }
+    "pushdown_obj" is a context object that yields the pushdown function.
+    The pushdown function's signature is:
+    pushdown_func(offset, limit)
+    It copies at most "limit" input rows starting at zero-based "offset", and
+    returns the number of rows copied, or None if the database driver does
+    not report it. "limit" None means no limit. If "limit" is given and the
+    count is not reported, it raises instead, because the caller needs the
+    count to know when to stop.
+    "chunk_size" is None if the copy can not be chunked.
+    Return None if the arguments are not supported by pushdown.
+    """
+    # Get input arguments dict
+    input_args_dict = uri_query_to_args(input_args, flatten=True)
+
+    # Get output arguments dict
+    output_args_dict = uri_query_to_args(output_args, flatten=True)
+
+    # If input is repeated
+    if input_args_dict.pop('repeat', '1') != '1':
+        # Not supported
+        return None
+
+    # If output mode is not plain insert
+    if output_args_dict.pop('mode', 'insert') != 'insert':
+        # Not supported
+        return None
+
+    # Remove key argument, which is only used by other output modes
+    output_args_dict.pop('key', None)
+
+    # Get executemany mode, which does not apply to pushdown
+    output_args_dict.pop('executemany_mode', None)
+
+    # Get engine. Input and output share it when options are the same.
+    engine = get_engine(input_uri, input_args_dict)
+
+    # Get output engine, to pop output engine options
+    get_engine(output_uri, output_args_dict)
+
+    # Table objects list, for input and output
+    table_s = []
+
+    # For each side
+    for kind, uri, args_dict, args in [
+        ('input', input_uri, input_args_dict, input_args),
+        ('output', output_uri, output_args_dict, output_args),
+    ]:
+        # Get schema name
+        schema_name = args_dict.pop('schema', None)
+
+        # Get table name
+        table_name = args_dict.pop('table', None)
+
+        # If table name is not specified
+        if not table_name:
+            # Raise exception
+            raise ValueError(
+                '"table" argument is not specified in {} arguments: {}'
+                .format(kind, args))
+
+        # Get column names and column types
+        column_name_s, column_type_map = get_table_columns(
+            engine=engine,
+            uri=uri,
+            args_dict=args_dict,
+            args=args,
+            schema_name=schema_name,
+            table_name=table_name,
+            kind=kind,
+        )
+
+        # Get table object
+        table = make_table(
+            table_name=table_name,
+            column_name_s=column_name_s,
+            schema_name=schema_name,
+            metadata=MetaData(),
+            column_type_map=column_type_map,
+        )
+
+        # Add table object
+        table_s.append(table)
+
+    # Get input and output table objects
+    src_table, dst_table = table_s
+
+    # Get "ORDER BY" columns
+    order_by_column_s = get_order_by_columns(input_args_dict)
+
+    # Ensure all arguments are known
+    check_unknown_args(input_args_dict, input_args, 'input')
+
+    check_unknown_args(output_args_dict, output_args, 'output')
+
+    # Get input column objects
+    src_column_s = list(src_table.columns)
+
+    # If only-column indices are given
+    if only_column_index_s:
+        # Get input column objects at the indices
+        src_column_s = [src_column_s[x] for x in only_column_index_s]
+
+    # Get output column names
+    dst_column_name_s = [x.name for x in dst_table.columns]
+
+    # If input and output column counts are not equal
+    if len(src_column_s) != len(dst_column_name_s):
+        # Raise exception
+        raise ValueError(
+            'Input has {} columns but output has {} columns.'.format(
+                len(src_column_s), len(dst_column_name_s)))
+
+    # Get "SELECT" statement object
+    select_obj = select(src_column_s)
+
+    # If "ORDER BY" columns are specified
+    if order_by_column_s:
+        # Add "ORDER BY" to statement
+        select_obj = select_obj.order_by(*order_by_column_s)
+
+    # Print message
+    print_stderr('{:20}{}'.format(
+        'Statement:',
+        dst_table.insert().from_select(dst_column_name_s, select_obj)))
+
+    # Open database connection
+    connec = engine.connect()
+
+    # Create pushdown function
+    def pushdown_func(offset, limit):
+        # Get "SELECT" statement object for the chunk
+        chunk_select_obj = select_obj
+
+        # If offset is not zero
+        if offset:
+            # Add "OFFSET"
+            chunk_select_obj = chunk_select_obj.offset(offset)
+
+        # If limit is given
+        if limit is not None:
+            # Add "LIMIT"
+            chunk_select_obj = chunk_select_obj.limit(limit)
+
+        # Get "INSERT ... SELECT" statement object
+        insert_obj = dst_table.insert().from_select(
+            dst_column_name_s, chunk_select_obj)
+
+        # Begin transaction
+        transac = connec.begin()
+
+        try:
+            # Execute statement
+            result = connec.execute(insert_obj)
+
+            # Get the number of rows copied.
+            # Some drivers report -1 when the count is unknown.
+            row_count = result.rowcount
+
+            # If the number of rows copied is unknown
+            if row_count is None or row_count < 0:
+                # If copying in chunks
+                if limit is not None:
+                    # Raise exception.
+                    # Without the count it is unknown when to stop.
+                    raise ValueError((
+                        'Database driver does not report the number of rows'
+                        ' copied, so pushdown can not copy in chunks. Use'
+                        ' "--pushdown=off".'))
+
+                # Set unknown
+                row_count = None
+        except Exception:
+            # Roll back transaction
+            transac.rollback()
+
+            # Raise the exception
+            raise
+
+        # Commit transaction
+        transac.commit()
+
+        # Return the number of rows copied. None if unknown.
+        return row_count
+
+    # Create context factory
+    @contextmanager
+    def pushdown_context_factory():
+        try:
+            # Yield pushdown function
+            yield pushdown_func
+        finally:
+            # Close database connection
+            connec.close()
+
+    # Return pushdown info dict
+    return {
+        'pushdown_obj': pushdown_context_factory(),
+        'chunk_size':
+            cmd_args['batch_size'] if order_by_column_s else None,
+    }
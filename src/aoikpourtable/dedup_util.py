@@ -0,0 +1,578 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from .print_util import print_stderr
+
+
+# Size of a key digest in bytes. 128-bit digests make accidental collisions
+# negligible even for billions of keys.
+DIGEST_SIZE = 16
+
+# Bytes used by a digest's bytes object
+DIGEST_OBJECT_SIZE = sys.getsizeof(b'\0' * DIGEST_SIZE)
+
+# Estimated bytes used by a digest in a Python set, including the set's hash
+# table slots
+DIGEST_MEMORY_SIZE = DIGEST_OBJECT_SIZE + 48
+
+# Maximum number of spilled digest files. If there are more, they are merged
+# into one file, so that a lookup checks only a few files.
+MAX_SPILL_FILES = 4
+
+
+#
+def format_byte_size(byte_count):
+    """
+    Format byte count to human-readable text.
+
+    @param byte_count: Byte count.
+
+    @return: Text, e.g. "1.5 MB".
+    """
+    # For each unit except the last
+    for unit in ['B', 'KB', 'MB']:
+        # If the byte count is small enough for the unit
+        if byte_count < 1024:
+            # Return text
+            return '{:.1f} {}'.format(byte_count, unit)
+
+        # Go to next unit
+        byte_count /= 1024.0
+
+    # Return text
+    return '{:.1f} GB'.format(byte_count)
+
+
+#
+def get_key_digest(row, key_index_s):
+    """
+    Get 128-bit digest of a row's key columns.
+
+    @param row: Row.
+
+    @param key_index_s: 0-based key column indices.
+
+    @return: Digest bytes.
+    """
+    # Get key text
+    key_text = repr([row[key_index] for key_index in key_index_s])
+
+    # Return digest
+    return hashlib.md5(key_text.encode('utf-8')).digest()
+
+
+#
+def digest_file_contains(digest_map, digest):
+    """
+    Tell whether a sorted digest file contains a digest, using binary search.
+
+    @param digest_map: Memory map of the digest file, which holds sorted
+    digests of "DIGEST_SIZE" bytes each.
+
+    @param digest: Digest bytes.
+
+    @return: True if the file contains the digest.
+    """
+    # Get search range, in digest indices
+    low = 0
+
+    high = len(digest_map) // DIGEST_SIZE
+
+    # While the range is not empty
+    while low < high:
+        # Get middle index
+        middle = (low + high) // 2
+
+        # Get offset of the middle digest
+        offset = middle * DIGEST_SIZE
+
+        # Get the middle digest
+        middle_digest = digest_map[offset:offset + DIGEST_SIZE]
+
+        # If the middle digest is smaller
+        if middle_digest < digest:
+            # Search the upper half
+            low = middle + 1
+
+        # If the middle digest is greater
+        elif middle_digest > digest:
+            # Search the lower half
+            high = middle
+
+        # If the middle digest is equal
+        else:
+            # Found
+            return True
+
+    # Not found
+    return False
+
+
+#
+def digest_file_read(digest_file_path):
+    """
+    Generator that yields digests from a digest file.
+
+    @param digest_file_path: Digest file path.
+
+    @return: A generator.
+    """
+    # Open digest file
+    with open(digest_file_path, 'rb') as digest_file:
+        # Repeat
+        while True:
+            # Read a block of digests
+            data = digest_file.read(DIGEST_SIZE * 65536)
+
+            # If end of file
+            if not data:
+                # Stop
+                break
+
+            # For each digest in the block
+            for offset in range(0, len(data), DIGEST_SIZE):
+                # Yield the digest
+                yield data[offset:offset + DIGEST_SIZE]
+
+
+#
+def digest_file_write(digest_iter, temp_dir):
+    """
+    Write sorted digests to a digest file.
+
+    @param digest_iter: Iterable of sorted digests.
+
+    @param temp_dir: Temp directory. None means the system default.
+
+    @return: Digest file path.
+    """
+    # Create digest file
+    fd, digest_file_path = tempfile.mkstemp(
+        prefix='aoikpourtable-dedup-', suffix='.keys', dir=temp_dir)
+
+    # Open digest file
+    with os.fdopen(fd, 'wb') as digest_file:
+        # Digests of one block
+        digest_s = []
+
+        # For each digest
+        for digest in digest_iter:
+            # Add to block
+            digest_s.append(digest)
+
+            # If the block is full
+            if len(digest_s) >= 65536:
+                # Write the block
+                digest_file.write(b''.join(digest_s))
+
+                # Start a new block
+                digest_s = []
+
+        # Write the last block
+        digest_file.write(b''.join(digest_s))
+
+    # Return digest file path
+    return digest_file_path
+
+
+#
+def exact_dedup_create(key_index_s, memory_size, temp_dir, state):
+    """
+    Create exact dedup function and cleanup function.
+
+    Key digests are kept in a set in memory. When the set goes beyond the
+    memory budget, its digests are sorted and spilled to a digest file, and
+    later keys are looked up in the digest files with binary search.
+
+    @param key_index_s: 0-based key column indices.
+
+    @param memory_size: Memory budget in bytes.
+
+    @param temp_dir: Temp directory for digest files.
+
+    @param state: Dedup state dict to update stats in.
+
+    @return: Tuple of (dedup function, cleanup function).
+    """
+    # Maximum number of digests kept in memory
+    max_digest_count = max(memory_size // DIGEST_MEMORY_SIZE, 1)
+
+    # Digests in memory
+    digest_set = set()
+
+    # Spilled digest files, each a tuple of (file path, file, memory map)
+    spill_s = []
+
+    # Create function that opens a digest file for lookups
+    def spill_open(digest_file_path):
+        # Open digest file
+        digest_file = open(digest_file_path, 'rb')
+
+        # If the file is empty, which can not be memory mapped
+        if os.path.getsize(digest_file_path) == 0:
+            # Use empty bytes as the map
+            digest_map = b''
+        else:
+            # Map the file
+            digest_map = mmap.mmap(
+                digest_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Add to spilled digest files
+        spill_s.append((digest_file_path, digest_file, digest_map))
+
+    # Create function that closes and removes digest files
+    def spill_close(spill_item_s):
+        # For each spilled digest file
+        for digest_file_path, digest_file, digest_map in spill_item_s:
+            # If the map is a memory map
+            if isinstance(digest_map, mmap.mmap):
+                # Close the map
+                digest_map.close()
+
+            # Close the file
+            digest_file.close()
+
+            # Remove the file
+            os.remove(digest_file_path)
+
+    # Create function that updates peak memory used
+    def update_memory():
+        # Update stats
+        state['memory'] = max(
+            state['memory'],
+            sys.getsizeof(digest_set) + len(digest_set) * DIGEST_OBJECT_SIZE)
+
+    # Create function that spills digests in memory
+    def spill_digests():
+        # Update peak memory used
+        update_memory()
+
+        # Write digests in memory to a digest file
+        spill_open(digest_file_write(sorted(digest_set), temp_dir))
+
+        # Update stats
+        state['spilled_keys'] += len(digest_set)
+
+        # Empty the set
+        digest_set.clear()
+
+        # If there are too many digest files
+        if len(spill_s) > MAX_SPILL_FILES:
+            # Get digest files to merge
+            spill_item_s = spill_s[:]
+
+            # Merge the digest files into one file
+            digest_file_path = digest_file_write(
+                heapq.merge(*[digest_file_read(x[0]) for x in spill_item_s]),
+                temp_dir)
+
+            # Replace the merged files with the new file
+            del spill_s[:]
+
+            spill_open(digest_file_path)
+
+            spill_close(spill_item_s)
+
+    # Create dedup function
+    def dedup_func(row):
+        # Get key digest
+        digest = get_key_digest(row, key_index_s)
+
+        # If the key has been seen
+        if digest in digest_set:
+            # Tell the row is a duplicate
+            return True
+
+        # For each spilled digest file
+        for _, _, digest_map in spill_s:
+            # If the key has been seen
+            if digest_file_contains(digest_map, digest):
+                # Tell the row is a duplicate
+                return True
+
+        # Add the digest
+        digest_set.add(digest)
+
+        # Update stats
+        state['key_count'] += 1
+
+        # If there are too many digests in memory
+        if len(digest_set) >= max_digest_count:
+            # Spill digests
+            spill_digests()
+
+        # Tell the row is not a duplicate
+        return False
+
+    # Create cleanup function
+    def cleanup_func():
+        # Update peak memory used
+        update_memory()
+
+        # Close and remove digest files
+        spill_close(spill_s)
+
+        # Update stats
+        state['spill_files'] = len(spill_s)
+
+        del spill_s[:]
+
+    # Return dedup function and cleanup function
+    return dedup_func, cleanup_func
+
+
+#
+def bloom_dedup_create(
+        key_index_s, memory_size, fp_rate, expected_count, state):
+    """
+    Create Bloom filter dedup function.
+
+    A row is a duplicate if all its key's bits are set in the Bloom filter. A
+    new key is taken as a duplicate with about "fp_rate" probability while
+    the filter holds no more keys than its capacity.
+
+    @param key_index_s: 0-based key column indices.
+
+    @param memory_size: Memory budget in bytes.
+
+    @param fp_rate: False-positive rate.
+
+    @param expected_count: Expected number of keys. None if unknown. If
+    known, the filter uses no more memory than needed for it.
+
+    @param state: Dedup state dict to update stats in.
+
+    @return: Dedup function.
+    """
+    # Get bit count per key for the false-positive rate
+    bits_per_key = -math.log(fp_rate) / (math.log(2) ** 2)
+
+    # Get bit count allowed by memory budget
+    bit_count = memory_size * 8
+
+    # If expected key count is known
+    if expected_count:
+        # Use no more bits than needed for it
+        bit_count = min(
+            bit_count, max(int(expected_count * bits_per_key), 64))
+
+    # Round up to whole bytes
+    byte_count = (bit_count + 7) // 8
+
+    bit_count = byte_count * 8
+
+    # Get number of hash functions
+    hash_count = max(int(round(bits_per_key * math.log(2))), 1)
+
+    # Create filter bits
+    bit_array = bytearray(byte_count)
+
+    # Update stats
+    state['memory'] = byte_count
+
+    state['bit_count'] = bit_count
+
+    state['hash_count'] = hash_count
+
+    state['capacity'] = int(bit_count / bits_per_key)
+
+    # Get hash functions' indices
+    hash_index_s = range(hash_count)
+
+    # Create dedup function
+    def dedup_func(row):
+        # Get key digest, and split it into two 64-bit hashes. Bit positions
+        # are derived from the two hashes.
+        hash_1, hash_2 = struct.unpack(
+            '<QQ', get_key_digest(row, key_index_s))
+
+        # Whether all bits are set
+        is_all_set = True
+
+        # For each hash function
+        for hash_index in hash_index_s:
+            # Get bit position
+            position = (hash_1 + hash_index * hash_2) % bit_count
+
+            # Get byte index and bit mask
+            byte_index = position >> 3
+
+            bit_mask = 1 << (position & 7)
+
+            # If the bit is not set
+            if not bit_array[byte_index] & bit_mask:
+                # Set the bit
+                bit_array[byte_index] |= bit_mask
+
+                # Not all bits are set
+                is_all_set = False
+
+        # If not all bits were set, the key is new
+        if not is_all_set:
+            # Update stats
+            state['key_count'] += 1
+
+        # Tell whether the row is a likely duplicate
+        return is_all_set
+
+    # Return dedup function
+    return dedup_func
+
+
+#
+@contextmanager
+def dedup_context_factory(
+        key_index_s,
+        mode='exact',
+        memory_size=64 * 1048576,
+        fp_rate=0.001,
+        expected_count=None,
+        temp_dir=None):
+    """
+    Context factory that produces a dedup function, which tells whether a
+    row's key columns have been seen in earlier rows.
+
+    In "exact" mode, 128-bit key digests are kept in a set, spilled to sorted
+    digest files when beyond the memory budget. In "bloom" mode, a Bloom
+    filter within the memory budget is used, which may take a new key as a
+    duplicate with the given false-positive rate, but never misses a
+    duplicate.
+
+    Rows dropped and memory used are printed on context exit.
+
+    @param key_index_s: 0-based key column indices.
+
+    @param mode: "exact" or "bloom".
+
+    @param memory_size: Memory budget in bytes.
+
+    @param fp_rate: False-positive rate, for "bloom" mode.
+
+    @param expected_count: Expected number of rows. None if unknown.
+
+    @param temp_dir: Temp directory for digest files, for "exact" mode. None
+    means the system default.
+
+    @return: A context object that yields the dedup function in the form:
+    dedup_func(row)
+    It returns True if the row is a duplicate.
+    """
+    # Dedup state dict.
+    # Use a dict so that the functions below can update it.
+    state = {
+        # Number of rows dropped
+        'dropped': 0,
+        # Number of keys added
+        'key_count': 0,
+        # Peak memory used in bytes
+        'memory': 0,
+        # Number of keys spilled to digest files
+        'spilled_keys': 0,
+        # Number of digest files
+        'spill_files': 0,
+    }
+
+    # If mode is exact
+    if mode == 'exact':
+        # Create dedup function
+        key_dedup_func, cleanup_func = exact_dedup_create(
+            key_index_s, memory_size, temp_dir, state)
+
+        # Print message
+        print_stderr('{:20}exact, key columns {}, memory {}'.format(
+            'Dedup:',
+            ','.join(str(x + 1) for x in key_index_s),
+            format_byte_size(memory_size)))
+
+    # If mode is bloom
+    elif mode == 'bloom':
+        # Create dedup function
+        key_dedup_func = bloom_dedup_create(
+            key_index_s, memory_size, fp_rate, expected_count, state)
+
+        # No cleanup needed
+        cleanup_func = None
+
+        # Print message
+        print_stderr(
+            '{:20}bloom, key columns {}, memory {}, {} hash{},'
+            ' {} keys at false-positive rate {}'.format(
+                'Dedup:',
+                ','.join(str(x + 1) for x in key_index_s),
+                format_byte_size(state['memory']),
+                state['hash_count'],
+                '' if state['hash_count'] == 1 else 'es',
+                state['capacity'],
+                fp_rate))
+
+    # If mode is not valid
+    else:
+        # Raise exception
+        raise ValueError('Unknown dedup mode: {}'.format(mode))
+
+    # Create dedup function that counts dropped rows
+    def dedup_func(row):
+        # If the row is a duplicate
+        if key_dedup_func(row):
+            # Increment dropped row count
+            state['dropped'] += 1
+
+            # Tell the row is a duplicate
+            return True
+
+        # Tell the row is not a duplicate
+        return False
+
+    try:
+        # Yield dedup function
+        yield dedup_func
+    finally:
+        # If cleanup is needed
+        if cleanup_func is not None:
+            # Clean up
+            cleanup_func()
+
+        # Get message
+        msg = '{:20}{} row{} dropped, {} key{}, memory {}'.format(
+            'Dedup:',
+            state['dropped'],
+            '' if state['dropped'] == 1 else 's',
+            state['key_count'],
+            '' if state['key_count'] == 1 else 's',
+            format_byte_size(state['memory']))
+
+        # If mode is exact
+        if mode == 'exact':
+            # If any key is spilled
+            if state['spilled_keys']:
+                # Add spill info to message
+                msg += ', {} key{} spilled to {} file{}'.format(
+                    state['spilled_keys'],
+                    '' if state['spilled_keys'] == 1 else 's',
+                    state['spill_files'],
+                    '' if state['spill_files'] == 1 else 's')
+
+        # If mode is bloom
+        else:
+            # Get estimated false-positive rate at the end, for the number of
+            # keys added
+            est_fp_rate = (1 - math.exp(
+                -float(state['hash_count']) * state['key_count']
+                / state['bit_count'])) ** state['hash_count']
+
+            # Add estimated false-positive rate to message
+            msg += ', est. false-positive rate {:.2g}'.format(est_fp_rate)
+
+        # Print message
+        print_stderr(msg)
@@ -0,0 +1,207 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import json
+import sys
+
+from .print_util import print_stderr
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+
+# Output function returns this, or a tuple of this and written row count, to
+# tell program framework to stop processing
+STOP_OBJ = None.__class__
+
+
+#
+@contextmanager
+def reject_context_factory(reject_file_path, max_error_count=None):
+    """
+    Context factory that produces a reject function. The reject function
+    writes a failing row to the reject file as one JSON line, in the format:
+    {
+        "ordinal": ...,
+        "stage": ...,
+        "error": ...,
+        "row": ...
+    }
+
+    @param reject_file_path: Reject file path.
+
+    @param max_error_count: Maximum number of rejected rows allowed. If the
+    count goes beyond it, the reject function raises an exception to abort the
+    program. None means no limit.
+
+    @return: A context object that yields the reject function.
+    """
+    # Open reject file
+    if IS_PY2:
+        reject_file = open(reject_file_path, mode='a')
+    else:
+        reject_file = open(reject_file_path, mode='a', encoding='utf-8')
+
+    # Reject info dict.
+    # Use a dict so that the reject function can update it.
+    reject_info = {
+        'count': 0,
+    }
+
+    # Create reject function
+    def reject_func(stage, row_ordinal, row, exc):
+        # Increment reject count
+        reject_info['count'] += 1
+
+        # Get reject record
+        record = {
+            'ordinal': row_ordinal,
+            'stage': stage,
+            'error': '{}: {}'.format(exc.__class__.__name__, exc),
+            'row': row,
+        }
+
+        # Write reject record.
+        # Values that are not JSON serializable, e.g. "Decimal" and "bytes",
+        # are written in their "repr" form.
+        reject_file.write(json.dumps(record, default=repr))
+
+        # Write newline
+        reject_file.write('\n')
+
+        # If reject count goes beyond maximum error count
+        if max_error_count is not None \
+                and reject_info['count'] > max_error_count:
+            # Flush so that the last reject record is not lost
+            reject_file.flush()
+
+            # Raise exception to abort the program
+            raise ValueError(
+                'Error count exceeds maximum error count {}.'
+                ' Last error at row ordinal {}: {}'.format(
+                    max_error_count, row_ordinal, record['error']))
+
+    # Yield reject function
+    try:
+        yield reject_func
+    finally:
+        # Close reject file
+        reject_file.close()
+
+    # Get reject count
+    reject_count = reject_info['count']
+
+    # Print message
+    print_stderr('{:20}{} row{}, {}'.format(
+        'Rejected:',
+        reject_count,
+        '' if reject_count <= 1 else 's',
+        reject_file_path))
+
+
+#
+def output_bisect(output_func, row_s, row_ordinal_s, reject_func):
+    """
+    Output rows using the output function. If the output function fails,
+    bisect the rows to isolate failing rows and send them to the reject
+    function, while the other rows still go through the output function in
+    batches.
+
+    The output function is expected to output all or none of the rows given
+    in one call, e.g. a database insert function that uses one transaction per
+    call.
+
+    @param output_func: Output function.
+
+    @param row_s: Rows list.
+
+    @param row_ordinal_s: Row ordinals list, one for each row.
+
+    @param reject_func: Reject function. None means no bisecting, the output
+    function's exception is raised.
+
+    @return: The output function's return value, e.g. the stop object that
+    tells program framework to stop processing. When bisecting, the first
+    value that is not None, with its written row count counting the rows
+    before it. See "get_stop_written_count".
+    """
+    try:
+        # Output the rows
+        return output_func(row_s)
+    except Exception:
+        # If reject function is not given
+        if reject_func is None:
+            # Raise the exception
+            raise
+
+        # If there is only one row
+        if len(row_s) == 1:
+            # Reject the row
+            reject_func(
+                'output', row_ordinal_s[0], row_s[0], sys.exc_info()[1])
+
+            # Return
+            return None
+
+        # Get middle index
+        mid_index = len(row_s) // 2
+
+        # Output the first half
+        result = output_bisect(
+            output_func,
+            row_s[:mid_index],
+            row_ordinal_s[:mid_index],
+            reject_func)
+
+        # If the output function asks to stop processing
+        if result is not None:
+            # Do not output the second half
+            return result
+
+        # Output the second half
+        result = output_bisect(
+            output_func,
+            row_s[mid_index:],
+            row_ordinal_s[mid_index:],
+            reject_func)
+
+        # If the output function asks to stop and tells written row count
+        if isinstance(result, tuple):
+            # Count rows of the first half as written
+            result = (result[0], mid_index + result[1])
+
+        # Return the result
+        return result
+
+
+#
+def get_stop_written_count(output_result, row_count):
+    """
+    Get number of rows written by an output function call that asks to stop
+    processing.
+
+    @param output_result: The output function's return value. It asks to
+    stop processing if it is the stop object, or a tuple of (stop object,
+    written row count).
+
+    @param row_count: Number of rows given to the output function call.
+
+    @return: Number of rows written, or None if the output function does not
+    ask to stop. If the stop object alone is returned, all rows are counted
+    as written.
+    """
+    # If the output function asks to stop without written row count
+    if output_result is STOP_OBJ:
+        # Count all rows as written
+        return row_count
+
+    # If the output function asks to stop with written row count
+    if isinstance(output_result, tuple) and output_result[0] is STOP_OBJ:
+        # Return written row count
+        return output_result[1]
+
+    # Return None
+    return None
@@ -0,0 +1,285 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import sys
+import threading
+
+from .error_util import get_stop_written_count
+from .error_util import output_bisect
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    from Queue import Queue
+else:
+    from queue import Queue
+
+
+# Number of batches each output can have queued. When an output's queue is
+# full, sending waits, so the slowest output sets the pace.
+QUEUE_SIZE = 2
+
+# Output function returns this to tell program framework to stop processing
+STOP_OBJ = None.__class__
+
+
+#
+def fanout_create(output_ctx_s):
+    """
+    Create a fan-out context that delivers each batch to several outputs,
+    each output running on its own worker thread.
+
+    The context yields a send function in the form:
+    send_func(row_s, row_ordinal_s, reject_func)
+    It queues the batch for every output and returns without waiting for
+    outputs to finish, unless an output's queue is full. Each worker outputs
+    the batch with "output_bisect", so a failing row is rejected for that
+    output only. Each output context is entered and exited on its output's
+    worker thread.
+
+    The rows list is shared by all outputs, so the caller must not modify it
+    after sending.
+
+    An output's exception is raised by the next send function call, the wait
+    function, or on context exit. After an output returns the stop object,
+    the output gets no more batches. The send function returns the stop
+    object once all outputs have stopped.
+
+    @param output_ctx_s: Output contexts list, each yields an output
+    function.
+
+    @return: Fan-out info dict, in the format:
+    {
+        'output_ctx': ...,
+        'wait_func': ...,
+    }
+    "wait_func" waits until all queued batches are output, e.g. before
+    writing a checkpoint.
+    """
+    # Number of outputs
+    output_count = len(output_ctx_s)
+
+    # Lock that serializes reject function calls from workers
+    reject_lock = threading.Lock()
+
+    # Fan-out state dict.
+    # Use a dict so that the functions below can update it.
+    state = {
+        # The first exception raised by an output
+        'exc_info': None,
+        # Stop flags, one for each output
+        'stops': [False] * output_count,
+        # Whether workers should discard batches, e.g. on error
+        'abort': False,
+    }
+
+    # Queues, one for each output
+    queue_s = [Queue(QUEUE_SIZE) for _ in range(output_count)]
+
+    # Create function that keeps the first output exception
+    def keep_output_exc():
+        # If no exception is kept yet
+        if state['exc_info'] is None:
+            # Keep the exception
+            state['exc_info'] = sys.exc_info()
+
+        # Discard later batches of all outputs
+        state['abort'] = True
+
+    # Create worker function.
+    # The output context is entered and exited in the worker thread, so that
+    # objects with thread affinity, e.g. SQLite connections, are created in
+    # the thread that uses them.
+    def worker_func(output_index, output_ctx, ready_event):
+        # Get the output's queue
+        queue = queue_s[output_index]
+
+        # Get reject stage name, telling which output rejects a row
+        stage = 'output{}'.format(output_index + 1)
+
+        try:
+            # Enter the output context to get output function
+            output_func = output_ctx.__enter__()
+        except BaseException:
+            # Keep the exception
+            keep_output_exc()
+
+            # Output function is not available
+            output_func = None
+        finally:
+            # Tell the main thread that entering is done
+            ready_event.set()
+
+        # Repeat
+        while True:
+            # Get a queue item
+            item = queue.get()
+
+            try:
+                # If the item is the end marker, holding exception info to
+                # exit the output context with
+                if item[0] is None:
+                    # If the output context is entered
+                    if output_func is not None:
+                        try:
+                            # Exit the output context
+                            output_ctx.__exit__(*item[1])
+                        except BaseException:
+                            # Keep the exception
+                            keep_output_exc()
+
+                    # Stop
+                    break
+
+                # If batches should be discarded, or the output has stopped
+                if state['abort'] or state['stops'][output_index]:
+                    # Discard the batch
+                    continue
+
+                # Get rows, row ordinals and reject function
+                row_s, row_ordinal_s, reject_func = item
+
+                # If reject function is given
+                if reject_func is not None:
+                    # Create reject function that serializes calls and
+                    # records the output's stage name
+                    def output_reject_func(
+                            _, row_ordinal, row, exc,
+                            reject_func=reject_func):
+                        with reject_lock:
+                            reject_func(stage, row_ordinal, row, exc)
+                else:
+                    output_reject_func = None
+
+                try:
+                    # Output the rows
+                    result = output_bisect(
+                        output_func, row_s, row_ordinal_s, output_reject_func)
+                except BaseException:
+                    # Keep the exception
+                    keep_output_exc()
+
+                    # Go to next item
+                    continue
+
+                # If the output asks to stop processing
+                if get_stop_written_count(result, len(row_s)) is not None:
+                    # Set the output's stop flag
+                    state['stops'][output_index] = True
+            finally:
+                # Mark the item as done
+                queue.task_done()
+
+    # Create function that raises the first output exception, if any
+    def raise_output_exc():
+        # Get exception info
+        exc_info = state['exc_info']
+
+        # If an output failed
+        if exc_info is not None:
+            # Raise the exception
+            raise exc_info[1]
+
+    # Create send function
+    def send_func(row_s, row_ordinal_s, reject_func):
+        # Raise output exception, if any
+        raise_output_exc()
+
+        # For each output's queue
+        for queue in queue_s:
+            # Queue the batch, waiting if the queue is full
+            queue.put((row_s, row_ordinal_s, reject_func))
+
+        # If all outputs have stopped
+        if all(state['stops']):
+            # Tell program framework to stop processing
+            return STOP_OBJ
+
+        # Return None
+        return None
+
+    # Create wait function
+    def wait_func():
+        # For each output's queue
+        for queue in queue_s:
+            # Wait until all queued batches are done
+            queue.join()
+
+        # Raise output exception, if any
+        raise_output_exc()
+
+    # Create context factory
+    @contextmanager
+    def fanout_context_manager():
+        # Worker threads
+        thread_s = []
+
+        # Exception info passed to output contexts on exit
+        exc_info = (None, None, None)
+
+        try:
+            # For each output context
+            for output_index, output_ctx in enumerate(output_ctx_s):
+                # Create event set when the worker has entered the output
+                # context
+                ready_event = threading.Event()
+
+                # Create worker thread
+                thread = threading.Thread(
+                    target=worker_func,
+                    args=(output_index, output_ctx, ready_event))
+
+                # Do not keep the process alive if the main thread exits
+                # abnormally
+                thread.daemon = True
+
+                # Start worker thread
+                thread.start()
+
+                # Add to worker threads
+                thread_s.append(thread)
+
+                # Wait for the worker to enter the output context
+                ready_event.wait()
+
+                # Raise output exception, if any
+                raise_output_exc()
+
+            # Yield send function
+            yield send_func
+
+            # Wait until all queued batches are done
+            wait_func()
+        except BaseException:
+            # Get exception info
+            exc_info = sys.exc_info()
+
+            # Discard queued batches
+            state['abort'] = True
+
+            # Raise the exception
+            raise
+        finally:
+            # For each worker thread's queue
+            for queue in queue_s[:len(thread_s)]:
+                # Put end marker
+                queue.put((None, exc_info))
+
+            # For each worker thread
+            for thread in thread_s:
+                # Wait for the thread to exit
+                thread.join()
+
+        # Raise exception from exiting output contexts, if any
+        raise_output_exc()
+
+    # Return fan-out info dict
+    return {
+        'output_ctx': fanout_context_manager(),
+        'wait_func': wait_func,
+    }
@@ -0,0 +1,519 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from datetime import datetime
+import itertools
+import random
+import sys
+
+from .print_util import print_stderr
+from .uri_util import uri_query_to_args
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    range = xrange  # noqa: F821
+
+
+#
+def parse_column_spec(column_spec):
+    """
+    Parse column spec text to column info dict.
+
+    Column spec formats:
+    - "i:MIN:MAX": Int in range [MIN, MAX].
+    - "f:MIN:MAX": Float in range [MIN, MAX).
+    - "s:WIDTH": Fixed-width hex string.
+    - "c:A|B|C": One of the choices.
+    - "n:START": Sequence number, START plus zero-based row index.
+
+    Each spec can have a "@RATE" suffix to make the column null at the given
+    rate, e.g. "i:1:100@0.1".
+
+    @param column_spec: Column spec text.
+
+    @return: Column info dict, in the format:
+    {
+        'kind': ...,
+        'params': [...],
+        'null_rate': ...,
+    }
+    """
+    # Split spec into value spec and null rate text
+    value_spec, _, null_rate_text = column_spec.strip().partition('@')
+
+    # Get null rate
+    null_rate = float(null_rate_text) if null_rate_text else 0.0
+
+    # If null rate is not valid
+    if not 0.0 <= null_rate <= 1.0:
+        # Raise exception
+        raise ValueError(
+            'Null rate must be in range [0, 1]: {}'.format(column_spec))
+
+    # Split value spec into kind and parameters
+    kind, _, params_text = value_spec.partition(':')
+
+    try:
+        # If kind is int
+        if kind == 'i':
+            # Get minimum and maximum
+            min_text, max_text = params_text.split(':')
+
+            params = [int(min_text), int(max_text)]
+
+        # If kind is float
+        elif kind == 'f':
+            # Get minimum and maximum
+            min_text, max_text = params_text.split(':')
+
+            params = [float(min_text), float(max_text)]
+
+        # If kind is string
+        elif kind == 's':
+            # Get width
+            params = [int(params_text)]
+
+            # Ensure width is > 0
+            if params[0] <= 0:
+                raise ValueError(params_text)
+
+        # If kind is choice
+        elif kind == 'c':
+            # Get choices
+            params = [params_text.split('|')]
+
+        # If kind is sequence
+        elif kind == 'n':
+            # Get starting number
+            params = [int(params_text) if params_text else 1]
+
+        # If kind is not valid
+        else:
+            # Raise exception
+            raise ValueError(kind)
+
+        # If kind is int or float and range is not valid
+        if kind in ('i', 'f') and params[0] > params[1]:
+            # Raise exception
+            raise ValueError(params_text)
+
+    except ValueError:
+        # Raise exception
+        raise ValueError('Invalid column spec: {}'.format(column_spec))
+
+    # Return column info dict
+    return {
+        'kind': kind,
+        'params': params,
+        'null_rate': null_rate,
+    }
+
+
+#
+def make_column_values(column_info, rng, row_index, row_count):
+    """
+    Make values of one column for a batch of rows.
+
+    @param column_info: Column info dict. See "parse_column_spec".
+
+    @param rng: "random.Random" object.
+
+    @param row_index: Zero-based row index of the batch's first row.
+
+    @param row_count: Number of rows in the batch.
+
+    @return: Values list.
+    """
+    # Get kind
+    kind = column_info['kind']
+
+    # Get parameters
+    params = column_info['params']
+
+    # If kind is int
+    if kind == 'i':
+        # Get random int function
+        randint = rng.randint
+
+        # Get minimum and maximum
+        min_value, max_value = params
+
+        # Make values
+        value_s = [randint(min_value, max_value) for _ in range(row_count)]
+
+    # If kind is float
+    elif kind == 'f':
+        # Get random float function
+        random_func = rng.random
+
+        # Get minimum and range width
+        min_value = params[0]
+
+        width = params[1] - params[0]
+
+        # Make values
+        value_s = [
+            min_value + width * random_func() for _ in range(row_count)]
+
+    # If kind is string
+    elif kind == 's':
+        # Get random bits function
+        getrandbits = rng.getrandbits
+
+        # Get width
+        width = params[0]
+
+        # Get bit count, 4 bits for each hex digit
+        bit_count = width * 4
+
+        # Get format string that pads to the width
+        fmt = '{:0%dx}' % width
+
+        # Make values
+        value_s = [fmt.format(getrandbits(bit_count))
+                   for _ in range(row_count)]
+
+    # If kind is choice
+    elif kind == 'c':
+        # Get random choice function
+        choice = rng.choice
+
+        # Get choices
+        choice_s = params[0]
+
+        # Make values
+        value_s = [choice(choice_s) for _ in range(row_count)]
+
+    # If kind is sequence
+    else:
+        # Get the batch's first number
+        start_number = params[0] + row_index
+
+        # Make values
+        value_s = list(range(start_number, start_number + row_count))
+
+    # Get null rate
+    null_rate = column_info['null_rate']
+
+    # If null rate is not zero
+    if null_rate:
+        # Get random float function
+        random_func = rng.random
+
+        # For each value index
+        for value_index in range(row_count):
+            # If the value should be null
+            if random_func() < null_rate:
+                # Set the value to None
+                value_s[value_index] = None
+
+    # Return values list
+    return value_s
+
+
+#
+def make_batch(column_info_s, seed, batch_index, batch_size):
+    """
+    Make a batch of rows.
+
+    The random generator is seeded with the seed and the batch index, so that
+    a batch's rows are the same no matter which row the generation starts
+    from.
+
+    @param column_info_s: Column info dicts list.
+
+    @param seed: Seed text.
+
+    @param batch_index: Zero-based batch index.
+
+    @param batch_size: Number of rows in a batch.
+
+    @return: Rows list, each row is a list.
+    """
+    # Create random generator for the batch
+    rng = random.Random('{}:{}'.format(seed, batch_index))
+
+    # Get row index of the batch's first row
+    row_index = batch_index * batch_size
+
+    # Make values of each column
+    column_s = [
+        make_column_values(column_info, rng, row_index, batch_size)
+        for column_info in column_info_s
+    ]
+
+    # Transpose columns to rows
+    return [list(row) for row in zip(*column_s)]
+
+
+#
+def get_args_info(args):
+    """
+    Parse generator input arguments string.
+
+    @param args: Input arguments string.
+
+    @return: Arguments info dict, in the format:
+    {
+        'column_infos': [...],
+        'seed': ...,
+        'rows': ...,
+        'batch': ...,
+        'pool': ...,
+    }
+    """
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get columns argument
+    columns_text = args_dict.pop('columns', None)
+
+    # If columns argument is not specified
+    if not columns_text:
+        # Raise exception
+        raise ValueError(
+            '"columns" argument is not specified in input arguments: {}'
+            .format(args))
+
+    # Parse column specs
+    column_info_s = [
+        parse_column_spec(column_spec)
+        for column_spec in columns_text.split(',')
+    ]
+
+    # Get rows argument. None means infinite.
+    rows_text = args_dict.pop('rows', None)
+
+    row_count = int(rows_text) if rows_text else None
+
+    # Get batch size argument
+    batch_size = int(args_dict.pop('batch', '1000'))
+
+    # Get pool size argument. 0 means no pool.
+    pool_size = int(args_dict.pop('pool', '0'))
+
+    # If any of the values is not valid
+    if (row_count is not None and row_count < 0) \
+            or batch_size <= 0 or pool_size < 0:
+        # Raise exception
+        raise ValueError(
+            '"rows", "batch" and "pool" arguments must not be negative: {}'
+            .format(args))
+
+    # Return arguments info dict
+    return {
+        'column_infos': column_info_s,
+        'seed': args_dict.pop('seed', '0'),
+        'rows': row_count,
+        'batch': batch_size,
+        'pool': pool_size,
+    }
+
+
+#
+def get_row_index_range(row_count, cmd_args):
+    """
+    Get the range of row indices to generate.
+
+    @param row_count: Number of rows to generate. None means infinite.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: A tuple of 2 elements: (start_row_index, end_row_index).
+    "end_row_index" is exclusive, None means infinite.
+    """
+    # Get starting row index
+    start_row_index = cmd_args['start_row_index'] or 0
+
+    # Get ending row index
+    end_row_index = cmd_args['end_row_index']
+
+    # If number of rows is given
+    if row_count is not None:
+        # Limit ending row index to number of rows
+        if end_row_index is None or end_row_index > row_count:
+            end_row_index = row_count
+
+    # Return the tuple
+    return start_row_index, end_row_index
+
+
+#
+def input_factory(uri, query, args, cmd_args):
+    """
+    Input factory that produces synthetic rows according to column specs.
+
+    Input URI and input query are not used.
+
+    Input arguments:
+    - columns: Comma-separated column specs. See "parse_column_spec".
+    - seed: Seed text. Default is "0".
+    - rows: Number of rows to generate. Default is infinite.
+    - batch: Number of rows generated at a time. Default is 1000.
+    - pool: If given, generate this number of batches up front and repeat
+      them, so that generating costs nothing during processing. Rows in the
+      pool are shared between repeats.
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Factory info dict.
+    """
+    # Parse arguments
+    args_info = get_args_info(args)
+
+    # Get column info dicts list
+    column_info_s = args_info['column_infos']
+
+    # Get seed
+    seed = args_info['seed']
+
+    # Get batch size
+    batch_size = args_info['batch']
+
+    # Get pool size
+    pool_size = args_info['pool']
+
+    # Print message
+    print_stderr('{:20}{}'.format('Input:', 'generator'))
+
+    print_stderr('{:20}{}'.format('Columns:', len(column_info_s)))
+
+    print_stderr('{:20}{}'.format('Seed:', seed))
+
+    # Get range of row indices to generate
+    start_row_index, end_row_index = get_row_index_range(
+        args_info['rows'], cmd_args)
+
+    # If pool is enabled
+    if pool_size:
+        # Get starting time
+        pool_start_time = datetime.utcnow()
+
+        # Make pool batches
+        pool_batch_s = [
+            make_batch(column_info_s, seed, batch_index, batch_size)
+            for batch_index in range(pool_size)
+        ]
+
+        # Get duration
+        pool_dura = (datetime.utcnow() - pool_start_time).total_seconds()
+
+        # Print message
+        print_stderr('{:20}{} batch{} of {} rows, {:.3f}s'.format(
+            'Pool:',
+            pool_size,
+            '' if pool_size <= 1 else 'es',
+            batch_size,
+            pool_dura))
+
+    # If pool is not enabled
+    else:
+        # Set pool batches list to None
+        pool_batch_s = None
+
+    # Create generator factory
+    def batch_generator_factory():
+        # Get index of the batch containing the starting row
+        batch_index = start_row_index // batch_size
+
+        # Get offset of the starting row in the batch
+        skip_count = start_row_index % batch_size
+
+        # Get row index of the batch's first row
+        row_index = batch_index * batch_size
+
+        # While ending row index is not reached
+        while end_row_index is None or row_index < end_row_index:
+            # If pool is enabled
+            if pool_batch_s is not None:
+                # Get batch from pool
+                row_s = pool_batch_s[batch_index % pool_size]
+            else:
+                # Make batch
+                row_s = make_batch(
+                    column_info_s, seed, batch_index, batch_size)
+
+            # If the batch contains rows out of range
+            if skip_count or (
+                    end_row_index is not None
+                    and row_index + batch_size > end_row_index):
+                # Get rows in range
+                row_s = row_s[
+                    skip_count:
+                    None if end_row_index is None
+                    else end_row_index - row_index]
+
+                # Only the first batch needs skipping
+                skip_count = 0
+
+            # Yield rows
+            yield row_s
+
+            # Go to next batch
+            batch_index += 1
+
+            row_index += batch_size
+
+    # Get row iterator
+    row_iter = itertools.chain.from_iterable(batch_generator_factory())
+
+    # Return factory info dict
+    return {
+        'input_obj': row_iter,
+        'support_range_control': True,
+    }
+
+
+#
+def count_rows(uri, query, args, cmd_args):
+    """
+    Count factory that gets the number of rows the generator input factory
+    produces, without generating them.
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Count info dict, in the format:
+    {
+        'count': ...,
+        'duration': ...,
+        'rate': ...,
+    }
+    """
+    # Parse arguments
+    args_info = get_args_info(args)
+
+    # Get range of row indices to generate
+    start_row_index, end_row_index = get_row_index_range(
+        args_info['rows'], cmd_args)
+
+    # If the generator is infinite
+    if end_row_index is None:
+        # Set count to None
+        count = None
+    else:
+        # Get count
+        count = max(end_row_index - start_row_index, 0)
+
+    # Return count info dict
+    return {
+        'count': count,
+        'duration': None,
+        'rate': None,
+    }
@@ -0,0 +1,357 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import json
+import sys
+
+from .print_util import print_prefix_set
+from .print_util import print_stderr
+from .timing_util import time_clock
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    from ConfigParser import RawConfigParser
+else:
+    from configparser import RawConfigParser
+
+
+#
+def job_options_to_argv(option_s):
+    """
+    Convert job options to command arguments list.
+
+    @param option_s: List of (option name, value) tuples. Option names are
+    command argument names without the leading "--", e.g. "input-args".
+    Value True means a flag argument, e.g. "resume". Value False or None
+    means the argument is omitted.
+
+    @return: Command arguments list.
+    """
+    # Command arguments list
+    argv = []
+
+    # For each option name and value
+    for option_name, value in option_s:
+        # If the option is a job runner option
+        if option_name.startswith('jobs'):
+            # Raise exception
+            raise ValueError(
+                'Job option can not be "{}".'.format(option_name))
+
+        # If value is False or None
+        if value is False or value is None:
+            # Omit the argument
+            continue
+
+        # If value is True
+        if value is True:
+            # Add flag argument
+            argv.append('--' + option_name)
+
+        # If value is not True
+        else:
+            # Add argument with value.
+            # Use "=" so that a value starting with "-" is not taken as an
+            # argument name.
+            argv.append('--{}={}'.format(option_name, value))
+
+    # Return command arguments list
+    return argv
+
+
+#
+def jobs_read(jobs_file_path):
+    """
+    Read jobs from a job manifest file.
+
+    A JSON file (".json") is a list of job dicts, or a dict in the format:
+    {
+        'defaults': {...},
+        'jobs': [{...}, ...],
+    }
+    Each job dict maps option names to values, see "job_options_to_argv".
+    Key "name" is the job name. Options in "defaults" apply to all jobs.
+
+    Any other file is an INI file. Each section is a job named after the
+    section, and options in "[DEFAULT]" apply to all jobs. Value "true"
+    means a flag argument and value "false" omits the argument.
+
+    @param jobs_file_path: Job manifest file path.
+
+    @return: List of job info dicts, in the format:
+    {
+        'name': ...,
+        'argv': [...],
+    }
+    """
+    # List of (job name, option tuples list)
+    job_option_s = []
+
+    # If the file is a JSON file
+    if jobs_file_path.endswith('.json'):
+        # Read JSON data
+        with open(jobs_file_path) as jobs_file:
+            jobs_data = json.load(jobs_file)
+
+        # If JSON data is a list
+        if isinstance(jobs_data, list):
+            # No defaults
+            default_dict = {}
+
+            # Get job dicts
+            job_dict_s = jobs_data
+
+        # If JSON data is not a list
+        else:
+            # Get defaults
+            default_dict = jobs_data.get('defaults', {})
+
+            # Get job dicts
+            job_dict_s = jobs_data['jobs']
+
+        # For each job dict
+        for job_index, job_dict in enumerate(job_dict_s):
+            # Merge defaults and job options
+            option_dict = dict(default_dict)
+
+            option_dict.update(job_dict)
+
+            # Get job name
+            job_name = option_dict.pop('name', None) \
+                or 'job{}'.format(job_index + 1)
+
+            # Add job
+            job_option_s.append((job_name, sorted(option_dict.items())))
+
+    # If the file is not a JSON file
+    else:
+        # Create INI parser.
+        # Use raw parser because URIs may contain "%".
+        ini_parser = RawConfigParser()
+
+        # Keep option names as is
+        ini_parser.optionxform = str
+
+        # Read INI file
+        with open(jobs_file_path) as jobs_file:
+            if IS_PY2:
+                ini_parser.readfp(jobs_file)
+            else:
+                ini_parser.read_file(jobs_file)
+
+        # For each section
+        for section_name in ini_parser.sections():
+            # Option tuples list
+            option_s = []
+
+            # For each option name and value, including "[DEFAULT]" options
+            for option_name, value in ini_parser.items(section_name):
+                # Convert flag values
+                if value == 'true':
+                    value = True
+                elif value == 'false':
+                    value = False
+
+                # Add option
+                option_s.append((option_name, value))
+
+            # Add job
+            job_option_s.append((section_name, option_s))
+
+    # Return job info dicts list
+    return [
+        {
+            'name': job_name,
+            'argv': job_options_to_argv(option_s),
+        }
+        for job_name, option_s in job_option_s
+    ]
+
+
+#
+def job_run(job_info):
+    """
+    Run one job by calling "main_wrap" with the job's command arguments.
+
+    This is a module-level function so that a process pool can pickle it.
+
+    @param job_info: Job info dict. See "jobs_read".
+
+    @return: Job result dict, in the format:
+    {
+        'name': ...,
+        'exit_code': ...,
+        'row_count': ...,
+        'duration': ...,
+    }
+    "row_count" is None if the job fails before processing data.
+    """
+    # Import here to avoid circular import
+    from .main import main_wrap
+
+    # Get job name
+    job_name = job_info['name']
+
+    # Prefix messages printed by this thread with the job name
+    print_prefix_set('[{}] '.format(job_name))
+
+    # Result info dict, filled by "main_core"
+    result_info = {}
+
+    # Get starting time
+    start_time = time_clock()
+
+    try:
+        # Run the job
+        exit_code = main_wrap(args=job_info['argv'], result_info=result_info)
+    finally:
+        # Remove message prefix
+        print_prefix_set('')
+
+    # If the job did not finish processing, e.g. it raised an exception.
+    # "main_wrap" returns the step's exit code, which may be 0.
+    if exit_code == 0 and 'row_count' not in result_info:
+        # Treat the job as failed
+        exit_code = 1
+
+    # Return job result dict
+    return {
+        'name': job_name,
+        'exit_code': exit_code,
+        'row_count': result_info.get('row_count', None),
+        'duration': time_clock() - start_time,
+    }
+
+
+#
+def format_job_result(job_result):
+    """
+    Format job result dict to message.
+
+    @param job_result: Job result dict. See "job_run".
+
+    @return: Message.
+    """
+    # Get row count
+    row_count = job_result['row_count'] or 0
+
+    # Get duration
+    duration = job_result['duration']
+
+    # Return message
+    return '{:20}{}: {}, {} row{}, {:.3f}s, {:.0f} rows/s'.format(
+        'Job:',
+        job_result['name'],
+        'ok' if job_result['exit_code'] == 0
+        else 'exit code {}'.format(job_result['exit_code']),
+        row_count,
+        '' if row_count == 1 else 's',
+        duration,
+        row_count / duration if duration > 0 else 0)
+
+
+#
+def jobs_run(job_info_s, worker_count=1, pool_kind='thread'):
+    """
+    Run jobs on a thread pool or a process pool, printing each job's result
+    when it finishes, and the total at the end.
+
+    Jobs on a thread pool share loaded plugins and cached database engines.
+    Jobs on a process pool share them only with jobs run by the same worker
+    process.
+
+    @param job_info_s: Job info dicts list. See "jobs_read".
+
+    @param worker_count: Number of jobs to run concurrently.
+
+    @param pool_kind: "thread" or "process".
+
+    @return: Exit code. 0 if all jobs succeed, otherwise the first failed
+    job's exit code.
+    """
+    # Print message
+    print_stderr('{:20}{} job{}, {} {} worker{}'.format(
+        'Jobs:',
+        len(job_info_s),
+        '' if len(job_info_s) == 1 else 's',
+        worker_count,
+        pool_kind,
+        '' if worker_count == 1 else 's'))
+
+    # Get starting time
+    start_time = time_clock()
+
+    # Job result dicts list
+    job_result_s = []
+
+    # If only one worker
+    if worker_count == 1:
+        # Run jobs one by one in this thread
+        job_result_iter = (job_run(job_info) for job_info in job_info_s)
+
+        # No pool to close
+        pool = None
+
+    # If more than one worker
+    else:
+        # Create pool
+        if pool_kind == 'process':
+            from multiprocessing import Pool
+        else:
+            from multiprocessing.pool import ThreadPool as Pool
+
+        pool = Pool(worker_count)
+
+        # Run jobs in pool, getting results as jobs finish
+        job_result_iter = pool.imap_unordered(job_run, job_info_s)
+
+    try:
+        # For each job result
+        for job_result in job_result_iter:
+            # Add to list
+            job_result_s.append(job_result)
+
+            # Print message
+            print_stderr(format_job_result(job_result))
+    finally:
+        # If pool is used
+        if pool is not None:
+            # Close pool
+            pool.close()
+
+            # Wait for workers to exit
+            pool.join()
+
+    # Get duration
+    duration = time_clock() - start_time
+
+    # Get total row count
+    row_count = sum(x['row_count'] or 0 for x in job_result_s)
+
+    # Get failed job results
+    failed_job_result_s = [x for x in job_result_s if x['exit_code'] != 0]
+
+    # Print message
+    print_stderr(
+        '{:20}{} job{}, {} failed, {} row{}, {:.3f}s, {:.0f} rows/s'.format(
+            'Jobs total:',
+            len(job_result_s),
+            '' if len(job_result_s) == 1 else 's',
+            len(failed_job_result_s),
+            row_count,
+            '' if row_count == 1 else 's',
+            duration,
+            row_count / duration if duration > 0 else 0))
+
+    # If any job failed
+    if failed_job_result_s:
+        # Return the first failed job's exit code
+        return failed_job_result_s[0]['exit_code']
+
+    # Return without error
+    return 0
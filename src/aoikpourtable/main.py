@@ -5,12 +5,24 @@ from __future__ import absolute_import
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from contextlib import contextmanager
-from datetime import datetime
+import importlib
 import sys
-import traceback
 
-from .aoikimportutil import load_obj
+from .checkpoint_util import checkpoint_read
+from .checkpoint_util import checkpoint_write
+from .error_util import get_stop_written_count
+from .error_util import output_bisect
+from .error_util import reject_context_factory
 from .print_util import print_stderr
+from .profile_util import parse_profile_window
+from .profile_util import profile_context_factory
+from .profile_util import profile_group_add
+from .progress_util import progress_context_factory
+from .timing_util import format_startup_info
+from .timing_util import format_timing_info
+from .timing_util import time_clock
+from .timing_util import timed_iter
+from .timing_util import timing_info_create
 
 
 #
@@ -63,6 +75,269 @@ def int_ge0(text):
     return int_value
 
 
+#
+def float_ge0(text):
+    """
+    ArgumentParser's type function that converts "text" to a float greater
+    than or equal to 0.
+
+    @param text: The text to convert to float.
+
+    @return: A float greater than or equal to 0.
+    """
+    try:
+        # Convert to float
+        float_value = float(text)
+
+        # Ensure greater than or equal to 0
+        assert float_value >= 0
+    except Exception:
+        # Raise an exception to notify ArgumentParser
+        raise ArgumentTypeError(
+            '"%s" is not a number greater than or equal to 0.' % text)
+
+    # Return the valid value
+    return float_value
+
+
+#
+def byte_size(text):
+    """
+    ArgumentParser's type function that converts "text" to a byte count
+    greater than 0. Suffix "K", "M" or "G" multiplies by 1024, 1024^2 or
+    1024^3.
+
+    @param text: The text to convert to byte count, e.g. "64M".
+
+    @return: A byte count greater than 0.
+    """
+    try:
+        # Map suffix to multiplier
+        multiplier = {
+            'K': 1024,
+            'M': 1024 ** 2,
+            'G': 1024 ** 3,
+        }.get(text[-1:].upper(), None)
+
+        # Convert to int
+        if multiplier is None:
+            int_value = int(text)
+        else:
+            int_value = int(float(text[:-1]) * multiplier)
+
+        # Ensure greater than 0
+        assert int_value > 0
+    except Exception:
+        # Raise an exception to notify ArgumentParser
+        raise ArgumentTypeError(
+            '"%s" is not a byte count greater than 0.' % text)
+
+    # Return the valid value
+    return int_value
+
+
+#
+def float_gt0_lt1(text):
+    """
+    ArgumentParser's type function that converts "text" to a float greater
+    than 0 and less than 1.
+
+    @param text: The text to convert to float.
+
+    @return: A float greater than 0 and less than 1.
+    """
+    try:
+        # Convert to float
+        float_value = float(text)
+
+        # Ensure greater than 0 and less than 1
+        assert 0 < float_value < 1
+    except Exception:
+        # Raise an exception to notify ArgumentParser
+        raise ArgumentTypeError(
+            '"%s" is not a number greater than 0 and less than 1.' % text)
+
+    # Return the valid value
+    return float_value
+
+
+#
+def parse_column_indices(text, arg_name):
+    """
+    Parse comma-separated 1-based column indices, e.g. "1,3".
+
+    @param text: Argument text.
+
+    @param arg_name: Argument name, used in error message.
+
+    @return: List of 0-based column indices.
+    """
+    # The column indices list
+    column_index_s = []
+
+    # For each index text
+    for column_index_text in text.strip().split(','):
+        try:
+            # Convert to int
+            column_index = int(column_index_text)
+
+            # Ensure greater than 0
+            assert column_index > 0
+        except Exception:
+            # Raise exception
+            raise ValueError(
+                '"{}" must be 1-based column indices: {}'.format(
+                    arg_name, text))
+
+        # Convert from 1-based to 0-based, and add to list
+        column_index_s.append(column_index - 1)
+
+    # Return the column indices list
+    return column_index_s
+
+
+#
+def output_item_type(key):
+    """
+    Create ArgumentParser's type function that tags an output argument value
+    with the output group key it sets.
+
+    @param key: Output group key, e.g. "uri".
+
+    @return: ArgumentParser's type function that returns a tuple of
+    (key, value).
+    """
+    # Create type function
+    def type_func(text):
+        # Return the tagged value
+        return (key, text)
+
+    # Return type function
+    return type_func
+
+
+#
+def get_output_groups(output_item_s):
+    """
+    Group output argument values into output groups.
+
+    Values are in command line order. A group ends when a key repeats, so
+    "--output=a --output-factory=x --output=b --output-factory=y" gives two
+    groups, and so does "--output-factory=x --output=a --output-factory=y
+    --output=b".
+
+    A later group that does not set the factory URI is another output of the
+    previous group's factory, so it takes the previous group's factory URI,
+    and its arguments and query unless it sets them. E.g.
+    "--output-factory=x --output=a --output=b" writes to "a" and "b" with
+    factory "x". If there are several groups, each must get a factory URI
+    this way, otherwise an output would silently go to the default empty
+    output.
+
+    @param output_item_s: List of (key, value) tuples. See
+    "output_item_type". None means no output arguments are given.
+
+    @return: Output group dicts list, in the format:
+    [
+        {
+            'uri': ...,
+            'args': ...,
+            'query': ...,
+            'factory_uri': ...,
+        },
+        ...
+    ]
+    """
+    # Output group dicts list
+    output_group_s = []
+
+    # For each key and value
+    for key, value in output_item_s or []:
+        # If no group is started, or the key is already set in current group
+        if not output_group_s or key in output_group_s[-1]:
+            # Start a new group
+            output_group_s.append({})
+
+        # Set the value in current group
+        output_group_s[-1][key] = value
+
+    # If no output arguments are given
+    if not output_group_s:
+        # Use one group with default values
+        output_group_s.append({})
+
+    # For each output group after the first
+    for group_index in range(1, len(output_group_s)):
+        # Get the output group
+        output_group = output_group_s[group_index]
+
+        # Get the previous output group
+        prev_output_group = output_group_s[group_index - 1]
+
+        # If the group does not set the factory URI
+        if 'factory_uri' not in output_group:
+            # For each key that goes with the factory
+            for key in ['factory_uri', 'args', 'query']:
+                # If the previous group has the key and this group not
+                if key in prev_output_group and key not in output_group:
+                    # Take the previous group's value
+                    output_group[key] = prev_output_group[key]
+
+    # If there are several groups
+    if len(output_group_s) > 1:
+        # For each output group
+        for group_index, output_group in enumerate(output_group_s):
+            # If the group has no factory URI
+            if 'factory_uri' not in output_group:
+                # Raise exception
+                raise ValueError((
+                    'Output {} ("{}") has no "--output-factory". Specify it'
+                    ' for each output, or for the first output to use it for'
+                    ' the outputs after.').format(
+                        group_index + 1, output_group.get('uri', '')))
+
+    # For each output group
+    for output_group in output_group_s:
+        # Set default values
+        output_group.setdefault('uri', '')
+
+        output_group.setdefault('args', '')
+
+        output_group.setdefault('query', '')
+
+        output_group.setdefault(
+            'factory_uri', 'aoikpourtable.empty_io::output_factory')
+
+    # Return output group dicts list
+    return output_group_s
+
+
+#
+def get_output_context(output_object):
+    """
+    Get output context from output object.
+
+    @param output_object: Output object, an output function or a context
+    object that yields an output function.
+
+    @return: Output context.
+    """
+    # If output object is a context object
+    if hasattr(output_object, '__enter__') \
+            and hasattr(output_object, '__exit__'):
+        # Use it as output context
+        return output_object
+
+    # Create a context factory
+    @contextmanager
+    def output_context_manager():
+        # Yield the output object as the output function
+        yield output_object
+
+    # Use the context factory to create an output context
+    return output_context_manager()
+
+
 #
 def get_arg_parser():
     """
@@ -111,29 +386,37 @@ def get_arg_parser():
         help='Set input factory URI.',
     )
 
+    # The output arguments below all append to "output_items" in command
+    # line order, so that repeating them gives multiple output groups.
+    # See "get_output_groups".
+
     #
     arg_parser.add_argument(
         '--output',
-        dest='output_uri',
-        default='',
+        dest='output_items',
+        action='append',
+        type=output_item_type('uri'),
         metavar='URI',
-        help='Set output URI to be passed to output factory',
+        help=('Set output URI to be passed to output factory. Repeat output'
+              ' arguments to send rows to multiple outputs.'),
     )
 
     #
     arg_parser.add_argument(
         '--output-args',
-        dest='output_args',
-        default='',
+        dest='output_items',
+        action='append',
+        type=output_item_type('args'),
         metavar='ARGS',
-        help='Set output arguments to be passed to input factory.',
+        help='Set output arguments to be passed to output factory.',
     )
 
     #
     arg_parser.add_argument(
         '--output-query',
-        dest='output_query',
-        default='',
+        dest='output_items',
+        action='append',
+        type=output_item_type('query'),
         metavar='QUERY',
         help='Set output query to be passed to output factory.',
     )
@@ -141,8 +424,9 @@ def get_arg_parser():
     #
     arg_parser.add_argument(
         '--output-factory',
-        dest='output_factory_uri',
-        default='aoikpourtable.empty_io::output_factory',
+        dest='output_items',
+        action='append',
+        type=output_item_type('factory_uri'),
         metavar='URI',
         help='Set output factory URI.',
     )
@@ -223,149 +507,654 @@ def get_arg_parser():
         help='Limit rows.',
     )
 
-    #
-    arg_parser.add_argument(
-        '--batch-size',
-        dest='batch_size',
-        type=int_gt0,
-        default=1000,
-        metavar='N',
-        help='Accumulate N rows for one batch of processing. Default is 1000.',
-    )
+    #
+    arg_parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        type=int_gt0,
+        default=1000,
+        metavar='N',
+        help='Accumulate N rows for one batch of processing. Default is 1000.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--reject-file',
+        dest='reject_file_path',
+        default=None,
+        metavar='PATH',
+        help=('Quarantine rows that fail in convert or output into this file'
+              ' as JSON lines, instead of aborting the program.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--max-errors',
+        dest='max_error_count',
+        type=int_ge0,
+        default=None,
+        metavar='N',
+        help=('Abort the program when more than N rows are quarantined.'
+              ' Default is no limit. Requires "--reject-file".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--checkpoint',
+        dest='checkpoint_file_path',
+        default=None,
+        metavar='FILE',
+        help=('Record the last committed row ordinal and input position into'
+              ' this file after each batch is output.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help=('Resume from the position recorded in the "--checkpoint" file.'
+              ' Start from the beginning if the file not exists.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--progress-interval',
+        dest='progress_interval',
+        type=float_ge0,
+        default=1.0,
+        metavar='SECONDS',
+        help=('Report progress at most once per SECONDS. 0 means report for'
+              ' each batch. Default is 1.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--progress-file',
+        dest='progress_file_spec',
+        default=None,
+        metavar='PATH',
+        help=('Write progress reports as JSON lines to this file.'
+              ' Use "fd:N" to write to inherited file descriptor N.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--timing',
+        dest='timing',
+        action='store_true',
+        help=('Measure time spent in input, convert and output stages, and'
+              ' print a breakdown at the end.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--profile',
+        dest='profile_file_path',
+        default=None,
+        metavar='FILE',
+        help=('Run under cProfile, write pstats to FILE and print a summary'
+              ' grouped by plugin module.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--profile-top',
+        dest='profile_top_n',
+        type=int_gt0,
+        default=20,
+        metavar='N',
+        help='List top N functions for each group in profile summary.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--profile-window',
+        dest='profile_window_text',
+        default=None,
+        metavar='START:END',
+        help=('Only profile from START to END seconds since data processing'
+              ' starts. END can be omitted.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--pushdown',
+        dest='pushdown_mode',
+        choices=['auto', 'on', 'off'],
+        default='off',
+        help=('Copy rows with server-side "INSERT ... SELECT" when input and'
+              ' output are db_io select and insert on the same database URI,'
+              ' without convert, reject file, checkpoint or timing. "auto"'
+              ' uses it when possible, "on" fails if not possible. Default'
+              ' is "off".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--binary-transport',
+        dest='binary_transport',
+        action='store_true',
+        help=('Pass raw encoded records from input to output without parsing'
+              ' and formatting fields. Requires input and output factories'
+              ' that support it with the same format, e.g. csv_io with the'
+              ' same CSV arguments, and no convert, only-columns or reject'
+              ' file.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--startup-time',
+        dest='startup_time',
+        action='store_true',
+        help=('Print time spent and number of modules loaded in each step'
+              ' before data processing starts.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--jobs',
+        dest='jobs_file_path',
+        default=None,
+        metavar='FILE',
+        help=('Run the pours listed in job manifest FILE, JSON or INI, in'
+              ' this process. Other arguments must be set for each job in'
+              ' the manifest.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--jobs-workers',
+        dest='jobs_worker_count',
+        type=int_gt0,
+        default=1,
+        metavar='N',
+        help='Run N jobs concurrently. Default is 1.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--jobs-pool',
+        dest='jobs_pool_kind',
+        choices=['thread', 'process'],
+        default='thread',
+        help=('Run jobs on a thread pool, sharing plugins and database'
+              ' engines, or on a process pool. Default is "thread".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--partitions',
+        dest='partition_count',
+        type=int_gt0,
+        default=1,
+        metavar='N',
+        help=('Split the pour across N worker processes, each writing to its'
+              ' own outputs. "{partition}" in arguments is replaced with the'
+              ' partition index, starting from 0. Rows are split into'
+              ' contiguous ranges if ending row is known, otherwise by row'
+              ' ordinal modulo N. Default is 1.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--partition-key',
+        dest='partition_key_text',
+        default=None,
+        metavar='M,N',
+        help=('Split rows across partitions by the hash of the given 1-based'
+              ' input columns, so that rows with the same key go to the same'
+              ' partition.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--sort-key',
+        dest='sort_key_text',
+        default=None,
+        metavar='M,N',
+        help=('Sort rows by the given 1-based columns of converted rows'
+              ' before output, using an external merge sort. Rows are output'
+              ' after all input rows are read.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--sort-run-rows',
+        dest='sort_run_row_count',
+        type=int_gt0,
+        default=100000,
+        metavar='N',
+        help=('Keep at most N rows in memory when sorting. More rows are'
+              ' spilled to sorted run files. Default is 100000.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--sort-temp-dir',
+        dest='sort_temp_dir',
+        default=None,
+        metavar='DIR',
+        help=('Directory for sorted run files. Default is the system temp'
+              ' directory.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--where',
+        dest='where_text',
+        default=None,
+        metavar='EXPR',
+        help=('Only process input rows matching filter expression EXPR, e.g.'
+              ' "$1 >= 100 and ($3 = \'CN\' or name is null)". Columns are'
+              ' 1-based "$N" or column names of database inputs. Database'
+              ' inputs apply it in the SELECT statement. Range arguments'
+              ' count matching rows only.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--dedup-key',
+        dest='dedup_key_text',
+        default=None,
+        metavar='M,N',
+        help=('Drop rows whose given 1-based columns of converted rows'
+              ' repeat the key of an earlier row.'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--dedup-mode',
+        dest='dedup_mode',
+        choices=['exact', 'bloom'],
+        default='exact',
+        help=('"exact" keeps 128-bit key digests, spilled to disk beyond'
+              ' "--dedup-memory". "bloom" uses a Bloom filter within'
+              ' "--dedup-memory", which may drop a new key at'
+              ' "--dedup-fp-rate". Default is "exact".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--dedup-memory',
+        dest='dedup_memory_size',
+        type=byte_size,
+        default=64 * 1048576,
+        metavar='SIZE',
+        help=('Memory budget for dedup keys, e.g. "512M". Default is'
+              ' "64M".'),
+    )
+
+    #
+    arg_parser.add_argument(
+        '--dedup-fp-rate',
+        dest='dedup_fp_rate',
+        type=float_gt0_lt1,
+        default=0.001,
+        metavar='RATE',
+        help='False-positive rate of "bloom" mode. Default is 0.001.',
+    )
+
+    #
+    arg_parser.add_argument(
+        '--dedup-temp-dir',
+        dest='dedup_temp_dir',
+        default=None,
+        metavar='DIR',
+        help=('Directory for spilled key digest files of "exact" mode.'
+              ' Default is the system temp directory.'),
+    )
+
+    # Return an "ArgumentParser" instance
+    return arg_parser
+
+
+# Cache of loaded factory objects.
+# Map tuple of (factory URI, module name) to a tuple of (module object,
+# attribute object).
+_FACTORY_CACHE = {}
+
+
+#
+def load_factory(uri, mod_name, retn_mod=False):
+    """
+    Load a factory object by URI.
+
+    Built-in "aoikpourtable.*::attr" URIs are imported by module name
+    directly. Other URIs, e.g. module file paths, go through "load_obj",
+    which is imported only when needed because it imports "urllib".
+
+    Loaded objects are cached by URI and module name, because the same
+    module file loaded as another module name is another module object.
+
+    @param uri: Factory URI, e.g. "aoikpourtable.csv_io::csv_input_factory".
+
+    @param mod_name: Module name to import a module file as. See "load_obj".
+
+    @param retn_mod: Whether to return the module object as well.
+
+    @return: The factory object, or a tuple of (module object, factory object)
+    if "retn_mod" is true.
+    """
+    # Get cache key
+    cache_key = (uri, mod_name)
+
+    # Get cached result
+    result = _FACTORY_CACHE.get(cache_key, None)
+
+    # If result is not cached
+    if result is None:
+        # Split URI into module URI and attribute chain
+        mod_uri, sep, attr_chain = uri.partition('::')
+
+        # If the URI is a built-in factory URI
+        if sep and mod_uri.startswith('aoikpourtable.') \
+                and not mod_uri.endswith('.py') and '/' not in mod_uri:
+            # Import module
+            mod_obj = importlib.import_module(mod_uri)
+
+            # Get attribute object
+            attr_obj = mod_obj
+
+            # For each attribute name in the chain
+            for attr_name in attr_chain.split('.'):
+                # Get attribute object
+                attr_obj = getattr(attr_obj, attr_name)
+
+        # If the URI is not a built-in factory URI
+        else:
+            # Import here because it is not needed for built-in factories.
+            # This saves startup time.
+            from .aoikimportutil import load_obj
+
+            # Load module object and attribute object
+            mod_obj, attr_obj = load_obj(
+                uri, mod_name=mod_name, retn_mod=True)
+
+        # Get result
+        result = (mod_obj, attr_obj)
+
+        # Add to cache
+        _FACTORY_CACHE[cache_key] = result
+
+    # If module object is needed
+    if retn_mod:
+        # Return module object and attribute object
+        return result
+
+    # Return attribute object
+    return result[1]
+
+
+#
+def decide_frac_len(value):
+    """
+    Decide a float value's fraction part's display width.
+
+    @param value: The float value.
+
+    @return: The float value's fraction part's display width.
+    """
+    # Decide fraction part's display width
+    if value == 0:
+        frac_len = 0
+    elif value < 0.001:
+        frac_len = 6
+    elif value < 0.01:
+        frac_len = 5
+    elif value < 0.1:
+        frac_len = 4
+    elif value < 1:
+        frac_len = 3
+    elif value < 10:
+        frac_len = 2
+    else:
+        frac_len = 0
+
+    # Return fraction part's display width
+    return frac_len
+
+
+#
+def format_total_msg(row_count, progress_info):
+    """
+    Format total message from final progress info.
+
+    @param row_count: Processed row count.
+
+    @param progress_info: Progress info dict. See
+    "progress_util.get_progress_info".
+
+    @return: Message.
+    """
+    # Get total rate
+    total_rate = progress_info['rate']
+
+    # Get past duration
+    past_dura = progress_info['past']
+
+    # Get past duration fraction width
+    past_dura_frac_len = decide_frac_len(past_dura)
+
+    # Get message format
+    msg_fmt = 'Total: {} row{}, {:.%sf}s' % (past_dura_frac_len, )
+
+    # Get message
+    msg = msg_fmt.format(
+        row_count,
+        '' if row_count <= 1 else 's',
+        past_dura)
+
+    # If total rate is not None
+    if total_rate is not None:
+        # Add total rate to message
+        msg += ', {:.0f} rows/s'.format(total_rate)
+    else:
+        # Add total rate to message
+        msg += ', ? rows/s'
+
+    # Return message
+    return msg
+
+
+#
+def get_pushdown_reason(
+        args, convert_func, checkpoint_file_path, partition_filter_func=None):
+    """
+    Get the reason why pushdown can not be used.
+
+    @param args: Parsed command arguments object.
+
+    @param convert_func: Convert function.
+
+    @param checkpoint_file_path: Checkpoint file path.
+
+    @param partition_filter_func: Partition filter function.
+
+    @return: Reason message, or None if pushdown can be used.
+    """
+    # If input and output factories are not db_io select and insert
+    if args.input_factory_uri != 'aoikpourtable.db_io::select_factory' \
+            or args.output_factory_uri != \
+            'aoikpourtable.db_io::insert_factory':
+        return 'input and output factories are not db_io select and insert.'
+
+    # If multiple outputs are specified
+    if len(args.output_groups) > 1:
+        return 'multiple outputs are specified.'
+
+    # If input and output URIs are not the same
+    if args.input_uri != args.output_uri:
+        return 'input and output URIs are not the same.'
+
+    # If input or output query is specified
+    if args.input_query or args.output_query:
+        return 'input or output query is specified.'
+
+    # If convert function is specified
+    if convert_func is not None:
+        return 'convert is specified.'
+
+    # If reject file is specified
+    if args.reject_file_path:
+        return 'reject file is specified.'
+
+    # If checkpoint file is specified
+    if checkpoint_file_path:
+        return 'checkpoint is specified.'
+
+    # If rows are partitioned by key or row ordinal
+    if partition_filter_func is not None:
+        return 'rows are partitioned by key or row ordinal.'
+
+    # If sort key is specified
+    if args.sort_key_text:
+        return 'sort key is specified.'
+
+    # If dedup key is specified
+    if args.dedup_key_text:
+        return 'dedup key is specified.'
+
+    # If filter expression is specified
+    if args.where_text:
+        return 'filter expression is specified.'
 
-    # Return an "ArgumentParser" instance
-    return arg_parser
+    # If timing is enabled.
+    # Stages are not separated on server side, so there is nothing to time.
+    if args.timing:
+        return 'timing is enabled.'
+
+    # Pushdown can be used
+    return None
 
 
 #
-def get_progress_info(
-        row_count,
-        last_row_count,
-        last_start_time,
-        total_row_count,
-        total_start_time):
+def pushdown_process(
+        pushdown_info,
+        start_row_index,
+        start_end_row_diff,
+        progress_ctx,
+        profile_ctx,
+        result_info=None):
     """
-    Get progress info.
+    Copy rows with pushdown function, one chunk at a time, reporting progress
+    after each chunk.
+
+    @param pushdown_info: Pushdown info dict. See
+    "db_io.pushdown_factory".
 
-    @param row_count: Processed rows count.
+    @param start_row_index: Starting row index. None means 0.
 
-    @param last_row_count: Last round processed rows count.
+    @param start_end_row_diff: Number of rows to copy. None means all.
 
-    @param last_start_time: Last round insert time.
+    @param progress_ctx: Progress context.
 
-    @param total_row_count: Total rows count.
+    @param profile_ctx: Profile context.
 
-    @param total_start_time: Total start time.
+    @param result_info: A dict to put copied row count in. See "main_core".
 
-    @return A tuple of 4 elements: (row_count, now_time, total_rate, msg):
-    "row_count": "last_row_count" of next call.
-    "now_time": "last_start_time" of next call.
-    "total_rate": Total processing rate.
-    "msg": Output message.
+    @return: Exit code.
     """
-    # Get current time
-    now_time = datetime.utcnow()
+    # Get chunk size. None means one chunk.
+    chunk_size = pushdown_info['chunk_size']
 
-    # Calculate duration spent this round
-    round_dura = (now_time - last_start_time).total_seconds()
+    # Get zero-based offset of the next chunk
+    offset = start_row_index or 0
 
-    # Calculate rows inserted this round
-    round_row_count = row_count - last_row_count
+    # Get number of rows left to copy. None means all.
+    left_row_count = start_end_row_diff
 
-    # If round duration is not zero
-    if round_dura:
-        # Calculate round rate
-        round_rate = round_row_count / round_dura
-    else:
-        # Set round rate to None
-        round_rate = None
+    # Copied row count
+    row_count = 0
 
-    # Calculate total duration
-    total_dura = (now_time - total_start_time).total_seconds()
+    #
+    with pushdown_info['pushdown_obj'] as pushdown_func, \
+            progress_ctx as progress_func, \
+            profile_ctx as profile_func:
+        # Repeat
+        while True:
+            # Get limit of the chunk
+            limit = chunk_size
+
+            # If number of rows left is limited
+            if left_row_count is not None:
+                # Limit to number of rows left
+                limit = left_row_count if limit is None \
+                    else min(limit, left_row_count)
+
+                # If no rows left
+                if limit == 0:
+                    # Stop
+                    break
 
-    # If total duration is not zero
-    if total_dura:
-        # Calculate total rate
-        total_rate = row_count / total_dura
-    else:
-        # Set total rate to None
-        total_rate = None
-
-    # If total row count and total rate are not zero
-    if total_row_count and total_rate:
-        # Calculate need duration
-        need_dura = \
-            (total_row_count - row_count) / total_rate
-    else:
-        # Set need duration to None
-        need_dura = None
+            # Copy the chunk
+            chunk_row_count = pushdown_func(offset, limit)
 
-    # Create message
-    msg = '+{} ={}'.format(
-        round_row_count,
-        row_count,
-        round_rate,
-        total_rate)
+            # If the database driver does not report copied row count.
+            # Pushdown function raises in this case if copying in chunks, so
+            # this is the only statement.
+            if chunk_row_count is None:
+                # Set copied row count unknown
+                row_count = None
 
-    # If total rate is not None
-    if total_rate is not None:
-        # Add total rate to message
-        msg += ' ={:.0f}/s'.format(total_rate)
+                # Stop
+                break
 
-    # If round rate is not None
-    if round_rate is not None:
-        # Add round rate to message
-        msg += ' +{:.0f}/s'.format(round_rate)
-    else:
-        # Add round rate to message
-        msg += ' +?/s'
+            # Add to copied row count
+            row_count += chunk_row_count
 
-    # Add total duration to message
-    msg = '{}, past {:.0f}s'.format(msg, total_dura)
+            # Move to next chunk
+            offset += chunk_row_count
 
-    # If need duration is not None
-    if need_dura is not None:
-        # Add need duration and total duration to message
-        msg = '{}, need {:.0f}s, total {:.0f}s'.format(
-            msg, need_dura, total_dura + need_dura)
+            # If number of rows left is limited
+            if left_row_count is not None:
+                # Deduct from number of rows left
+                left_row_count -= chunk_row_count
 
-    # Return information.
-    # "row_count" is "last_row_count" of next call.
-    # "now_time" is "last_start_time" of next call.
-    return row_count, now_time, total_rate, msg
+            # Report progress if it is time to
+            progress_func(row_count)
 
+            # If profile function is set
+            if profile_func is not None:
+                # Start or stop profiling according to profile window
+                profile_func()
 
-#
-def decide_frac_len(value):
-    """
-    Decide a float value's fraction part's display width.
+            # If all rows have been copied
+            if limit is None or chunk_row_count < limit:
+                # Stop
+                break
 
-    @param value: The float value.
+        # If copied row count is unknown
+        if row_count is None:
+            # Print message.
+            # Do not report progress with a made-up row count.
+            print_stderr(
+                'Total: ? rows, database driver does not report row count')
 
-    @return: The float value's fraction part's display width.
-    """
-    # Decide fraction part's display width
-    if value == 0:
-        frac_len = 0
-    elif value < 0.001:
-        frac_len = 6
-    elif value < 0.01:
-        frac_len = 5
-    elif value < 0.1:
-        frac_len = 4
-    elif value < 1:
-        frac_len = 3
-    elif value < 10:
-        frac_len = 2
-    else:
-        frac_len = 0
+        # If copied row count is known
+        else:
+            # Report final progress
+            progress_info = progress_func(row_count, is_final=True)
 
-    # Return fraction part's display width
-    return frac_len
+            # Print message
+            print_stderr(format_total_msg(row_count, progress_info))
+
+    # If result info dict is given
+    if result_info is not None:
+        # Put copied row count. None if unknown.
+        result_info['row_count'] = row_count
+
+    # Return without error
+    return 0
 
 
 #
-def main_core(args=None, step_info_set_func=None):
+def main_core(
+        args=None,
+        step_info_set_func=None,
+        step_time_s=None,
+        result_info=None,
+        partition_info=None):
     """
     The main function that implements the core functionality.
 
@@ -374,6 +1163,15 @@ def main_core(args=None, step_info_set_func=None):
     @param step_info_set_func: A function to set step information for the upper
     context.
 
+    @param step_time_s: List of (step title, time, loaded module count)
+    tuples recorded by "step_info_set_func", used for "--startup-time".
+
+    @param result_info: A dict to put processed row count in, under key
+    "row_count", e.g. for the job runner to report throughput.
+
+    @param partition_info: Partition info dict if running as a partition
+    process. See "partition_util.partitions_run".
+
     @return: Exit code.
     """
     # Ensure this argument is given
@@ -385,9 +1183,96 @@ def main_core(args=None, step_info_set_func=None):
     # Get arguments parser
     arg_parser = get_arg_parser()
 
+    # Keep command arguments list, used to start partition processes
+    args_list = args
+
     # Parse arguments
     args = arg_parser.parse_args(args)
 
+    # Get output groups
+    args.output_groups = get_output_groups(args.output_items)
+
+    # Get the first output group
+    output_group = args.output_groups[0]
+
+    # Set the first output group's values as single output arguments, used
+    # where only one output is supported, e.g. pushdown and checkpoint
+    args.output_uri = output_group['uri']
+
+    args.output_args = output_group['args']
+
+    args.output_query = output_group['query']
+
+    args.output_factory_uri = output_group['factory_uri']
+
+    # If job manifest file is specified
+    if args.jobs_file_path:
+        # Set step info
+        step_info_set_func(title='Run jobs')
+
+        # Get default arguments
+        default_args = arg_parser.parse_args([])
+
+        # For each argument definition
+        for action in arg_parser._actions:
+            # Get argument name
+            dest = action.dest
+
+            # If the argument is not a job runner argument, and is given
+            if not dest.startswith('jobs_') and dest != 'help' \
+                    and getattr(args, dest) != getattr(default_args, dest):
+                # Raise exception, because it would be ignored
+                raise ValueError((
+                    '"{}" can not be used with "--jobs". Set it for each job'
+                    ' in the manifest.').format(action.option_strings[0]))
+
+        # Import here because it is needed only in job runner mode
+        from .job_util import jobs_read
+        from .job_util import jobs_run
+
+        # Read jobs
+        job_info_s = jobs_read(args.jobs_file_path)
+
+        # Run jobs
+        return jobs_run(
+            job_info_s,
+            worker_count=args.jobs_worker_count,
+            pool_kind=args.jobs_pool_kind)
+
+    # Set step info
+    step_info_set_func(title='Get profile context')
+
+    # Map plugin module file path to group name, used for profile summary
+    profile_group_map = {}
+
+    # If profile file path is specified
+    if args.profile_file_path:
+        # Get profile window
+        if args.profile_window_text:
+            profile_window = parse_profile_window(args.profile_window_text)
+        else:
+            profile_window = None
+
+        # Create profile context.
+        # If window is not given, profiling starts when the context is
+        # entered.
+        profile_ctx = profile_context_factory(
+            args.profile_file_path,
+            top_n=args.profile_top_n,
+            window=profile_window,
+            group_map=profile_group_map)
+
+    # If profile file path is not specified
+    else:
+        # Create a context factory
+        @contextmanager
+        def profile_context_manager():
+            # Yield None as the profile function
+            yield None
+
+        # Use the context factory to create a profile context
+        profile_ctx = profile_context_manager()
+
     # Set step info
     step_info_set_func(title='Get starting row index')
 
@@ -459,6 +1344,205 @@ def main_core(args=None, step_info_set_func=None):
         # Set ending row ordinal to None
         end_row_ordinal = None
 
+    # If the pour is to be split across partition processes, and this is not
+    # a partition process
+    if args.partition_count > 1 and partition_info is None:
+        # Set step info
+        step_info_set_func(title='Run partitions')
+
+        # Import here because it is needed only in partition mode.
+        # This saves startup time.
+        from .partition_util import check_partition_io
+        from .partition_util import PARTITION_PLACEHOLDER
+        from .partition_util import partitions_run
+        from .partition_util import split_range
+
+        # Ensure partitions can share the input and outputs
+        check_partition_io(args.input_factory_uri, args.output_groups)
+
+        # For each file that partitions can not share
+        for file_path, arg_name in [
+            (args.checkpoint_file_path, '--checkpoint'),
+            (args.reject_file_path, '--reject-file'),
+        ]:
+            # If the file path has no partition placeholder
+            if file_path and PARTITION_PLACEHOLDER not in file_path:
+                # Raise exception
+                raise ValueError(
+                    '"{}" requires "{}" in the path when using'
+                    ' "--partitions".'.format(arg_name, PARTITION_PLACEHOLDER))
+
+        # Get partition count
+        partition_count = args.partition_count
+
+        # Key column indices
+        key_index_s = None
+
+        # Row ranges, one for each partition
+        range_s = None
+
+        # Total row count of all partitions. None if unknown.
+        total_row_count = None
+
+        # If partition key is specified
+        if args.partition_key_text:
+            # If binary transport is enabled
+            if args.binary_transport:
+                # Raise exception, because key columns can not be read from
+                # raw records
+                raise ValueError(
+                    '"--partition-key" can not be used with'
+                    ' "--binary-transport".')
+
+            # Get key column indices
+            key_index_s = parse_column_indices(
+                args.partition_key_text, '--partition-key')
+
+            # Use key mode
+            partition_mode = 'key'
+
+        # If partition key is not specified
+        else:
+            # If ending row index is not specified but total row count is
+            # given as an integer
+            if end_row_index is None and args.count_factory_uri \
+                    and args.count_factory_uri.isdigit():
+                # Use total row count as ending row index
+                end_row_index = int(args.count_factory_uri)
+
+            # If ending row index is known
+            if end_row_index is not None:
+                # Get starting row index
+                range_start = start_row_index or 0
+
+                # Split rows into contiguous ranges, so that each partition
+                # reads only its own range if the input supports range control
+                range_s = split_range(
+                    range_start, end_row_index, partition_count)
+
+                # Get total row count
+                total_row_count = max(end_row_index - range_start, 0)
+
+                # Use range mode
+                partition_mode = 'range'
+
+            # If ending row index is not known
+            else:
+                # Use ordinal mode
+                partition_mode = 'ordinal'
+
+        # If dedup key is specified
+        if args.dedup_key_text:
+            # If partition key is not specified, or has a column not in the
+            # dedup key. Each partition deduplicates on its own, so rows with
+            # the same dedup key must go to the same partition.
+            if key_index_s is None or not set(key_index_s).issubset(
+                    parse_column_indices(args.dedup_key_text, '--dedup-key')):
+                # Raise exception
+                raise ValueError(
+                    '"--dedup-key" requires "--partition-key" with only'
+                    ' columns of the dedup key when using "--partitions".')
+
+        # Get command arguments list
+        partition_argv = list(sys.argv[1:] if args_list is None else args_list)
+
+        # Create progress context for all partitions
+        progress_ctx = progress_context_factory(
+            total_row_count,
+            interval=args.progress_interval,
+            progress_file_spec=args.progress_file_spec)
+
+        # Run partitions
+        partitions_result = partitions_run(
+            partition_argv,
+            partition_count,
+            partition_mode,
+            key_index_s=key_index_s,
+            range_s=range_s,
+            progress_ctx=progress_ctx,
+            interval=args.progress_interval)
+
+        # Get processed row count of all partitions
+        row_count = partitions_result['row_count']
+
+        # Print message
+        print_stderr(format_total_msg(
+            row_count, partitions_result['progress_info']))
+
+        # If result info dict is given
+        if result_info is not None:
+            # Put processed row count
+            result_info['row_count'] = row_count
+
+        # Return exit code
+        return partitions_result['exit_code']
+
+    # Set step info
+    step_info_set_func(title='Read checkpoint')
+
+    # Get checkpoint file path
+    checkpoint_file_path = args.checkpoint_file_path
+
+    # Input position to resume from
+    resume_position = None
+
+    # Whether the program resumes from a checkpoint
+    is_resume = False
+
+    # If resume is specified
+    if args.resume:
+        # If checkpoint file path is not specified
+        if not checkpoint_file_path:
+            # Raise exception
+            raise ValueError('"--resume" requires "--checkpoint".')
+
+        # Read checkpoint info dict
+        checkpoint_info = checkpoint_read(checkpoint_file_path)
+
+        # If checkpoint file exists
+        if checkpoint_info is not None:
+            # For each URI recorded in the checkpoint
+            for uri_key, uri_value, arg_name in [
+                ('input_uri', args.input_uri, '--input'),
+                ('output_uri', args.output_uri, '--output'),
+            ]:
+                # If the checkpoint was written by another pour
+                if checkpoint_info.get(uri_key, None) != uri_value:
+                    # Raise exception
+                    raise ValueError((
+                        'Checkpoint file "{}" was written for {} "{}", not'
+                        ' "{}".').format(
+                            checkpoint_file_path,
+                            arg_name,
+                            checkpoint_info.get(uri_key, None),
+                            uri_value))
+
+            # Set the flag
+            is_resume = True
+
+            # Get the last committed row ordinal.
+            # The next row's index is equal to it.
+            start_row_index = checkpoint_info['ordinal']
+
+            # If ending row index is specified and is exceeded
+            if end_row_index is not None and start_row_index > end_row_index:
+                # Use starting row index as ending row index, which means
+                # nothing left to do
+                end_row_index = start_row_index
+
+                # Set ending row ordinal
+                end_row_ordinal = end_row_index + 1
+
+            # Set starting row ordinal
+            start_row_ordinal = start_row_index + 1
+
+            # Get input position
+            resume_position = checkpoint_info.get('position', None)
+
+            # Print message
+            print_stderr('{:20}row {}, position {}'.format(
+                'Resume:', start_row_index, resume_position))
+
     # Set step info
     step_info_set_func(title='Get starting ending row index difference')
 
@@ -497,8 +1581,25 @@ def main_core(args=None, step_info_set_func=None):
         'end_row_ordinal': end_row_ordinal,
         'start_end_row_diff': start_end_row_diff,
         'batch_size': batch_size,
+        'checkpoint_file_path': checkpoint_file_path,
+        'is_resume': is_resume,
+        'resume_position': resume_position,
+        'reject_file_path': args.reject_file_path,
     }
 
+    # Set step info
+    step_info_set_func(title='Parse filter expression')
+
+    # If filter expression is specified
+    if args.where_text:
+        # Import here because it is needed only when filtering.
+        # This saves startup time.
+        from .where_util import parse_where
+
+        # Parse filter expression, to be applied by input factories that
+        # support it
+        cmd_args['where'] = parse_where(args.where_text)
+
     # Set step info
     step_info_set_func(title='Get only columns')
 
@@ -537,9 +1638,12 @@ def main_core(args=None, step_info_set_func=None):
     convert_factory_uri = args.convert_factory_uri
 
     # Get convert factory
-    convert_mod, convert_factory = load_obj(
+    convert_mod, convert_factory = load_factory(
         convert_factory_uri, mod_name='aoikpourtable._convert', retn_mod=True)
 
+    # Add module to profile groups
+    profile_group_add(profile_group_map, 'convert', convert_mod)
+
     # Set step info
     step_info_set_func(title='Get convert function')
 
@@ -566,6 +1670,136 @@ def main_core(args=None, step_info_set_func=None):
     else:
         pass
 
+    # Set step info
+    step_info_set_func(title='Get partition filter')
+
+    # If this is a partition process
+    if partition_info is not None:
+        # Import here because it is needed only in partition mode.
+        # This saves startup time.
+        from .partition_util import partition_filter_create
+
+        # Get partition filter function. None if rows are not filtered.
+        partition_filter_func = partition_filter_create(partition_info)
+
+    # If this is not a partition process
+    else:
+        # Rows are not filtered
+        partition_filter_func = None
+
+    # Set step info
+    step_info_set_func(title='Get pushdown')
+
+    # Get pushdown mode
+    pushdown_mode = args.pushdown_mode
+
+    # Pushdown info dict. None if pushdown is not used.
+    pushdown_info = None
+
+    # If pushdown is not disabled
+    if pushdown_mode != 'off':
+        # Get the reason why pushdown can not be used
+        pushdown_reason = get_pushdown_reason(
+            args, convert_func, checkpoint_file_path, partition_filter_func)
+
+        # If pushdown can be used
+        if pushdown_reason is None:
+            # Get pushdown factory
+            pushdown_factory = load_factory(
+                'aoikpourtable.db_io::pushdown_factory',
+                mod_name='aoikpourtable._pushdown')
+
+            # Call pushdown factory
+            pushdown_info = pushdown_factory(
+                args.input_uri,
+                args.input_args,
+                args.output_uri,
+                args.output_args,
+                only_column_index_s,
+                cmd_args=cmd_args)
+
+            # If pushdown factory does not support the arguments
+            if pushdown_info is None:
+                # Set reason
+                pushdown_reason = 'input arguments are not supported.'
+
+        # If pushdown is required but can not be used
+        if pushdown_mode == 'on' and pushdown_info is None:
+            # Raise exception
+            raise ValueError(
+                '"--pushdown=on" can not be used because {}'.format(
+                    pushdown_reason))
+
+        # If pushdown is not used
+        if pushdown_info is None:
+            # Print message, so that it is clear why rows move through the
+            # client
+            print_stderr('{:20}not used, because {}'.format(
+                'Pushdown:', pushdown_reason))
+
+    # If pushdown is used
+    if pushdown_info is not None:
+        # Get chunk size
+        chunk_size = pushdown_info['chunk_size']
+
+        # Print message
+        print_stderr('{:20}{}, because input and output are on the same'
+                     ' database'.format(
+                         'Pushdown:',
+                         'chunks of {} rows'.format(chunk_size) if chunk_size
+                         else 'one statement'))
+
+        # If count factory is specified
+        if args.count_factory_uri:
+            # Print message.
+            # Total row count is known only from range arguments.
+            print_stderr('{:20}{}'.format(
+                'Pushdown:', 'count factory is not used'))
+
+        # Set step info
+        step_info_set_func(title='Process data')
+
+        # If startup time is to be printed
+        if args.startup_time:
+            # For each startup message
+            for msg in format_startup_info(step_time_s or []):
+                # Print message
+                print_stderr(msg)
+
+        # Create progress context.
+        # Total row count is known only if ending row is specified.
+        progress_ctx = progress_context_factory(
+            start_end_row_diff,
+            interval=args.progress_interval,
+            progress_file_spec=args.progress_file_spec)
+
+        # Copy rows on server side
+        return pushdown_process(
+            pushdown_info,
+            start_row_index=start_row_index,
+            start_end_row_diff=start_end_row_diff,
+            progress_ctx=progress_ctx,
+            profile_ctx=profile_ctx,
+            result_info=result_info)
+
+    # Set step info
+    step_info_set_func(title='Get binary transport')
+
+    # If binary transport is enabled
+    if args.binary_transport:
+        # If rows need to be parsed
+        if only_column_index_s or convert_func is not None \
+                or args.reject_file_path or args.sort_key_text \
+                or args.dedup_key_text or args.where_text:
+            # Raise exception
+            raise ValueError(
+                '"--binary-transport" can not be used with convert,'
+                ' only-columns, reject file, sort key, dedup key or'
+                ' filter expression.')
+
+        # Tell factories to pass raw records
+        cmd_args['binary_transport'] = True
+
     # Set step info
     step_info_set_func(title='Get input factory')
 
@@ -576,9 +1810,12 @@ def main_core(args=None, step_info_set_func=None):
     input_factory_uri = args.input_factory_uri
 
     # Get input factory
-    input_mod, input_factory = load_obj(
+    input_mod, input_factory = load_factory(
         input_factory_uri, mod_name='aoikpourtable._input', retn_mod=True)
 
+    # Add module to profile groups
+    profile_group_add(profile_group_map, 'input', input_mod)
+
     # Get input arguments
     input_args = args.input_args
 
@@ -595,6 +1832,20 @@ def main_core(args=None, step_info_set_func=None):
     # Whether range control is enabled at 3NWP4.
     enable_range_control = True
 
+    # Function that returns input-specific position after the last row read,
+    # used for checkpoint.
+    position_func = None
+
+    # Ordinal of the first row yielded by the input object
+    first_row_ordinal = 1
+
+    # Format of raw records yielded by the input object, if binary transport
+    # is used
+    input_binary_format = None
+
+    # Total row count given by the input factory, e.g. read from a header
+    input_row_count = None
+
     # If input object is a dict instance
     if isinstance(input_obj, dict):
         # Get the info dict
@@ -608,6 +1859,77 @@ def main_core(args=None, step_info_set_func=None):
         enable_range_control = not input_factory_info.get(
             'support_range_control', False)
 
+        # Get position function
+        position_func = input_factory_info.get('position_func', None)
+
+        # If the input factory has done range control
+        if not enable_range_control and start_row_ordinal:
+            # The first row is the starting row
+            first_row_ordinal = start_row_ordinal
+
+        # Get ordinal of the first row, e.g. when the input factory has
+        # jumped to the resume position
+        first_row_ordinal = input_factory_info.get(
+            'first_row_ordinal', first_row_ordinal)
+
+        # Get format of raw records
+        input_binary_format = input_factory_info.get('binary_format', None)
+
+        # Get total row count given by the input factory
+        input_row_count = input_factory_info.get('count', None)
+
+        # Get whether the input factory has applied filter expression
+        is_where_done = input_factory_info.get('support_where', False)
+
+        # Get input column names
+        input_column_name_s = input_factory_info.get('column_names', None)
+
+    # If input object is not a dict instance
+    else:
+        # Filter expression has not been applied
+        is_where_done = False
+
+        # Input column names are unknown
+        input_column_name_s = None
+
+    # Set step info
+    step_info_set_func(title='Get filter function')
+
+    # Batch filter function. None if rows are not filtered here.
+    where_batch_func = None
+
+    # Row filter function. None if rows are not filtered here.
+    where_row_func = None
+
+    # If filter expression is given and the input factory has not applied it
+    if 'where' in cmd_args and not is_where_done:
+        # If the input factory has done range control, which would count
+        # rows not matching
+        if not enable_range_control and (
+                start_row_index or end_row_index is not None):
+            # Raise exception
+            raise ValueError(
+                'Input factory does range control without "--where" support,'
+                ' so "--where" can not be used with range arguments.')
+
+        # Import here because it is needed only when filtering.
+        # This saves startup time.
+        from .where_util import compile_where
+        from .where_util import resolve_where_columns
+        from .where_util import where_filter_iter
+
+        # Compile filter expression
+        where_func_info = compile_where(resolve_where_columns(
+            cmd_args['where'], input_column_name_s))
+
+        # Get filter functions
+        where_batch_func = where_func_info['batch_func']
+
+        where_row_func = where_func_info['row_func']
+
+        # Print message
+        print_stderr('{:20}{}'.format('Filter:', args.where_text))
+
     # Set step info
     step_info_set_func(title='Get input context')
 
@@ -636,8 +1958,16 @@ def main_core(args=None, step_info_set_func=None):
 
     # If count factory URI is not specified
     if count_factory_uri is None:
-        # Set total row count to None
-        total_row_count = None
+        # Use total row count given by the input factory, if any
+        total_row_count = input_row_count
+
+        # If total row count is given by the input factory
+        if total_row_count is not None:
+            # Print message
+            print_stderr('{:20}{} row{}, from input'.format(
+                'Count:',
+                total_row_count,
+                '' if total_row_count == 1 else 's'))
 
     # If count factory URI is an integer
     elif count_factory_uri.isdigit():
@@ -656,9 +1986,12 @@ def main_core(args=None, step_info_set_func=None):
         count_args = args.count_args
 
         # Get count factory
-        count_mod, count_factory = load_obj(
+        count_mod, count_factory = load_factory(
             count_factory_uri, mod_name='aoikpourtable._count', retn_mod=True)
 
+        # Add module to profile groups
+        profile_group_add(profile_group_map, 'count', count_mod)
+
         # Get count function
         count_func = count_factory(
             input_uri,
@@ -738,81 +2071,347 @@ def main_core(args=None, step_info_set_func=None):
         # Ensure total row count is > 0
         assert total_row_count > 0, total_row_count
 
-    # Set step info
-    step_info_set_func(title='Get output factory')
+    # Output contexts list, one for each output group
+    output_ctx_s = []
+
+    # For each output group
+    for output_group in args.output_groups:
+        # Set step info
+        step_info_set_func(title='Get output factory')
+
+        # Get output factory
+        output_mod, output_factory = load_factory(
+            output_group['factory_uri'],
+            mod_name='aoikpourtable._output',
+            retn_mod=True)
+
+        # Add module to profile groups
+        profile_group_add(profile_group_map, 'output', output_mod)
 
-    # Get output factory URI
-    output_factory_uri = args.output_factory_uri
+        # Set step info
+        step_info_set_func(title='Get output object')
 
-    # Get output factory
-    output_mod, output_factory = load_obj(
-        output_factory_uri, mod_name='aoikpourtable._output', retn_mod=True)
+        # Get output object
+        output_object = output_factory(
+            output_group['uri'],
+            output_group['query'],
+            args=output_group['args'],
+            cmd_args=cmd_args)
+
+        # Format of raw records accepted by the output object, if binary
+        # transport is used
+        output_binary_format = None
+
+        # If output object is a dict instance
+        if isinstance(output_object, dict):
+            # Get the info dict
+            output_factory_info = output_object
+
+            # Get the output object
+            output_object = output_factory_info['output_obj']
+
+            # Get format of raw records
+            output_binary_format = output_factory_info.get(
+                'binary_format', None)
+
+        # If binary transport is enabled
+        if args.binary_transport:
+            # If input or output does not support binary transport, or their
+            # formats differ
+            if input_binary_format is None \
+                    or input_binary_format != output_binary_format:
+                # Raise exception
+                raise ValueError(
+                    '"--binary-transport" requires input and output'
+                    ' factories that support it with the same format.\n'
+                    'Input format: {}\nOutput format: {}'.format(
+                        input_binary_format, output_binary_format))
+
+        # Set step info
+        step_info_set_func(title='Get output context')
+
+        # Add output context
+        output_ctx_s.append(get_output_context(output_object))
+
+    # If binary transport is enabled
+    if args.binary_transport:
+        # Print message
+        print_stderr('{:20}{}'.format('Binary transport:', 'on'))
+
+    # Function that waits until outputs finish queued batches. None if
+    # there is only one output.
+    output_wait_func = None
+
+    # If there is only one output
+    if len(output_ctx_s) == 1:
+        # Use its output context
+        output_ctx = output_ctx_s[0]
+
+    # If there are multiple outputs
+    else:
+        # Import here because it is needed only for multiple outputs
+        from .fanout_util import fanout_create
+
+        # Create fan-out context that sends each batch to all outputs
+        fanout_info = fanout_create(output_ctx_s)
 
-    # Get output arguments
-    output_args = args.output_args
+        # Use fan-out context as output context
+        output_ctx = fanout_info['output_ctx']
 
-    # Get output query
-    output_query = args.output_query
+        # Get wait function
+        output_wait_func = fanout_info['wait_func']
+
+        # Print message
+        print_stderr('{:20}{} outputs'.format('Fan-out:', len(output_ctx_s)))
 
     # Set step info
-    step_info_set_func(title='Get output object')
+    step_info_set_func(title='Get reject context')
+
+    # Get reject file path
+    reject_file_path = args.reject_file_path
+
+    # Get maximum error count
+    max_error_count = args.max_error_count
+
+    # If reject file path is specified
+    if reject_file_path:
+        # Print message
+        print_stderr('{:20}{}'.format('Reject file:', reject_file_path))
+
+        # Create reject context
+        reject_ctx = reject_context_factory(
+            reject_file_path, max_error_count=max_error_count)
+
+    # If reject file path is not specified
+    else:
+        # If maximum error count is specified
+        if max_error_count is not None:
+            # Raise exception
+            raise ValueError('"--max-errors" requires "--reject-file".')
+
+        # Create a context factory
+        @contextmanager
+        def reject_context_manager():
+            # Yield None as the reject function
+            yield None
 
-    # Get output object
-    output_object = output_factory(
-        args.output_uri, output_query, args=output_args, cmd_args=cmd_args)
+        # Use the context factory to create a reject context
+        reject_ctx = reject_context_manager()
 
     # Set step info
-    step_info_set_func(title='Get output context')
+    step_info_set_func(title='Get sort context')
+
+    # If sort key is specified
+    if args.sort_key_text:
+        # If checkpoint file path is specified
+        if checkpoint_file_path:
+            # Raise exception, because rows are output only after all input
+            # rows are read
+            raise ValueError('"--sort-key" can not be used with checkpoint.')
+
+        # Import here because it is needed only when sorting.
+        # This saves startup time.
+        from .sort_util import sort_context_factory
+
+        # Create sort context
+        sort_ctx = sort_context_factory(
+            parse_column_indices(args.sort_key_text, '--sort-key'),
+            args.sort_run_row_count,
+            temp_dir=args.sort_temp_dir)
+
+    # If sort key is not specified
+    else:
+        # Create a context factory
+        @contextmanager
+        def sort_context_manager():
+            # Yield None as the sorter
+            yield None
 
-    # If output object is a context object
-    if hasattr(output_object, '__enter__') \
-            and hasattr(output_object, '__exit__'):
-        # Use it as output context
-        output_ctx = output_object
+        # Use the context factory to create a sort context
+        sort_ctx = sort_context_manager()
 
-    # If output object is not a context object
+    # Set step info
+    step_info_set_func(title='Get dedup context')
+
+    # If dedup key is specified
+    if args.dedup_key_text:
+        # If checkpoint file path is specified
+        if checkpoint_file_path:
+            # Raise exception, because seen keys are not saved in the
+            # checkpoint, so a resumed pour would output keys again
+            raise ValueError(
+                '"--dedup-key" can not be used with checkpoint.')
+
+        # Import here because it is needed only when deduplicating.
+        # This saves startup time.
+        from .dedup_util import dedup_context_factory
+
+        # Create dedup context
+        dedup_ctx = dedup_context_factory(
+            parse_column_indices(args.dedup_key_text, '--dedup-key'),
+            mode=args.dedup_mode,
+            memory_size=args.dedup_memory_size,
+            fp_rate=args.dedup_fp_rate,
+            expected_count=total_row_count,
+            temp_dir=args.dedup_temp_dir)
+
+    # If dedup key is not specified
     else:
         # Create a context factory
         @contextmanager
-        def output_context_manager():
-            # Yield the output object as the output function
-            yield output_object
+        def dedup_context_manager():
+            # Yield None as the dedup function
+            yield None
 
-        # Use the context factory to create an output context
-        output_ctx = output_context_manager()
+        # Use the context factory to create a dedup context
+        dedup_ctx = dedup_context_manager()
 
     # Set step info
     step_info_set_func(title='Process data')
 
+    # If startup time is to be printed
+    if args.startup_time:
+        # For each startup message
+        for msg in format_startup_info(step_time_s or []):
+            # Print message
+            print_stderr(msg)
+
     # Current row ordinal
-    row_ordinal = 0
+    row_ordinal = first_row_ordinal - 1
 
     # Processed row count
     row_count = 0
 
-    # Last batch processed row count
-    last_row_count = 0
+    # Timing info dict. None if timing is not enabled.
+    timing_info = timing_info_create() if args.timing else None
 
-    # Starting time
-    total_start_time = datetime.utcnow()
+    # If this is a partition process
+    if partition_info is not None:
+        # Import here because it is needed only in partition mode.
+        # This saves startup time.
+        from .partition_util import partition_progress_context_factory
 
-    # Last batch starting time
-    last_start_time = total_start_time
+        # Create progress context that sends progress to the parent process
+        progress_ctx = partition_progress_context_factory(
+            partition_info, total_row_count)
 
-    # Total processing rate
-    total_rate = None
+    # If this is not a partition process
+    else:
+        # Create progress context
+        progress_ctx = progress_context_factory(
+            total_row_count,
+            interval=args.progress_interval,
+            progress_file_spec=args.progress_file_spec,
+            timing_info=timing_info)
 
     # Input object returns None to mean "ignore current row".
     IGNORE_OBJ = None
 
-    # Input object returns None.__class__ to mean "stop processing"
+    # Input object or output function returns None.__class__ to mean "stop
+    # processing"
     STOP_OBJ = None.__class__
 
+    # Whether the loop stops because ending row ordinal is reached
+    is_range_end = False
+
+    # Whether the loop stops because output function asks to stop
+    is_output_stop = False
+
+    # Create checkpoint function
+    def checkpoint_func(row_ordinal, position):
+        # Write checkpoint info dict
+        checkpoint_write(checkpoint_file_path, {
+            'ordinal': row_ordinal,
+            'position': position,
+            'input_uri': input_uri,
+            'output_uri': args.output_uri,
+        })
+
+    # Create function that outputs rows
+    def output_rows(row_s, row_ordinal_s):
+        # If there are multiple outputs
+        if output_wait_func is not None:
+            # Send the rows to the fan-out workers, which bisect for each
+            # output
+            return output_func(row_s, row_ordinal_s, reject_func)
+
+        # Output the rows
+        return output_bisect(output_func, row_s, row_ordinal_s, reject_func)
+
+    # Sorter state dict.
+    # Use a dict so that the function below can update it.
+    sort_state = {
+        # Number of rows added to the sorter
+        'row_count': 0,
+    }
+
+    # Create batch output function
+    def output_batch(row_s, row_ordinal_s, is_sorted=False):
+        # If rows are to be sorted, and the rows are not from the sorter
+        if sorter is not None and not is_sorted:
+            # Add the rows to the sorter
+            sorter['add_func'](row_s, row_ordinal_s)
+
+            # Add to number of rows added to the sorter
+            sort_state['row_count'] += len(row_s)
+
+            # Return None
+            return None
+
+        # If timing is not enabled
+        if timing_info is None:
+            # Output the rows
+            return output_rows(row_s, row_ordinal_s)
+
+        # If timing is enabled
+        else:
+            # Get starting time
+            output_start_time = time_clock()
+
+            # Output the rows
+            output_result = output_rows(row_s, row_ordinal_s)
+
+            # Get time spent
+            output_dura = time_clock() - output_start_time
+
+            # Add time spent
+            timing_info['output'] += output_dura
+
+            # Add batch output duration
+            timing_info['output_duras'].append(output_dura)
+
+            # Return the output function's return value
+            return output_result
+
     #
-    with input_ctx as input_iter, output_ctx as output_func:
+    with input_ctx as input_iter, output_ctx as output_func, \
+            reject_ctx as reject_func, progress_ctx as progress_func, \
+            profile_ctx as profile_func, sort_ctx as sorter, \
+            dedup_ctx as dedup_func:
         # Rows accumulated for one batch
         row_s = []
 
+        # Row ordinals accumulated for one batch, used to report rejected
+        # rows. None if reject function is not set.
+        row_ordinal_s = [] if reject_func is not None else None
+
+        # If rows are filtered here
+        if where_batch_func is not None:
+            # If input position is used for checkpoint
+            if position_func is not None:
+                # Test rows one by one, so that input position is right
+                # after the last row yielded
+                input_iter = (x for x in input_iter if where_row_func(x))
+            else:
+                # Test rows in chunks of batch size
+                input_iter = where_filter_iter(
+                    input_iter, where_batch_func, batch_size)
+
+        # If timing is enabled
+        if timing_info is not None:
+            # Wrap input iterator to measure time spent in input
+            input_iter = timed_iter(input_iter, timing_info)
+
         # For each row in the input iterator
         for row in input_iter:
             # Get the current row ordinal
@@ -832,56 +2431,93 @@ def main_core(args=None, step_info_set_func=None):
                 # If the current row ordinal is greater than or equal to
                 # ending row ordinal.
                 if end_row_ordinal and row_ordinal >= end_row_ordinal:
+                    # Set the flag
+                    is_range_end = True
+
                     # Stop processing
                     break
 
-            # Increment batch row count
-            row_count += 1
-
-            # If only-column indices are specified
-            if only_column_index_s:
-                # The new row
-                new_row = []
-
-                # Extract columns from the old row
-                for only_column_index in only_column_index_s:
-                    new_row.append(row[only_column_index])
-
-                # Override the old row
-                row = new_row
-
-            # If convert function is a list
-            if convert_func_is_list:
-                # The new row
-                new_row = []
-
-                # For each field in the row
-                for field_index, field in enumerate(row):
-                    # Get field convert function
-                    filed_func = convert_func[field_index]
-
-                    # If field convert function is None
-                    if not filed_func:
-                        # Add the field to new row
-                        new_row.append(field)
-                    # If field convert function is not None
-                    else:
-                        # Convert the field
-                        new_field = filed_func(field)
-
-                        # Add the field to new row
-                        new_row.append(new_field)
+            # If rows are partitioned and the row maps to another partition
+            if partition_filter_func is not None \
+                    and not partition_filter_func(row_ordinal, row):
+                # Ignore the current row
+                continue
 
-                # Override the old row
-                row = new_row
+            # Keep the input row for reject report
+            input_row = row
+
+            # If timing is enabled
+            if timing_info is not None:
+                # Get starting time
+                convert_start_time = time_clock()
+
+            try:
+                # If only-column indices are specified
+                if only_column_index_s:
+                    # The new row
+                    new_row = []
+
+                    # Extract columns from the old row
+                    for only_column_index in only_column_index_s:
+                        new_row.append(row[only_column_index])
+
+                    # Override the old row
+                    row = new_row
+
+                # If convert function is a list
+                if convert_func_is_list:
+                    # The new row
+                    new_row = []
+
+                    # For each field in the row
+                    for field_index, field in enumerate(row):
+                        # Get field convert function
+                        filed_func = convert_func[field_index]
+
+                        # If field convert function is None
+                        if not filed_func:
+                            # Add the field to new row
+                            new_row.append(field)
+                        # If field convert function is not None
+                        else:
+                            # Convert the field
+                            new_field = filed_func(field)
+
+                            # Add the field to new row
+                            new_row.append(new_field)
+
+                    # Override the old row
+                    row = new_row
+
+                # If convert function is a function
+                elif convert_func_is_func:
+                    # Convert the row
+                    row = convert_func(row)
+            except Exception:
+                # If reject function is not set
+                if reject_func is None:
+                    # Raise the exception
+                    raise
+
+                # Reject the input row
+                reject_func(
+                    'convert', row_ordinal, input_row, sys.exc_info()[1])
+
+                # Ignore the current row
+                continue
 
-            # If convert function is a function
-            elif convert_func_is_func:
-                # Convert the row
-                row = convert_func(row)
+            # If timing is enabled
+            if timing_info is not None:
+                # Add time spent
+                timing_info['convert'] += time_clock() - convert_start_time
 
             # If the current row should be ignored
             if row is IGNORE_OBJ:
+                # If timing is enabled
+                if timing_info is not None:
+                    # Increment filtered row count
+                    timing_info['filtered'] += 1
+
                 # Ignore
                 continue
 
@@ -890,90 +2526,187 @@ def main_core(args=None, step_info_set_func=None):
                 # Stop
                 break
 
+            # If rows are deduplicated and the row's key has been seen
+            if dedup_func is not None and dedup_func(row):
+                # Ignore the current row
+                continue
+
             # Add the row to rows accumulated for one batch
             row_s.append(row)
 
-            # If batch size is met
-            if row_count % batch_size == 0:
+            # Increment row count.
+            # Only rows passed to output are counted, not rows ignored,
+            # rejected or dropped as duplicates.
+            row_count += 1
+
+            # If row ordinals are collected
+            if row_ordinal_s is not None:
+                # Add the row ordinal
+                row_ordinal_s.append(row_ordinal)
+
+            # If batch size is met.
+            # Rows not added to the batch do not count, so that a batch is
+            # output even if the row at the batch boundary is dropped.
+            if len(row_s) >= batch_size:
                 # Output the rows
-                output_func(row_s)
+                output_result = output_batch(row_s, row_ordinal_s)
 
-                # Empty the accumulated list of rows
-                row_s[:] = []
+                # Get number of rows in the batch
+                batch_row_count = len(row_s)
 
-                # Update progress info
-                last_row_count, last_start_time, total_rate, msg = \
-                    get_progress_info(
-                        row_count=row_count,
-                        last_row_count=last_row_count,
-                        last_start_time=last_start_time,
-                        total_row_count=total_row_count,
-                        total_start_time=total_start_time)
+                # Get number of rows written if the output function asks
+                # to stop processing. None if not.
+                written_count = get_stop_written_count(
+                    output_result, batch_row_count)
 
-                # Print message
-                print_stderr(msg)
+                # Start a new list of rows.
+                # Do not empty the list in place, because outputs may
+                # still be using it, e.g. on fan-out worker threads.
+                row_s = []
+
+                # If row ordinals are collected
+                if row_ordinal_s is not None:
+                    # Start a new list of row ordinals
+                    row_ordinal_s = []
+
+                # If the output function asks to stop processing
+                if written_count is not None:
+                    # Set flag
+                    is_output_stop = True
+
+                    # Do not count rows that are not written
+                    row_count -= batch_row_count - written_count
+
+                    # Stop
+                    break
+
+                # If checkpoint file path is specified
+                if checkpoint_file_path:
+                    # If there are multiple outputs
+                    if output_wait_func is not None:
+                        # Wait until all outputs finish queued batches
+                        output_wait_func()
+
+                    # Write checkpoint
+                    checkpoint_func(
+                        row_ordinal,
+                        position_func() if position_func else None)
+
+                # Report progress if it is time to
+                progress_func(row_count)
+
+                # If profile function is set
+                if profile_func is not None:
+                    # Start or stop profiling according to profile window
+                    profile_func()
 
         # If there are rows left after the loop above
-        if row_count > last_row_count:
+        if row_s:
             # Output the rows
-            output_func(row_s)
+            output_result = output_batch(row_s, row_ordinal_s)
 
-            # Empty the accumulated list of rows
-            row_s[:] = []
+            # Get number of rows written if the output function asks to stop
+            # processing. None if not.
+            written_count = get_stop_written_count(output_result, len(row_s))
 
-            # Update progress info
-            last_row_count, last_start_time, total_rate, msg = \
-                get_progress_info(
-                    row_count=row_count,
-                    last_row_count=last_row_count,
-                    last_start_time=last_start_time,
-                    total_row_count=total_row_count,
-                    total_start_time=total_start_time)
+            # If the output function asks to stop processing
+            if written_count is not None:
+                # Set flag
+                is_output_stop = True
 
-            # Print message
-            print_stderr(msg)
+                # Do not count rows that are not written
+                row_count -= len(row_s) - written_count
 
-        # Get ending time
-        total_end_time = datetime.utcnow()
+            # Start a new list of rows
+            row_s = []
 
-        # Get past duration
-        past_dura = (total_end_time - total_start_time).total_seconds()
+        # If rows are to be sorted and output has not stopped
+        if sorter is not None and not is_output_stop:
+            # Number of sorted rows output
+            sorted_row_count = 0
 
-        # Get past duration fraction width
-        past_dura_frac_len = decide_frac_len(past_dura)
+            # For each batch of sorted rows
+            for row_s, row_ordinal_s in sorter['merge_func'](batch_size):
+                # Output the rows
+                output_result = output_batch(
+                    row_s, row_ordinal_s, is_sorted=True)
 
-        # Get message format
-        msg_fmt = 'Total: {} row{}, {:.%sf}s' % (past_dura_frac_len, )
+                # Get number of rows written if the output function asks to
+                # stop processing. None if not.
+                written_count = get_stop_written_count(
+                    output_result, len(row_s))
 
-        # Get message
-        msg = msg_fmt.format(
-            row_count,
-            '' if row_count <= 1 else 's',
-            past_dura)
+                # If the output function asks to stop processing
+                if written_count is not None:
+                    # Set flag
+                    is_output_stop = True
 
-        # If total rate is not None
-        if total_rate is not None:
-            # Add total rate to message
-            msg += ', {:.0f} rows/s'.format(total_rate)
-        else:
-            # Add total rate to message
-            msg += ', ? rows/s'
+                    # Do not count rows that are not written, including rows
+                    # not merged yet
+                    row_count -= sort_state['row_count'] \
+                        - sorted_row_count - written_count
+
+                    # Stop
+                    break
+
+                # Add to number of sorted rows output
+                sorted_row_count += len(row_s)
+
+        # If there are multiple outputs
+        if output_wait_func is not None:
+            # Wait until all outputs finish queued batches
+            output_wait_func()
+
+        # If checkpoint file path is specified and output has not stopped
+        # early, in which case rows of the last batch may not be written
+        if checkpoint_file_path and not is_output_stop:
+            # If ending row ordinal is reached
+            if is_range_end:
+                # The row at ending row ordinal has been read but not
+                # processed. Input position is after the row so can not be
+                # used.
+                checkpoint_func(row_ordinal - 1, None)
+            else:
+                # Write checkpoint
+                checkpoint_func(
+                    row_ordinal,
+                    position_func() if position_func else None)
+
+        # Report final progress
+        progress_info = progress_func(row_count, is_final=True)
 
         # Print message
-        print_stderr(msg)
+        print_stderr(format_total_msg(row_count, progress_info))
+
+        # If timing is enabled
+        if timing_info is not None:
+            # For each timing message
+            for msg in format_timing_info(
+                    timing_info, progress_info['past']):
+                # Print message
+                print_stderr(msg)
+
+    # If result info dict is given
+    if result_info is not None:
+        # Put processed row count
+        result_info['row_count'] = row_count
 
     # Return without error
     return 0
 
 
 #
-def main_wrap(args=None):
+def main_wrap(args=None, result_info=None, partition_info=None):
     """
     The main function that provides exception handling.
     Call "main_core" to implement the core functionality.
 
     @param args: Command arguments list.
 
+    @param result_info: See "main_core".
+
+    @param partition_info: See "main_core".
+
     @return: Exit code.
     """
     # A dict that contains step info
@@ -982,6 +2715,9 @@ def main_wrap(args=None):
         'exit_code': 0
     }
 
+    # List of (step title, time, loaded module count), one for each step
+    step_time_s = []
+
     # A function that updates step info
     def step_info_set_func(title=None, exit_code=None):
         # If title is not None
@@ -989,6 +2725,9 @@ def main_wrap(args=None):
             # Update title
             step_info['title'] = title
 
+            # Record step time
+            step_time_s.append((title, time_clock(), len(sys.modules)))
+
         # If exit code is not None
         if exit_code is not None:
             # Update exit code
@@ -997,7 +2736,12 @@ def main_wrap(args=None):
     #
     try:
         # Call "main_core" to implement the core functionality
-        return main_core(args=args, step_info_set_func=step_info_set_func)
+        return main_core(
+            args=args,
+            step_info_set_func=step_info_set_func,
+            step_time_s=step_time_s,
+            result_info=result_info,
+            partition_info=partition_info)
     # Catch keyboard interrupt
     except KeyboardInterrupt:
         # Return without error
@@ -1007,6 +2751,10 @@ def main_wrap(args=None):
         # Get step title
         step_title = step_info.get('title', '')
 
+        # Import here because it is needed only on error.
+        # This saves startup time.
+        import traceback
+
         # Get traceback
         traceback_msg = ''.join(traceback.format_exception(*sys.exc_info()))
 
@@ -1018,8 +2766,8 @@ def main_wrap(args=None):
             # Get message
             msg = '# Error\n---\n{}---\n'.format(traceback_msg)
 
-        # Output message
-        sys.stderr.write(msg)
+        # Output message, with the current thread's message prefix if any
+        print_stderr(msg[:-1])
 
         # Get exit code
         exit_code = step_info.get('exit_code', 1)
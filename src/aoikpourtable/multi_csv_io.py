@@ -0,0 +1,620 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import csv
+from datetime import datetime
+import glob
+import gzip
+import io
+import sys
+import threading
+import traceback
+
+from .csv_io import _quoting_map
+from .print_util import print_stderr
+from .uri_util import uri_query_to_args
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    from Queue import Empty
+    from Queue import Queue
+else:
+    from queue import Empty
+    from queue import Queue
+
+
+# Number of row chunks each output queue can hold. A worker waits when its
+# queue is full, so reading does not run far ahead of processing.
+QUEUE_SIZE = 4
+
+
+#
+def get_file_paths(uri):
+    """
+    Get input file paths from input URI.
+
+    @param uri: Input URI. Either a glob pattern, e.g. "data/part-*.csv.gz",
+    or "@" followed by a list file path, e.g. "@files.txt", whose non-empty
+    lines are file paths.
+
+    @return: File paths list. Glob matches are sorted.
+    """
+    # If the URI is a list file
+    if uri.startswith('@'):
+        # Read list file
+        with open(uri[1:]) as list_file:
+            file_path_s = [
+                line.strip() for line in list_file if line.strip()
+            ]
+
+    # If the URI is a glob pattern
+    else:
+        # Get sorted matches
+        file_path_s = sorted(glob.glob(uri))
+
+    # If no files are found
+    if not file_path_s:
+        # Raise exception
+        raise ValueError('No input files: {}'.format(uri))
+
+    # Return file paths list
+    return file_path_s
+
+
+#
+def open_file(file_path, encoding):
+    """
+    Open input file for CSV reading, decompressing ".gz" files.
+
+    @param file_path: File path.
+
+    @param encoding: Encoding.
+
+    @return: File object.
+    """
+    # Open file in binary mode
+    if file_path.endswith('.gz'):
+        binary_file = gzip.open(file_path, mode='rb')
+    else:
+        binary_file = io.open(file_path, mode='rb')
+
+    # If Python 2
+    if IS_PY2:
+        # CSV reader reads bytes
+        return binary_file
+
+    # Decode file.
+    # Use "newline=''" so that the CSV reader handles line ends in quoted
+    # fields.
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline='')
+
+
+#
+def read_files_worker(
+        file_path_s,
+        encoding,
+        csv_kwargs,
+        chunk_size,
+        task_queue,
+        output_queue,
+        abort_event):
+    """
+    Worker function that reads files and puts row chunks to output queue.
+
+    This is a module-level function so that it can run in a worker process.
+
+    Output queue items:
+    - ('rows', file_index, rows): A chunk of rows.
+    - ('end_file', file_index, None): The file is done.
+    - ('error', file_index, message): Reading the file failed.
+    - ('end_worker', None, None): The worker is done.
+
+    @param file_path_s: File paths list.
+
+    @param encoding: Encoding.
+
+    @param csv_kwargs: Keyword arguments for "csv.reader".
+
+    @param chunk_size: Number of rows in a chunk.
+
+    @param task_queue: Queue of file indices to read. None means stop.
+
+    @param output_queue: Queue to put items to.
+
+    @param abort_event: Event set when the consumer stops early.
+
+    @return: None.
+    """
+    # Repeat
+    while not abort_event.is_set():
+        # Get a file index
+        file_index = task_queue.get()
+
+        # If no more files
+        if file_index is None:
+            # Stop
+            break
+
+        try:
+            # Open file
+            input_file = open_file(file_path_s[file_index], encoding)
+
+            try:
+                # Get CSV reader
+                csv_reader = csv.reader(input_file, **csv_kwargs)
+
+                # Rows of current chunk
+                row_s = []
+
+                # For each row
+                for row in csv_reader:
+                    # Add to chunk
+                    row_s.append(row)
+
+                    # If chunk is full
+                    if len(row_s) >= chunk_size:
+                        # Put the chunk
+                        output_queue.put(('rows', file_index, row_s))
+
+                        # Start a new chunk
+                        row_s = []
+
+                        # If the consumer has stopped
+                        if abort_event.is_set():
+                            # Stop
+                            return
+
+                # If there are rows left
+                if row_s:
+                    # Put the chunk
+                    output_queue.put(('rows', file_index, row_s))
+            finally:
+                # Close file
+                input_file.close()
+
+            # Put file end marker
+            output_queue.put(('end_file', file_index, None))
+        except Exception:
+            # Put error message.
+            # Exceptions are passed as text because they may not be picklable.
+            output_queue.put(('error', file_index, traceback.format_exc()))
+
+            # Stop
+            return
+
+    # Put worker end marker
+    output_queue.put(('end_worker', None, None))
+
+
+#
+def get_args_info(uri, args):
+    """
+    Parse multi-file input arguments string.
+
+    @param uri: Input URI.
+
+    @param args: Input arguments string.
+
+    @return: Arguments info dict, in the format:
+    {
+        'file_paths': [...],
+        'encoding': ...,
+        'csv_kwargs': {...},
+        'workers': ...,
+        'merge': ...,
+        'pool': ...,
+    }
+    """
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get worker count
+    worker_count = int(args_dict.pop('workers', '4'))
+
+    # Get merge mode
+    merge_mode = args_dict.pop('merge', 'ordered')
+
+    # Get pool kind
+    pool_kind = args_dict.pop('pool', 'thread')
+
+    # If any of the values is not valid
+    if worker_count <= 0 or merge_mode not in ('ordered', 'interleaved') \
+            or pool_kind not in ('thread', 'process'):
+        # Raise exception
+        raise ValueError(
+            '"workers" must be greater than 0, "merge" must be "ordered" or'
+            ' "interleaved", and "pool" must be "thread" or "process": {}'
+            .format(args))
+
+    # Return arguments info dict
+    return {
+        'file_paths': get_file_paths(uri),
+        'encoding': args_dict.pop('encoding', 'utf-8'),
+        'csv_kwargs': {
+            'lineterminator': args_dict.pop('lineterminator', '\n'),
+            'delimiter': args_dict.pop('delimiter', ','),
+            'quotechar': args_dict.pop('quotechar', '"'),
+            'quoting': _quoting_map[args_dict.pop('quoting', 'QUOTE_ALL')],
+        },
+        'workers': worker_count,
+        'merge': merge_mode,
+        'pool': pool_kind,
+    }
+
+
+#
+def input_factory(uri, query, args, cmd_args):
+    """
+    Input factory that reads multiple CSV files concurrently.
+
+    Input URI is a glob pattern, e.g. "data/part-*.csv.gz", or "@" followed
+    by a list file path. Files ending with ".gz" are decompressed.
+
+    Input query is not used.
+
+    Input arguments:
+    - encoding, lineterminator, delimiter, quotechar, quoting: Same as
+      "csv_io".
+    - workers: Number of files read concurrently. Default is 4.
+    - merge: "ordered" yields files' rows in file order, reading later files
+      ahead. "interleaved" yields rows chunk by chunk as workers produce
+      them. Default is "ordered".
+    - pool: "thread" or "process". Worker processes parse CSV on all cores,
+      at the cost of passing rows between processes. Default is "thread".
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: An input context object.
+    """
+    # Parse arguments
+    args_info = get_args_info(uri, args)
+
+    # Get file paths
+    file_path_s = args_info['file_paths']
+
+    # Get merge mode
+    merge_mode = args_info['merge']
+
+    # Get pool kind
+    pool_kind = args_info['pool']
+
+    # Get worker count, not more than the number of files
+    worker_count = min(args_info['workers'], len(file_path_s))
+
+    # Print message
+    print_stderr('{:20}{}'.format('Input:', uri))
+
+    print_stderr('{:20}{} file{}, {} {} worker{}, {} merge'.format(
+        'Files:',
+        len(file_path_s),
+        '' if len(file_path_s) == 1 else 's',
+        worker_count,
+        pool_kind,
+        '' if worker_count == 1 else 's',
+        merge_mode))
+
+    # If interleaved merge is used with checkpoint
+    if merge_mode == 'interleaved' \
+            and cmd_args.get('checkpoint_file_path', None):
+        # Raise exception, because row order is not repeatable
+        raise ValueError(
+            'Interleaved merge does not support checkpoint: {}'.format(args))
+
+    # Get queue, event and worker classes
+    if pool_kind == 'process':
+        import multiprocessing
+
+        queue_class = multiprocessing.Queue
+
+        event_class = multiprocessing.Event
+
+        worker_class = multiprocessing.Process
+    else:
+        queue_class = Queue
+
+        event_class = threading.Event
+
+        worker_class = threading.Thread
+
+    # Create context factory
+    @contextmanager
+    def input_context_manager():
+        # Event set when the consumer stops early
+        abort_event = event_class()
+
+        # If merge mode is ordered
+        if merge_mode == 'ordered':
+            # Create task queue and output queue for each worker.
+            # Files are assigned round-robin, so file N's rows come from
+            # worker N % worker_count's output queue, in file order.
+            task_queue_s = [queue_class() for _ in range(worker_count)]
+
+            output_queue_s = [
+                queue_class(QUEUE_SIZE) for _ in range(worker_count)]
+
+            # For each file index
+            for file_index in range(len(file_path_s)):
+                # Assign to worker
+                task_queue_s[file_index % worker_count].put(file_index)
+
+        # If merge mode is interleaved
+        else:
+            # Create one task queue and one output queue shared by workers,
+            # so that a free worker takes the next file
+            task_queue = queue_class()
+
+            output_queue = queue_class(QUEUE_SIZE * worker_count)
+
+            task_queue_s = [task_queue] * worker_count
+
+            output_queue_s = [output_queue] * worker_count
+
+            # For each file index
+            for file_index in range(len(file_path_s)):
+                # Add task
+                task_queue.put(file_index)
+
+        # For each worker's task queue
+        for task_queue in task_queue_s:
+            # Put stop marker
+            task_queue.put(None)
+
+        # Workers list
+        worker_s = []
+
+        # For each worker index
+        for worker_index in range(worker_count):
+            # Create worker
+            worker = worker_class(
+                target=read_files_worker,
+                args=(
+                    file_path_s,
+                    args_info['encoding'],
+                    args_info['csv_kwargs'],
+                    cmd_args['batch_size'],
+                    task_queue_s[worker_index],
+                    output_queue_s[worker_index],
+                    abort_event,
+                ))
+
+            # Do not keep the process alive if the main thread exits
+            # abnormally
+            worker.daemon = True
+
+            # Start worker
+            worker.start()
+
+            # Add to workers list
+            worker_s.append(worker)
+
+        # Create function that gets an item from output queue
+        def get_item(output_queue):
+            # Get item
+            item = output_queue.get()
+
+            # If reading a file failed
+            if item[0] == 'error':
+                # Raise exception
+                raise ValueError('Failed reading file: {}\n{}'.format(
+                    file_path_s[item[1]], item[2]))
+
+            # Return item
+            return item
+
+        # Create generator factory
+        def row_generator_factory():
+            # If merge mode is ordered
+            if merge_mode == 'ordered':
+                # For each file index
+                for file_index in range(len(file_path_s)):
+                    # Get the output queue of the file's worker
+                    output_queue = output_queue_s[file_index % worker_count]
+
+                    # Repeat
+                    while True:
+                        # Get item
+                        kind, _, row_s = get_item(output_queue)
+
+                        # If the file is done
+                        if kind == 'end_file':
+                            # Go to next file
+                            break
+
+                        # For each row
+                        for row in row_s:
+                            # Yield the row
+                            yield row
+
+            # If merge mode is interleaved
+            else:
+                # Get the shared output queue
+                output_queue = output_queue_s[0]
+
+                # Number of workers done
+                end_worker_count = 0
+
+                # While not all workers are done
+                while end_worker_count < worker_count:
+                    # Get item
+                    kind, _, row_s = get_item(output_queue)
+
+                    # If a worker is done
+                    if kind == 'end_worker':
+                        # Increment count
+                        end_worker_count += 1
+
+                    # If the item is a chunk of rows
+                    elif kind == 'rows':
+                        # For each row
+                        for row in row_s:
+                            # Yield the row
+                            yield row
+
+        try:
+            # Yield row iterator
+            yield row_generator_factory()
+        finally:
+            # Tell workers to stop
+            abort_event.set()
+
+            # For each output queue
+            for output_queue in set(output_queue_s):
+                # Drain the queue so that workers waiting to put can exit
+                try:
+                    while True:
+                        output_queue.get_nowait()
+                except Empty:
+                    pass
+
+            # For each worker
+            for worker in worker_s:
+                # If the worker is a process
+                if pool_kind == 'process':
+                    # Stop the process, which may wait to put
+                    worker.terminate()
+
+                # Wait for the worker to exit, but not forever, because a
+                # worker thread may still wait to put to a full queue
+                worker.join(1)
+
+    # Return input context object
+    return input_context_manager()
+
+
+#
+def count_file_lines(file_path):
+    """
+    Count lines of a file, decompressing ".gz" files.
+
+    This is a module-level function so that it can run in a worker process.
+
+    @param file_path: File path.
+
+    @return: Number of lines.
+    """
+    # Open file in binary mode
+    if file_path.endswith('.gz'):
+        input_file = gzip.open(file_path, mode='rb')
+    else:
+        input_file = io.open(file_path, mode='rb')
+
+    # Line count
+    count = 0
+
+    # Last block read
+    last_block = b''
+
+    # Repeat
+    with input_file:
+        while True:
+            # Read a block
+            block = input_file.read(1 << 20)
+
+            # If end of file
+            if not block:
+                # Stop
+                break
+
+            # Add number of line ends
+            count += block.count(b'\n')
+
+            # Keep the block
+            last_block = block
+
+    # If the last line has no line end
+    if last_block and not last_block.endswith(b'\n'):
+        # Count the last line
+        count += 1
+
+    # Return line count
+    return count
+
+
+#
+def count_rows(uri, query, args, cmd_args):
+    """
+    Count factory that counts lines of all input files in parallel, used with
+    the multi-file input factory.
+
+    Rows are counted as lines, like "count_io.count_lines", so quoted fields
+    that contain line ends make the count larger.
+
+    Input arguments "workers" and "pool" are used, see "input_factory".
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Count info dict, in the format:
+    {
+        'count': ...,
+        'duration': ...,
+        'rate': ...,
+    }
+    """
+    # Parse arguments
+    args_info = get_args_info(uri, args)
+
+    # Get file paths
+    file_path_s = args_info['file_paths']
+
+    # Get worker count, not more than the number of files
+    worker_count = min(args_info['workers'], len(file_path_s))
+
+    # Get starting time
+    count_start_time = datetime.utcnow()
+
+    # Create pool
+    if args_info['pool'] == 'process':
+        from multiprocessing import Pool
+    else:
+        from multiprocessing.pool import ThreadPool as Pool
+
+    pool = Pool(worker_count)
+
+    try:
+        # Count lines of each file
+        count = sum(pool.map(count_file_lines, file_path_s))
+    finally:
+        # Close pool
+        pool.close()
+
+        # Wait for workers to exit
+        pool.join()
+
+    # Get duration
+    count_dura = (datetime.utcnow() - count_start_time).total_seconds()
+
+    # Get rate
+    count_rate = count / count_dura if count_dura else None
+
+    # Get starting row ordinal
+    start_row_ordinal = cmd_args['start_row_ordinal']
+
+    # If staring row ordinal is not None
+    if start_row_ordinal:
+        # Deduct from count
+        count = max(count - (start_row_ordinal - 1), 0)
+
+    # Return count info dict
+    return {
+        'count': count,
+        'duration': count_dura,
+        'rate': count_rate,
+    }
@@ -0,0 +1,494 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import sys
+import zlib
+
+from .print_util import print_prefix_set
+from .print_util import print_stderr
+from .progress_util import get_progress_info
+from .timing_util import time_clock
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    from Queue import Empty
+else:
+    from queue import Empty
+
+
+# Placeholder in command arguments replaced with the partition index
+PARTITION_PLACEHOLDER = '{partition}'
+
+# Input factory URIs that read stdin, which partitions can not share
+STDIN_INPUT_FACTORY_URIS = (
+    'aoikpourtable.std_io::stdin_factory',
+    'aoikpourtable.std_io::stdin_csv_factory',
+)
+
+# Output factory URIs that write to stdout, which partitions can not share
+STDOUT_OUTPUT_FACTORY_URIS = (
+    'aoikpourtable.std_io::stdout_factory',
+)
+
+# Output factory URIs whose output URI is a file path
+FILE_OUTPUT_FACTORY_URIS = (
+    'aoikpourtable.csv_io::csv_output_factory',
+    'aoikpourtable.sqlite_io::insert_factory',
+)
+
+
+#
+def check_partition_io(input_factory_uri, output_group_s):
+    """
+    Raise exception if partitions can not share the input or an output.
+
+    @param input_factory_uri: Input factory URI.
+
+    @param output_group_s: Output group dicts list. See
+    "main.get_output_groups".
+
+    @return: None.
+    """
+    # If input reads stdin
+    if input_factory_uri in STDIN_INPUT_FACTORY_URIS:
+        # Raise exception, because only one process can read stdin
+        raise ValueError(
+            'Input factory "{}" reads stdin, which can not be used with'
+            ' "--partitions".'.format(input_factory_uri))
+
+    # For each output group
+    for output_group in output_group_s:
+        # Get output factory URI
+        factory_uri = output_group['factory_uri']
+
+        # Get output URI
+        uri = output_group['uri']
+
+        # If output writes to stdout
+        if factory_uri in STDOUT_OUTPUT_FACTORY_URIS:
+            # Raise exception, because partitions' rows would interleave
+            raise ValueError(
+                'Output factory "{}" writes to stdout, which can not be used'
+                ' with "--partitions".'.format(factory_uri))
+
+        # If output writes to a file, including a SQLite database file, and
+        # the file path has no partition placeholder
+        if (factory_uri in FILE_OUTPUT_FACTORY_URIS
+                or uri.startswith('sqlite')) \
+                and PARTITION_PLACEHOLDER not in uri:
+            # Raise exception, because partitions would overwrite each
+            # other's file
+            raise ValueError(
+                'Output "{}" is a file, so it requires "{}" in the path when'
+                ' using "--partitions".'.format(uri, PARTITION_PLACEHOLDER))
+
+
+#
+def split_range(start_row_index, end_row_index, partition_count):
+    """
+    Split a row index range into contiguous ranges of nearly equal sizes.
+
+    @param start_row_index: Starting row index, inclusive.
+
+    @param end_row_index: Ending row index, exclusive.
+
+    @param partition_count: Number of ranges.
+
+    @return: List of (starting row index, ending row index) tuples, one for
+    each partition.
+    """
+    # Get row count
+    row_count = max(end_row_index - start_row_index, 0)
+
+    # Get base range size, and number of ranges that get one more row
+    range_size, extra_count = divmod(row_count, partition_count)
+
+    # The ranges list
+    range_s = []
+
+    # Starting row index of the next range
+    range_start = start_row_index
+
+    # For each partition
+    for partition_index in range(partition_count):
+        # Get ending row index of the range
+        range_end = range_start + range_size \
+            + (1 if partition_index < extra_count else 0)
+
+        # Add to list
+        range_s.append((range_start, range_end))
+
+        # Move to the next range
+        range_start = range_end
+
+    # Return the ranges list
+    return range_s
+
+
+#
+def partition_filter_create(partition_info):
+    """
+    Create partition filter function that tells whether a row belongs to the
+    current partition.
+
+    @param partition_info: Partition info dict. See "partitions_run".
+
+    @return: Partition filter function in the form:
+    filter_func(row_ordinal, row)
+    It returns True if the row belongs to the current partition. None if rows
+    are not filtered, e.g. the partition reads its own row range.
+    """
+    # Get partition mode
+    mode = partition_info['mode']
+
+    # Get partition index
+    partition_index = partition_info['index']
+
+    # Get number of partitions
+    partition_count = partition_info['count']
+
+    # If each partition reads its own row range
+    if mode == 'range':
+        # No need to filter rows
+        return None
+
+    # If rows are partitioned by row ordinal
+    if mode == 'ordinal':
+        # Create filter function
+        def ordinal_filter_func(row_ordinal, row):
+            # Row ordinal is 1-based
+            return (row_ordinal - 1) % partition_count == partition_index
+
+        # Return filter function
+        return ordinal_filter_func
+
+    # Get key column indices
+    key_index_s = partition_info['key_indices']
+
+    # Create filter function.
+    # Use CRC32 instead of "hash" because string hashes are randomized per
+    # process, and all partitions must agree on which partition a row maps to.
+    def key_filter_func(row_ordinal, row):
+        # Get key text
+        key_text = repr([row[key_index] for key_index in key_index_s])
+
+        # Get key hash
+        key_hash = zlib.crc32(key_text.encode('utf-8')) & 0xffffffff
+
+        # Return whether the key maps to the current partition
+        return key_hash % partition_count == partition_index
+
+    # Return filter function
+    return key_filter_func
+
+
+#
+@contextmanager
+def partition_progress_context_factory(partition_info, total_row_count):
+    """
+    Context factory that produces a progress function for a partition
+    process. The progress function sends the processed row count to the
+    parent process instead of printing it, so that the parent reports the
+    progress of all partitions together.
+
+    @param partition_info: Partition info dict. See "partitions_run".
+
+    @param total_row_count: The partition's total rows count. None if
+    unknown.
+
+    @return: A context object that yields the progress function. See
+    "progress_util.progress_context_factory".
+    """
+    # Get progress queue
+    progress_queue = partition_info['queue']
+
+    # Get partition index
+    partition_index = partition_info['index']
+
+    # Get minimum seconds between two reports
+    interval = partition_info['interval']
+
+    # Get starting time
+    total_start_time = time_clock()
+
+    # Reporter state dict.
+    # Use a dict so that the progress function can update it.
+    state = {
+        'last_time': total_start_time,
+    }
+
+    # Create progress function
+    def progress_func(row_count, is_final=False):
+        # Get current time
+        now_time = time_clock()
+
+        # If it is not time to report
+        if not is_final and now_time - state['last_time'] < interval:
+            # Do not report
+            return None
+
+        # Update state
+        state['last_time'] = now_time
+
+        # Send processed row count to the parent process
+        progress_queue.put(('progress', partition_index, row_count))
+
+        # Return progress info dict
+        return get_progress_info(
+            row_count=row_count,
+            last_row_count=0,
+            last_time=total_start_time,
+            total_row_count=total_row_count,
+            total_start_time=total_start_time,
+            now_time=now_time)
+
+    # Yield progress function
+    yield progress_func
+
+
+#
+def partition_run(partition_info):
+    """
+    Run one partition by calling "main_wrap" with the partition's command
+    arguments, then send the result to the parent process.
+
+    This is a module-level function so that a process can be started with it
+    whatever the start method is.
+
+    @param partition_info: Partition info dict. See "partitions_run".
+
+    @return: None.
+    """
+    # Import here to avoid circular import
+    from .main import main_wrap
+
+    # Get partition index
+    partition_index = partition_info['index']
+
+    # Prefix messages printed by this process with the partition index
+    print_prefix_set('[p{}] '.format(partition_index))
+
+    # Result info dict, filled by "main_core"
+    result_info = {}
+
+    # Exit code, used if "main_wrap" raises
+    exit_code = 1
+
+    try:
+        # Run the partition
+        exit_code = main_wrap(
+            args=partition_info['argv'],
+            result_info=result_info,
+            partition_info=partition_info)
+    finally:
+        # If the partition did not finish processing, e.g. it raised an
+        # exception. "main_wrap" returns the step's exit code, which may be 0.
+        if exit_code == 0 and 'row_count' not in result_info:
+            # Treat the partition as failed
+            exit_code = 1
+
+        # Send result to the parent process
+        partition_info['queue'].put((
+            'done',
+            partition_index,
+            exit_code,
+            result_info.get('row_count', None),
+        ))
+
+
+#
+def partitions_run(
+        argv,
+        partition_count,
+        mode,
+        key_index_s=None,
+        range_s=None,
+        progress_ctx=None,
+        interval=1.0):
+    """
+    Run one pour as several partition processes, each processing its share of
+    rows and writing to its own outputs, and report their progress together.
+
+    In each partition's command arguments, "{partition}" is replaced with the
+    partition index, starting from 0, so that e.g. each partition writes to
+    its own output file.
+
+    @param argv: Command arguments list of the pour.
+
+    @param partition_count: Number of partitions.
+
+    @param mode: Partition mode. "range" means each partition reads its own
+    row range given in "range_s". "key" means each partition processes rows
+    whose key columns hash to it. "ordinal" means each partition processes
+    rows whose ordinal modulo number of partitions maps to it.
+
+    @param key_index_s: 0-based key column indices, for "key" mode.
+
+    @param range_s: List of (starting row index, ending row index) tuples,
+    one for each partition, for "range" mode.
+
+    @param progress_ctx: Progress context for all partitions. See
+    "progress_util.progress_context_factory".
+
+    @param interval: Minimum seconds between two progress reports of a
+    partition.
+
+    @return: Dict in the format:
+    {
+        'exit_code': ...,
+        'row_count': ...,
+        'progress_info': ...,
+    }
+    "exit_code" is 0 if all partitions succeed, otherwise the first failed
+    partition's exit code.
+    """
+    # Import here because it is needed only in partition mode.
+    # This saves startup time.
+    import multiprocessing
+
+    # Print message
+    print_stderr('{:20}{} partitions, by {}'.format(
+        'Partitions:', partition_count, mode))
+
+    # Create queue that partition processes send progress and results to
+    progress_queue = multiprocessing.Queue()
+
+    # Processed row counts, one for each partition
+    row_count_s = [0] * partition_count
+
+    # Exit codes, one for each partition. None if not finished yet.
+    exit_code_s = [None] * partition_count
+
+    # Partition processes
+    process_s = []
+
+    try:
+        # For each partition
+        for partition_index in range(partition_count):
+            # Get the partition's command arguments
+            partition_argv = [
+                x.replace(PARTITION_PLACEHOLDER, str(partition_index))
+                for x in argv
+            ]
+
+            # If each partition reads its own row range
+            if mode == 'range':
+                # Get the partition's row range
+                range_start, range_end = range_s[partition_index]
+
+                # Add range arguments, which override earlier ones
+                partition_argv.extend([
+                    '--start-row={}'.format(range_start),
+                    '--end-row={}'.format(range_end),
+                ])
+
+                # Print message
+                print_stderr('{:20}{}: rows {} to {}'.format(
+                    'Partition:', partition_index, range_start, range_end))
+
+            # Create partition process
+            process = multiprocessing.Process(
+                target=partition_run,
+                args=({
+                    'index': partition_index,
+                    'count': partition_count,
+                    'mode': mode,
+                    'key_indices': key_index_s,
+                    'argv': partition_argv,
+                    'queue': progress_queue,
+                    'interval': interval,
+                },))
+
+            # Start partition process
+            process.start()
+
+            # Add to partition processes
+            process_s.append(process)
+
+        #
+        with progress_ctx as progress_func:
+            # While some partitions are not finished
+            while None in exit_code_s:
+                try:
+                    # Get a message from partition processes
+                    msg = progress_queue.get(timeout=interval or 1.0)
+                except Empty:
+                    # For each partition process
+                    for partition_index, process in enumerate(process_s):
+                        # If the process has exited without sending result,
+                        # e.g. it was killed
+                        if exit_code_s[partition_index] is None \
+                                and not process.is_alive() \
+                                and progress_queue.empty():
+                            # Treat the partition as failed
+                            exit_code_s[partition_index] = \
+                                process.exitcode or 1
+
+                    # Report progress if it is time to
+                    progress_func(sum(row_count_s))
+
+                    # Go to next message
+                    continue
+
+                # Get message kind and partition index
+                msg_kind, partition_index = msg[:2]
+
+                # If the message is a progress report
+                if msg_kind == 'progress':
+                    # Update the partition's processed row count
+                    row_count_s[partition_index] = msg[2]
+
+                # If the message is a partition result
+                else:
+                    # Get exit code and processed row count
+                    exit_code, row_count = msg[2:]
+
+                    # Set the partition's exit code
+                    exit_code_s[partition_index] = exit_code
+
+                    # Update the partition's processed row count
+                    row_count_s[partition_index] = row_count or 0
+
+                    # Print message
+                    print_stderr('{:20}{}: {}, {} row{}'.format(
+                        'Partition:',
+                        partition_index,
+                        'ok' if exit_code == 0
+                        else 'exit code {}'.format(exit_code),
+                        row_count_s[partition_index],
+                        '' if row_count_s[partition_index] == 1 else 's'))
+
+                # Report progress if it is time to
+                progress_func(sum(row_count_s))
+
+            # Get total processed row count
+            row_count = sum(row_count_s)
+
+            # Report final progress
+            progress_info = progress_func(row_count, is_final=True)
+    finally:
+        # For each partition process
+        for process in process_s:
+            # If the process is still running, e.g. on keyboard interrupt
+            if process.is_alive():
+                # Terminate the process
+                process.terminate()
+
+            # Wait for the process to exit
+            process.join()
+
+    # Get failed partitions' exit codes
+    failed_exit_code_s = [x for x in exit_code_s if x != 0]
+
+    # Return result dict
+    return {
+        'exit_code': failed_exit_code_s[0] if failed_exit_code_s else 0,
+        'row_count': row_count,
+        'progress_info': progress_info,
+    }
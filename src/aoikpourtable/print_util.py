@@ -3,12 +3,37 @@
 from __future__ import absolute_import
 
 import sys
+import threading
+
+
+# Thread-local state, holding the message prefix of the current thread
+_LOCAL = threading.local()
+
+
+#
+def print_prefix_set(prefix):
+    """
+    Set the prefix of messages printed by the current thread, e.g. the job
+    name when several jobs run in one process.
+
+    @param prefix: Message prefix. Empty string means no prefix.
+
+    @return: None.
+    """
+    # Set prefix
+    _LOCAL.prefix = prefix
 
 
 #
 def print_stderr(msg):
-    # Write message
-    sys.stderr.write(msg)
+    # Get prefix of the current thread
+    prefix = getattr(_LOCAL, 'prefix', '')
+
+    # If prefix is set and message has multiple lines, e.g. a traceback
+    if prefix and '\n' in msg:
+        # Add prefix to each line, so that lines of concurrent jobs can be
+        # told apart when interleaved
+        msg = msg.replace('\n', '\n' + prefix)
 
-    # Write newline
-    sys.stderr.write('\n')
+    # Write prefix, message and newline in one call
+    sys.stderr.write(prefix + msg + '\n')
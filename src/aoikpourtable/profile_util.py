@@ -0,0 +1,316 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import os.path
+
+from .print_util import print_stderr
+from .timing_util import time_clock
+
+
+#
+def parse_profile_window(text):
+    """
+    Parse profile window text in the format "START:END" to a tuple.
+
+    @param text: Profile window text, e.g. "10:70" or "10:". Values are
+    seconds since data processing starts.
+
+    @return: A tuple of 2 elements: (start, end). "end" is None if not given.
+    """
+    # Split text into start and end texts
+    start_text, _, end_text = text.partition(':')
+
+    # Get start value
+    start = float(start_text) if start_text.strip() else 0.0
+
+    # Get end value
+    end = float(end_text) if end_text.strip() else None
+
+    # If end value is not greater than start value
+    if end is not None and end <= start:
+        # Raise exception
+        raise ValueError(
+            'Profile window end must be greater than start: {}'.format(text))
+
+    # Return the tuple
+    return start, end
+
+
+#
+def get_file_key(file_path):
+    """
+    Get a normalized file path that can be compared with code object file
+    paths in profile stats.
+
+    @param file_path: File path, e.g. a module's "__file__".
+
+    @return: Normalized file path.
+    """
+    # Get absolute path
+    file_path = os.path.abspath(file_path)
+
+    # If the file is a compiled file
+    if file_path.endswith(('.pyc', '.pyo')):
+        # Use the source file path
+        file_path = file_path[:-1]
+
+    # Return normalized file path
+    return file_path
+
+
+#
+def profile_group_add(group_map, kind, mod_obj):
+    """
+    Add a plugin module to profile groups.
+
+    @param group_map: A dict that maps module file path to group name.
+
+    @param kind: Plugin kind, e.g. "input".
+
+    @param mod_obj: Plugin module object.
+
+    @return: None.
+    """
+    # Get module file path
+    file_path = getattr(mod_obj, '__file__', None)
+
+    # If module file path is not available
+    if not file_path:
+        # Ignore
+        return
+
+    # Get existing group name
+    group_name = group_map.get(file_path, None)
+
+    # If the module is not added before
+    if group_name is None:
+        # Add group name
+        group_map[file_path] = '{} ({})'.format(kind, mod_obj.__name__)
+
+    # If the module is added before, e.g. one module provides both input and
+    # output factories.
+    else:
+        # Add kind to group name
+        group_map[file_path] = group_name.replace(
+            ' (', '/{} ('.format(kind), 1)
+
+
+#
+def format_profile_summary(profiler, group_map, top_n):
+    """
+    Format profile stats to summary messages, grouped by plugin module.
+
+    @param profiler: "cProfile.Profile" object.
+
+    @param group_map: A dict that maps module file path to group name. Files
+    not in the dict are grouped as "other".
+
+    @param top_n: Number of top functions to list for each group.
+
+    @return: Messages list.
+    """
+    # Import here because it is needed only when profiling.
+    # This saves startup time.
+    import pstats
+
+    # Get stats object
+    stats = pstats.Stats(profiler)
+
+    # Map normalized file path to group name
+    file_key_to_group = {}
+
+    # For each file path and group name
+    for file_path, group_name in group_map.items():
+        # Add to map
+        file_key_to_group[get_file_key(file_path)] = group_name
+
+    # Map group name to list of (cumulative time, self time, call count,
+    # function label)
+    group_to_func_info_s = {}
+
+    # Map group name to total self time
+    group_to_self_time = {}
+
+    # Cache of file path to group name
+    file_to_group_cache = {}
+
+    # For each function's stats
+    for func_key, func_stats in stats.stats.items():
+        # Get file path, line number and function name
+        file_path, line_no, func_name = func_key
+
+        # Get call count, self time and cumulative time
+        _, call_count, self_time, cumu_time, _ = func_stats
+
+        # Get group name from cache
+        group_name = file_to_group_cache.get(file_path, None)
+
+        # If group name is not in cache
+        if group_name is None:
+            # Get group name
+            if file_path.startswith('<') or file_path == '~':
+                group_name = 'other'
+            else:
+                group_name = file_key_to_group.get(
+                    get_file_key(file_path), 'other')
+
+            # Add to cache
+            file_to_group_cache[file_path] = group_name
+
+        # Add to total self time of the group
+        group_to_self_time[group_name] = \
+            group_to_self_time.get(group_name, 0.0) + self_time
+
+        # Get function label
+        func_label = '{}:{}({})'.format(
+            os.path.basename(file_path), line_no, func_name)
+
+        # Add function info
+        group_to_func_info_s.setdefault(group_name, []).append(
+            (cumu_time, self_time, call_count, func_label))
+
+    # Messages list
+    msg_s = []
+
+    # Sort group names by total self time, descending
+    group_name_s = sorted(
+        group_to_self_time.keys(),
+        key=lambda x: group_to_self_time[x],
+        reverse=True)
+
+    # For each group name
+    for group_name in group_name_s:
+        # Add group message
+        msg_s.append('{}: {:.3f}s self time'.format(
+            group_name, group_to_self_time[group_name]))
+
+        # Get top functions sorted by cumulative time
+        func_info_s = sorted(
+            group_to_func_info_s[group_name], reverse=True)[:top_n]
+
+        # For each function info
+        for cumu_time, self_time, call_count, func_label in func_info_s:
+            # Add function message
+            msg_s.append('  {:>10.3f}s {:>10.3f}s {:>10}  {}'.format(
+                cumu_time, self_time, call_count, func_label))
+
+    # Return messages list
+    return msg_s
+
+
+#
+def profile_context_factory(
+        profile_file_path,
+        top_n=20,
+        window=None,
+        group_map=None):
+    """
+    Create a profile context that runs cProfile and writes a pstats file on
+    exit, then prints a summary grouped by plugin module.
+
+    If no window is given, profiling starts when the context is entered and
+    stops when it exits, even if an exception is raised in between.
+
+    The context yields a profile function that should be called after each
+    batch. It starts or stops profiling according to the window.
+
+    @param profile_file_path: Pstats file path.
+
+    @param top_n: Number of top functions to list for each group.
+
+    @param window: A tuple of (start, end) in seconds since the context is
+    entered. See "parse_profile_window". None means profile the whole run.
+
+    @param group_map: A dict that maps module file path to group name, used
+    for the summary. The caller can keep adding to it until the context exits.
+
+    @return: A context object that yields the profile function.
+    """
+    # Import here because it is needed only when profiling.
+    # This saves startup time.
+    import cProfile
+
+    # Create profiler
+    profiler = cProfile.Profile()
+
+    # Profiler state dict.
+    # Use a dict so that the profile function can update it.
+    state = {
+        'enabled': False,
+        'done': False,
+        'start_time': None,
+    }
+
+    # Create profile function
+    def profile_func():
+        # If window is not given, or the window has passed
+        if window is None or state['done']:
+            # Nothing to do
+            return
+
+        # Get seconds since the context is entered
+        elapsed = time_clock() - state['start_time']
+
+        # If profiling is not started
+        if not state['enabled']:
+            # If window start is reached
+            if elapsed >= window[0]:
+                # Start profiling
+                profiler.enable()
+
+                # Update state
+                state['enabled'] = True
+
+        # If profiling is started and window end is reached
+        elif window[1] is not None and elapsed >= window[1]:
+            # Stop profiling
+            profiler.disable()
+
+            # Update state
+            state['enabled'] = False
+
+            state['done'] = True
+
+    # Create context factory
+    @contextmanager
+    def profile_context_manager():
+        # Set starting time of the window
+        state['start_time'] = time_clock()
+
+        try:
+            # If window is not given
+            if window is None:
+                # Start profiling right away
+                profiler.enable()
+
+                # Update state
+                state['enabled'] = True
+
+            # Yield profile function
+            yield profile_func
+        finally:
+            # If profiling is started
+            if state['enabled']:
+                # Stop profiling
+                profiler.disable()
+
+        # Write pstats file
+        profiler.dump_stats(profile_file_path)
+
+        # Print message
+        print_stderr('{:20}{}'.format('Profile:', profile_file_path))
+
+        # Print header
+        print_stderr('  {:>11} {:>11} {:>10}  {}'.format(
+            'cumtime', 'tottime', 'ncalls', 'function'))
+
+        # For each summary message
+        for msg in format_profile_summary(
+                profiler, group_map or {}, top_n):
+            # Print message
+            print_stderr(msg)
+
+    # Return context object
+    return profile_context_manager()
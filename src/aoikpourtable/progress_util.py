@@ -0,0 +1,301 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import json
+import os
+import sys
+import time
+
+try:
+    # Python 3.3+
+    from time import monotonic as time_clock
+except ImportError:
+    # Python 2
+    from time import time as time_clock
+
+from .print_util import print_stderr
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+
+#
+def get_progress_info(
+        row_count,
+        last_row_count,
+        last_time,
+        total_row_count,
+        total_start_time,
+        now_time):
+    """
+    Get progress info.
+
+    @param row_count: Processed rows count.
+
+    @param last_row_count: Last round processed rows count.
+
+    @param last_time: Last round clock time.
+
+    @param total_row_count: Total rows count.
+
+    @param total_start_time: Total start clock time.
+
+    @param now_time: Current clock time.
+
+    @return: Progress info dict, in the format:
+    {
+        'rows': ...,
+        'round_rows': ...,
+        'total_rows': ...,
+        'rate': ...,
+        'round_rate': ...,
+        'past': ...,
+        'need': ...,
+    }
+    """
+    # Calculate duration spent this round
+    round_dura = now_time - last_time
+
+    # Calculate rows processed this round
+    round_row_count = row_count - last_row_count
+
+    # If round duration is not zero
+    if round_dura:
+        # Calculate round rate
+        round_rate = round_row_count / round_dura
+    else:
+        # Set round rate to None
+        round_rate = None
+
+    # Calculate total duration
+    total_dura = now_time - total_start_time
+
+    # If total duration is not zero
+    if total_dura:
+        # Calculate total rate
+        total_rate = row_count / total_dura
+    else:
+        # Set total rate to None
+        total_rate = None
+
+    # If total row count and total rate are not zero
+    if total_row_count and total_rate:
+        # Calculate need duration
+        need_dura = max(total_row_count - row_count, 0) / total_rate
+    else:
+        # Set need duration to None
+        need_dura = None
+
+    # Return progress info dict
+    return {
+        'rows': row_count,
+        'round_rows': round_row_count,
+        'total_rows': total_row_count,
+        'rate': total_rate,
+        'round_rate': round_rate,
+        'past': total_dura,
+        'need': need_dura,
+    }
+
+
+#
+def format_progress_info(progress_info):
+    """
+    Format progress info dict to human-readable message.
+
+    @param progress_info: Progress info dict. See "get_progress_info".
+
+    @return: Message.
+    """
+    # Create message
+    msg = '+{} ={}'.format(
+        progress_info['round_rows'],
+        progress_info['rows'])
+
+    # Get total rate
+    total_rate = progress_info['rate']
+
+    # Get round rate
+    round_rate = progress_info['round_rate']
+
+    # Get total duration
+    total_dura = progress_info['past']
+
+    # Get need duration
+    need_dura = progress_info['need']
+
+    # If total rate is not None
+    if total_rate is not None:
+        # Add total rate to message
+        msg += ' ={:.0f}/s'.format(total_rate)
+
+    # If round rate is not None
+    if round_rate is not None:
+        # Add round rate to message
+        msg += ' +{:.0f}/s'.format(round_rate)
+    else:
+        # Add round rate to message
+        msg += ' +?/s'
+
+    # Add total duration to message
+    msg = '{}, past {:.0f}s'.format(msg, total_dura)
+
+    # If need duration is not None
+    if need_dura is not None:
+        # Add need duration and total duration to message
+        msg = '{}, need {:.0f}s, total {:.0f}s'.format(
+            msg, need_dura, total_dura + need_dura)
+
+    # Return message
+    return msg
+
+
+#
+def open_progress_file(progress_file_spec):
+    """
+    Open progress file for JSON-lines output.
+
+    @param progress_file_spec: Progress file path, or "fd:N" to use an
+    inherited file descriptor.
+
+    @return: File object.
+    """
+    # If the spec is a file descriptor
+    if progress_file_spec.startswith('fd:'):
+        # Get file descriptor
+        fd = int(progress_file_spec[3:])
+
+        # Open file descriptor
+        return os.fdopen(fd, 'w')
+
+    # Open file
+    if IS_PY2:
+        return open(progress_file_spec, mode='w')
+    else:
+        return open(progress_file_spec, mode='w', encoding='utf-8')
+
+
+#
+@contextmanager
+def progress_context_factory(
+        total_row_count,
+        interval=1.0,
+        progress_file_spec=None,
+        timing_info=None):
+    """
+    Context factory that produces a progress function.
+
+    The progress function is called with the processed row count after each
+    batch. It reports progress only if at least "interval" seconds have passed
+    since the last report, so calling it often is cheap. The human-readable
+    message is printed to stderr. If progress file is given, a JSON object is
+    written as one line for each report as well.
+
+    The progress function's signature is:
+    progress_func(row_count, is_final=False)
+    "is_final" forces a report, used after the last batch. The return value is
+    the progress info dict if reported, otherwise None. See
+    "get_progress_info".
+
+    @param total_row_count: Total rows count. None if unknown.
+
+    @param interval: Minimum seconds between two reports. 0 means report for
+    each call.
+
+    @param progress_file_spec: Progress file path or "fd:N". None means no
+    JSON-lines output.
+
+    @param timing_info: Timing info dict, see "timing_util.timing_info_create".
+    If given, seconds spent in each stage are added to JSON records as
+    "stages".
+
+    @return: A context object that yields the progress function.
+    """
+    # Open progress file
+    if progress_file_spec:
+        progress_file = open_progress_file(progress_file_spec)
+    else:
+        progress_file = None
+
+    # Get starting time
+    total_start_time = time_clock()
+
+    # Reporter state dict.
+    # Use a dict so that the progress function can update it.
+    state = {
+        'last_row_count': 0,
+        'last_time': total_start_time,
+    }
+
+    # Create progress function
+    def progress_func(row_count, is_final=False):
+        # Get current time
+        now_time = time_clock()
+
+        # If it is not time to report
+        if not is_final and now_time - state['last_time'] < interval:
+            # Do not report
+            return None
+
+        # Get progress info
+        progress_info = get_progress_info(
+            row_count=row_count,
+            last_row_count=state['last_row_count'],
+            last_time=state['last_time'],
+            total_row_count=total_row_count,
+            total_start_time=total_start_time,
+            now_time=now_time)
+
+        # If there are rows processed since last report
+        if progress_info['round_rows']:
+            # Print message
+            print_stderr(format_progress_info(progress_info))
+
+        # Update state
+        state['last_row_count'] = row_count
+
+        state['last_time'] = now_time
+
+        # If progress file is given
+        if progress_file is not None:
+            # Get JSON record
+            record = dict(progress_info)
+
+            # Add wall clock time
+            record['time'] = time.time()
+
+            # Add final flag
+            record['final'] = is_final
+
+            # If timing info dict is given
+            if timing_info is not None:
+                # Add seconds spent in each stage
+                record['stages'] = {
+                    'input': timing_info['input'],
+                    'convert': timing_info['convert'],
+                    'output': timing_info['output'],
+                    'filtered': timing_info['filtered'],
+                }
+
+            # Write JSON record
+            progress_file.write(json.dumps(record, sort_keys=True))
+
+            progress_file.write('\n')
+
+            # Flush so that the reader sees the record in time
+            progress_file.flush()
+
+        # Return progress info dict
+        return progress_info
+
+    # Yield progress function
+    try:
+        yield progress_func
+    finally:
+        # If progress file is given
+        if progress_file is not None:
+            # Close progress file
+            progress_file.close()
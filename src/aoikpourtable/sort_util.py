@@ -0,0 +1,406 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import heapq
+import os
+import sys
+import tempfile
+
+from .print_util import print_stderr
+from .timing_util import time_clock
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    import cPickle as pickle
+else:
+    import pickle
+
+
+# Number of records pickled together in a run file. Pickling a list of
+# records is much faster than pickling records one by one.
+RUN_CHUNK_SIZE = 1024
+
+# Maximum number of runs merged at once. If there are more runs, they are
+# merged into longer runs first, so that not too many files are open at once.
+MERGE_WIDTH = 64
+
+
+#
+def format_rate_msg(label, row_count, byte_count, dura):
+    """
+    Format throughput message.
+
+    @param label: Message label.
+
+    @param row_count: Row count.
+
+    @param byte_count: Byte count. None if unknown.
+
+    @param dura: Seconds spent.
+
+    @return: Message.
+    """
+    # Get message
+    msg = '{:20}{} row{}'.format(
+        label, row_count, '' if row_count == 1 else 's')
+
+    # If byte count is known
+    if byte_count is not None:
+        # Add byte count to message
+        msg += ', {:.1f} MB'.format(byte_count / 1048576.0)
+
+    # Add duration and row rate to message
+    msg += ', {:.3f}s, {:.0f} rows/s'.format(
+        dura, row_count / dura if dura > 0 else 0)
+
+    # If byte count is known
+    if byte_count is not None:
+        # Add byte rate to message
+        msg += ', {:.1f} MB/s'.format(
+            byte_count / 1048576.0 / dura if dura > 0 else 0)
+
+    # Return message
+    return msg
+
+
+#
+def run_write(record_iter, temp_dir):
+    """
+    Write sorted records to a run file in pickle format.
+
+    @param record_iter: Iterable of sorted records.
+
+    @param temp_dir: Temp directory. None means the system default.
+
+    @return: Tuple of (run file path, record count).
+    """
+    # Create run file
+    fd, run_file_path = tempfile.mkstemp(
+        prefix='aoikpourtable-sort-', suffix='.run', dir=temp_dir)
+
+    # Record count
+    record_count = 0
+
+    # Records of one chunk
+    chunk = []
+
+    # Open run file
+    with os.fdopen(fd, 'wb') as run_file:
+        # For each record
+        for record in record_iter:
+            # Add to chunk
+            chunk.append(record)
+
+            # If the chunk is full
+            if len(chunk) >= RUN_CHUNK_SIZE:
+                # Write the chunk
+                pickle.dump(chunk, run_file, pickle.HIGHEST_PROTOCOL)
+
+                # Increment record count
+                record_count += len(chunk)
+
+                # Start a new chunk
+                chunk = []
+
+        # If there are records left
+        if chunk:
+            # Write the chunk
+            pickle.dump(chunk, run_file, pickle.HIGHEST_PROTOCOL)
+
+            # Increment record count
+            record_count += len(chunk)
+
+    # Return run file path and record count
+    return run_file_path, record_count
+
+
+#
+def run_read(run_file_path):
+    """
+    Generator that yields records from a run file.
+
+    @param run_file_path: Run file path.
+
+    @return: A generator.
+    """
+    # Open run file
+    with open(run_file_path, 'rb') as run_file:
+        # Get function that reads a chunk
+        load = pickle.Unpickler(run_file).load
+
+        # Repeat
+        while True:
+            try:
+                # Read a chunk
+                record_s = load()
+            except EOFError:
+                # Stop at end of file
+                break
+
+            # For each record in the chunk
+            for record in record_s:
+                # Yield the record
+                yield record
+
+
+#
+@contextmanager
+def sort_context_factory(key_index_s, run_row_count, temp_dir=None):
+    """
+    Context factory that produces a sorter, which sorts rows by key columns
+    using external merge sort.
+
+    Added rows are kept in memory until "run_row_count" rows are collected.
+    Then they are sorted and spilled to a run file in the temp directory.
+    After all rows are added, the merge function merges the run files and the
+    rows still in memory. Rows with equal keys keep their order. Run files
+    are deleted on context exit.
+
+    Key values of all rows must be comparable, e.g. not a mix of None and
+    strings on Python 3.
+
+    @param key_index_s: 0-based key column indices.
+
+    @param run_row_count: Maximum number of rows kept in memory.
+
+    @param temp_dir: Temp directory for run files. None means the system
+    default.
+
+    @return: A context object that yields the sorter dict, in the format:
+    {
+        'add_func': ...,
+        'merge_func': ...,
+    }
+    "add_func(row_s, row_ordinal_s)" adds rows. "row_ordinal_s" may be None.
+    "merge_func(batch_size)" is a generator that yields batches of sorted
+    rows as (rows list, row ordinals list) tuples. The row ordinals list is
+    None if row ordinals were not added.
+    """
+    # Sorter state dict.
+    # Use a dict so that the functions below can update it.
+    state = {
+        # Records in memory, each in the format:
+        # (key, sequence number, row ordinal, row)
+        # The sequence number keeps equal keys in order, and prevents rows
+        # from being compared.
+        'records': [],
+        # Next sequence number
+        'seq': 0,
+        # Whether row ordinals are added
+        'has_ordinals': False,
+        # Spilled row count
+        'spill_rows': 0,
+        # Spilled byte count
+        'spill_bytes': 0,
+        # Seconds spent on spilling
+        'spill_dura': 0.0,
+    }
+
+    # Run file paths
+    run_file_path_s = []
+
+    # Create function that sorts records in memory and spills them to a run
+    # file
+    def spill_records():
+        # Get starting time
+        spill_start_time = time_clock()
+
+        # Get records
+        record_s = state['records']
+
+        # Sort records
+        record_s.sort()
+
+        # Write run file
+        run_file_path, _ = run_write(record_s, temp_dir)
+
+        # Add to run file paths
+        run_file_path_s.append(run_file_path)
+
+        # Update stats
+        state['spill_rows'] += len(record_s)
+
+        state['spill_bytes'] += os.path.getsize(run_file_path)
+
+        state['spill_dura'] += time_clock() - spill_start_time
+
+        # Start a new list of records
+        state['records'] = []
+
+    # Create add function
+    def add_func(row_s, row_ordinal_s):
+        # Get records list
+        record_s = state['records']
+
+        # Get next sequence number
+        seq = state['seq']
+
+        # If row ordinals are given
+        if row_ordinal_s is not None:
+            # Set the flag
+            state['has_ordinals'] = True
+
+        # For each row
+        for row_index, row in enumerate(row_s):
+            # Add record
+            record_s.append((
+                tuple([row[key_index] for key_index in key_index_s]),
+                seq,
+                row_ordinal_s[row_index] if row_ordinal_s is not None
+                else None,
+                row,
+            ))
+
+            # Increment sequence number
+            seq += 1
+
+            # If the run is full
+            if len(record_s) >= run_row_count:
+                # Spill the run
+                spill_records()
+
+                # Get the new records list
+                record_s = state['records']
+
+        # Update next sequence number
+        state['seq'] = seq
+
+    # Create merge function
+    def merge_func(batch_size):
+        # If any run is spilled
+        if run_file_path_s:
+            # Print message
+            print_stderr(format_rate_msg(
+                'Spill:',
+                state['spill_rows'],
+                state['spill_bytes'],
+                state['spill_dura']))
+
+        # While there are too many runs to merge at once
+        while len(run_file_path_s) > MERGE_WIDTH:
+            # Get starting time
+            pass_start_time = time_clock()
+
+            # Get runs to merge in this pass
+            pass_run_file_path_s = run_file_path_s[:MERGE_WIDTH]
+
+            # Merge the runs into one run file
+            run_file_path, record_count = run_write(
+                heapq.merge(*[run_read(x) for x in pass_run_file_path_s]),
+                temp_dir)
+
+            # Replace the merged runs with the new run.
+            # Update the list before removing files so that the context exit
+            # does not remove them again.
+            run_file_path_s[:MERGE_WIDTH] = []
+
+            run_file_path_s.append(run_file_path)
+
+            # For each merged run
+            for pass_run_file_path in pass_run_file_path_s:
+                # Remove the run file
+                os.remove(pass_run_file_path)
+
+            # Print message
+            print_stderr(format_rate_msg(
+                'Merge pass:',
+                record_count,
+                None,
+                time_clock() - pass_start_time))
+
+        # Get records in memory
+        record_s = state['records']
+
+        # Sort records in memory
+        record_s.sort()
+
+        # Get record iterators, one for each run
+        record_iter_s = [run_read(x) for x in run_file_path_s]
+
+        # Add records in memory as the last run
+        record_iter_s.append(iter(record_s))
+
+        # Get starting time
+        merge_start_time = time_clock()
+
+        # Merged row count
+        merge_row_count = 0
+
+        # Whether row ordinals are yielded
+        has_ordinals = state['has_ordinals']
+
+        # Rows of one batch
+        row_s = []
+
+        # Row ordinals of one batch
+        row_ordinal_s = [] if has_ordinals else None
+
+        # For each record in key order
+        for _, _, row_ordinal, row in heapq.merge(*record_iter_s):
+            # Add row
+            row_s.append(row)
+
+            # If row ordinals are yielded
+            if has_ordinals:
+                # Add row ordinal
+                row_ordinal_s.append(row_ordinal)
+
+            # If batch size is met
+            if len(row_s) >= batch_size:
+                # Increment merged row count
+                merge_row_count += len(row_s)
+
+                # Yield the batch
+                yield row_s, row_ordinal_s
+
+                # Start a new batch
+                row_s = []
+
+                row_ordinal_s = [] if has_ordinals else None
+
+        # If there are rows left
+        if row_s:
+            # Increment merged row count
+            merge_row_count += len(row_s)
+
+            # Yield the batch
+            yield row_s, row_ordinal_s
+
+        # Release records in memory
+        state['records'] = []
+
+        # Print message.
+        # Time includes outputting the merged rows.
+        print_stderr(format_rate_msg(
+            'Merge:',
+            merge_row_count,
+            None,
+            time_clock() - merge_start_time))
+
+    # Print message
+    print_stderr('{:20}key columns {}, runs of {} rows, temp dir {}'.format(
+        'Sort:',
+        ','.join(str(x + 1) for x in key_index_s),
+        run_row_count,
+        temp_dir or tempfile.gettempdir()))
+
+    try:
+        # Yield sorter dict
+        yield {
+            'add_func': add_func,
+            'merge_func': merge_func,
+        }
+    finally:
+        # For each run file
+        for run_file_path in run_file_path_s:
+            # Remove the run file
+            try:
+                os.remove(run_file_path)
+            except OSError:
+                pass
@@ -0,0 +1,641 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+from datetime import datetime
+import itertools
+import re
+import sqlite3
+
+from .print_util import print_stderr
+from .uri_util import uri_query_to_args
+
+
+# Prefix of URI that SQLAlchemy uses for SQLite databases
+_URI_PREFIX = 'sqlite:///'
+
+# Prefix of arguments that are passed as PRAGMA statements
+_PRAGMA_ARG_PREFIX = 'pragma_'
+
+# Regex that a PRAGMA name or value must match.
+# PRAGMA statements do not support parameter binding, so values are checked
+# before being put into the statement text.
+_PRAGMA_TOKEN_REO = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+#
+def get_db_path(uri):
+    """
+    Get SQLite database file path from URI.
+
+    @param uri: SQLAlchemy-style URI, e.g. "sqlite:///data.db" for relative
+    path and "sqlite:////tmp/data.db" for absolute path, or a plain file path.
+
+    @return: Database file path.
+    """
+    # If the URI is SQLAlchemy-style
+    if uri.startswith(_URI_PREFIX):
+        # Remove the prefix
+        return uri[len(_URI_PREFIX):]
+
+    # Use the URI as file path
+    return uri
+
+
+#
+def quote_name(name):
+    """
+    Quote an identifier for use in SQL statement text.
+
+    @param name: Identifier.
+
+    @return: Quoted identifier.
+    """
+    # Return quoted identifier
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+#
+def get_table_text(schema_name, table_name):
+    """
+    Get quoted table name, prefixed with schema name if given.
+
+    @param schema_name: Schema name, i.e. the attached database name. None
+    means the main database.
+
+    @param table_name: Table name.
+
+    @return: Quoted table name.
+    """
+    # If schema name is given
+    if schema_name:
+        # Return quoted schema name and table name
+        return '{}.{}'.format(quote_name(schema_name), quote_name(table_name))
+
+    # Return quoted table name
+    return quote_name(table_name)
+
+
+#
+def connect(uri, args_dict):
+    """
+    Open SQLite connection and execute PRAGMA statements given in arguments.
+
+    Arguments prefixed with "pragma_" are popped from the arguments dict, e.g.
+    "pragma_journal_mode=OFF" executes "PRAGMA journal_mode = OFF".
+
+    @param uri: Database URI. See "get_db_path".
+
+    @param args_dict: Arguments dict.
+
+    @return: Connection object in autocommit mode, transactions are managed
+    by the caller.
+    """
+    # Open connection.
+    # Use autocommit mode so that transactions are managed explicitly.
+    # Allow the connection to be used by a thread other than the one that
+    # created it, e.g. a fan-out output worker. It is still used by one
+    # thread at a time.
+    connec = sqlite3.connect(
+        get_db_path(uri), isolation_level=None, check_same_thread=False)
+
+    # For each argument name, sorted so that the order is stable
+    for arg_name in sorted(args_dict.keys()):
+        # If the argument is not a PRAGMA argument
+        if not arg_name.startswith(_PRAGMA_ARG_PREFIX):
+            # Ignore
+            continue
+
+        # Get PRAGMA name
+        pragma_name = arg_name[len(_PRAGMA_ARG_PREFIX):]
+
+        # Get PRAGMA value
+        pragma_value = args_dict.pop(arg_name)
+
+        # If PRAGMA name or value is not valid
+        if not _PRAGMA_TOKEN_REO.match(pragma_name) \
+                or not _PRAGMA_TOKEN_REO.match(pragma_value):
+            # Raise exception
+            raise ValueError(
+                'Invalid PRAGMA argument: {}={}'.format(
+                    arg_name, pragma_value))
+
+        # Execute PRAGMA statement
+        connec.execute('PRAGMA {} = {}'.format(pragma_name, pragma_value))
+
+        # Print message
+        print_stderr('{:20}{} = {}'.format(
+            'Pragma:', pragma_name, pragma_value))
+
+    # Return connection object
+    return connec
+
+
+#
+def get_select_text(args_dict, args, cmd_args, with_rowid=False, connec=None):
+    """
+    Get SELECT statement text and parameters from input arguments.
+
+    @param args_dict: Arguments dict.
+
+    @param args: Input arguments string, for error message.
+
+    @param cmd_args: Command arguments dict.
+
+    @param with_rowid: Whether to select "rowid" as the first column and order
+    by it.
+
+    @param connec: Database connection, used to get the table's column names
+    if filter expression is given without "columns" argument.
+
+    @return: A tuple of 2 elements: (statement text, parameters list).
+    """
+    # Get schema name
+    schema_name = args_dict.pop('schema', None)
+
+    # Get table name
+    table_name = args_dict.pop('table', None)
+
+    # If table name is not specified
+    if not table_name:
+        # Raise exception
+        raise ValueError(
+            '"table" argument is not specified in input arguments: {}'
+            .format(args))
+
+    # Print message
+    print_stderr('{:20}{}'.format('Schema:', schema_name))
+
+    print_stderr('{:20}{}'.format('Table:', table_name))
+
+    # Get columns argument
+    columns_text = args_dict.pop('columns', None)
+
+    # If columns argument is specified
+    if columns_text:
+        # Get quoted column names
+        column_text = ', '.join(
+            quote_name(column_name)
+            for column_name in columns_text.split(','))
+    else:
+        # Select all columns
+        column_text = '*'
+
+    # Get filter expression tree
+    where_node = cmd_args.get('where', None)
+
+    # If filter expression is given
+    if where_node is not None:
+        # Import here because it is needed only when filtering.
+        # This saves startup time.
+        from .where_util import resolve_where_columns
+        from .where_util import where_to_sql_text
+
+        # If columns argument is specified
+        if columns_text:
+            # Get column names
+            column_name_s = columns_text.split(',')
+        else:
+            # Get the table's column names
+            column_name_s = [
+                row[1] for row in connec.execute(
+                    'PRAGMA {}table_info({})'.format(
+                        quote_name(schema_name) + '.' if schema_name else '',
+                        quote_name(table_name)))
+            ]
+
+        # Resolve column names to column indices
+        where_node = resolve_where_columns(where_node, column_name_s)
+
+        # Get filter text and parameters
+        where_text, where_param_s = where_to_sql_text(
+            where_node, [quote_name(x) for x in column_name_s])
+    else:
+        # No filter
+        where_text, where_param_s = None, []
+
+    # If "rowid" is needed
+    if with_rowid:
+        # Select "rowid" as the first column
+        column_text = 'rowid, ' + column_text
+
+    # Statement parts list
+    part_s = ['SELECT', column_text, 'FROM',
+              get_table_text(schema_name, table_name)]
+
+    # Parameters list
+    param_s = []
+
+    # "WHERE" conditions list
+    condition_s = []
+
+    # If filter is given
+    if where_text:
+        # Add filter condition
+        condition_s.append(where_text)
+
+        param_s.extend(where_param_s)
+
+    # Get "rowid" to resume after
+    resume_position = cmd_args.get('resume_position', None)
+
+    # If "rowid" to resume after is given
+    if resume_position is not None:
+        # Select rows after the "rowid"
+        condition_s.append('rowid > ?')
+
+        param_s.append(resume_position)
+
+    # If there are conditions
+    if condition_s:
+        # Add "WHERE"
+        part_s.append('WHERE ' + ' AND '.join(condition_s))
+
+    # If "rowid" is needed
+    if with_rowid:
+        # Order by "rowid" so that it works as position
+        part_s.append('ORDER BY rowid')
+
+    # Get starting ending row difference
+    start_end_row_diff = cmd_args['start_end_row_diff']
+
+    # Add "LIMIT". -1 means no limit.
+    part_s.append('LIMIT ?')
+
+    param_s.append(
+        -1 if start_end_row_diff is None else start_end_row_diff)
+
+    # If "rowid" to resume after is not given
+    if resume_position is None:
+        # Add "OFFSET"
+        part_s.append('OFFSET ?')
+
+        param_s.append(cmd_args['start_row_index'] or 0)
+
+    # Return the tuple
+    return ' '.join(part_s), param_s
+
+
+#
+def select_factory(uri, query, args, cmd_args):
+    """
+    Input factory that reads rows from SQLite database using "sqlite3" module
+    directly.
+
+    Input arguments:
+    - table: Table name. Not needed if input query is given.
+    - schema: Attached database name.
+    - columns: Comma-separated column names. Default is all columns.
+    - fetch: Number of rows to fetch at a time. Default is batch size.
+    - pragma_NAME: PRAGMA to set, e.g. "pragma_cache_size=-100000".
+
+    If input query is given, it is executed as is and range control and
+    filter are done by the program framework. Otherwise range control is done
+    by "LIMIT" and "OFFSET", filter is done by "WHERE", and checkpoint
+    position is the "rowid" of the last row read.
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Factory info dict.
+    """
+    # Print message
+    print_stderr('{:20}{}'.format('Input:', uri))
+
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get fetch size
+    fetch_size = int(args_dict.pop('fetch', cmd_args['batch_size']))
+
+    # Open connection
+    connec = connect(uri, args_dict)
+
+    # Whether to track "rowid" as checkpoint position
+    need_position = False
+
+    # If input query is specified
+    if query:
+        # Use the query as is
+        stmt_text = query
+
+        param_s = []
+
+        # Whether support range control
+        support_range_control = False
+
+    else:
+        # Whether to track "rowid" as checkpoint position
+        need_position = bool(
+            cmd_args.get('checkpoint_file_path', None)
+            or cmd_args.get('resume_position', None) is not None)
+
+        # Get statement text and parameters
+        stmt_text, param_s = get_select_text(
+            args_dict, args, cmd_args, with_rowid=need_position,
+            connec=connec)
+
+        # Tell program framework that range control has been done
+        support_range_control = True
+
+    # Print message
+    print_stderr('{:20}{}'.format('Statement:', stmt_text))
+
+    # Execute statement
+    cursor = connec.execute(stmt_text, param_s)
+
+    # Get column names of the result, used to resolve column names in
+    # filter expression
+    column_name_s = [x[0] for x in cursor.description or []]
+
+    # If "rowid" is selected as the first column
+    if need_position:
+        # Remove it
+        column_name_s = column_name_s[1:]
+
+    # Position info dict.
+    # Use a dict so that the generator below can update it.
+    position_info = {
+        'position': cmd_args.get('resume_position', None),
+    }
+
+    # Create generator factory
+    def rows_generator_factory():
+        # Get fetch function
+        fetchmany = cursor.fetchmany
+
+        # Repeat
+        while True:
+            # Fetch rows
+            row_s = fetchmany(fetch_size)
+
+            # If no more rows
+            if not row_s:
+                # Stop
+                return
+
+            # Yield rows
+            yield row_s
+
+    # Create generator factory
+    def position_row_generator_factory(row_iter):
+        # For each row, with "rowid" as the first column
+        for row in row_iter:
+            # Set position to the row's "rowid"
+            position_info['position'] = row[0]
+
+            # Yield the row without "rowid"
+            yield row[1:]
+
+    # Create context factory
+    @contextmanager
+    def input_context_factory():
+        # Get row iterator
+        row_iter = itertools.chain.from_iterable(rows_generator_factory())
+
+        # If "rowid" is tracked
+        if need_position:
+            # Wrap the row iterator to track "rowid" of the last row read
+            row_iter = position_row_generator_factory(row_iter)
+
+        try:
+            # Yield row iterator
+            yield row_iter
+        finally:
+            # Close connection
+            connec.close()
+
+    # Get factory info dict
+    factory_info = {
+        'input_obj': input_context_factory(),
+        'support_range_control': support_range_control,
+        # Filter expression has been applied in the statement, unless input
+        # query is given
+        'support_where': not query,
+        'column_names': column_name_s,
+    }
+
+    # If "rowid" is tracked
+    if need_position:
+        # Set position function
+        factory_info['position_func'] = lambda: position_info['position']
+
+    # Return factory info dict
+    return factory_info
+
+
+#
+def count_rows(uri, query, args, cmd_args):
+    """
+    Count factory that counts rows of a SQLite table.
+
+    Count arguments are the same as the input arguments of "select_factory".
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Count arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Count info dict, in the format:
+    {
+        'count': ...,
+        'duration': ...,
+        'rate': ...,
+    }
+    """
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Remove fetch size argument
+    args_dict.pop('fetch', None)
+
+    # Open connection
+    connec = connect(uri, args_dict)
+
+    # Get starting time
+    count_start_time = datetime.utcnow()
+
+    try:
+        # If input query is specified
+        if query:
+            # Count rows of the query
+            stmt_text = 'SELECT COUNT(*) FROM ({})'.format(query)
+
+            param_s = []
+        else:
+            # Get SELECT statement text and parameters
+            select_text, param_s = get_select_text(
+                args_dict, args, cmd_args, connec=connec)
+
+            # Count rows of the SELECT statement, with range control applied
+            stmt_text = 'SELECT COUNT(*) FROM ({})'.format(select_text)
+
+        # Get count
+        count = connec.execute(stmt_text, param_s).fetchone()[0]
+    finally:
+        # Close connection
+        connec.close()
+
+    # Get duration
+    count_dura = (datetime.utcnow() - count_start_time).total_seconds()
+
+    # If input query is specified
+    if query:
+        # Get starting row ordinal
+        start_row_ordinal = cmd_args['start_row_ordinal']
+
+        # Get ending row ordinal
+        end_row_ordinal = cmd_args['end_row_ordinal']
+
+        # If ending row ordinal is specified
+        if end_row_ordinal:
+            # Limit count to ending row ordinal exclusive
+            count = min(count, end_row_ordinal - 1)
+
+        # If starting row ordinal is specified
+        if start_row_ordinal:
+            # Deduct from count
+            count = max(count - (start_row_ordinal - 1), 0)
+
+    # Return count info dict
+    return {
+        'count': count,
+        'duration': count_dura,
+        'rate': count / count_dura if count_dura else None,
+    }
+
+
+#
+def insert_factory(uri, query, args, cmd_args):
+    """
+    Output factory that inserts rows into SQLite database using "sqlite3"
+    module's "executemany" with a prepared statement, one transaction per
+    batch.
+
+    Output arguments:
+    - table: Table name. Not needed if output query is given.
+    - schema: Attached database name.
+    - columns: Comma-separated column names. Default is all columns.
+    - pragma_NAME: PRAGMA to set, e.g. "pragma_journal_mode=OFF" and
+      "pragma_synchronous=OFF" for bulk loads.
+
+    If output query is given, it is used as the INSERT statement, with "?" as
+    parameter placeholders.
+
+    @param uri: Output URI.
+
+    @param query: Output query.
+
+    @param args: Output arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: An insert function context object.
+    """
+    # Print message
+    print_stderr('{:20}{}'.format('Output:', uri))
+
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Open connection
+    connec = connect(uri, args_dict)
+
+    # If output query is specified
+    if query:
+        # Use the query as is
+        stmt_text = query
+
+    else:
+        # Get schema name
+        schema_name = args_dict.pop('schema', None)
+
+        # Get table name
+        table_name = args_dict.pop('table', None)
+
+        # If table name is not specified
+        if not table_name:
+            # Raise exception
+            raise ValueError(
+                '"table" argument is not specified in output arguments: {}'
+                .format(args))
+
+        # Print message
+        print_stderr('{:20}{}'.format('Schema:', schema_name))
+
+        print_stderr('{:20}{}'.format('Table:', table_name))
+
+        # Get columns argument
+        columns_text = args_dict.pop('columns', None)
+
+        # If columns argument is specified
+        if columns_text:
+            # Split columns argument into column names
+            column_name_s = columns_text.split(',')
+        else:
+            # Get table info statement text
+            info_text = 'PRAGMA {}table_info({})'.format(
+                quote_name(schema_name) + '.' if schema_name else '',
+                quote_name(table_name))
+
+            # Get column names from the table
+            column_name_s = [
+                info_row[1] for info_row in connec.execute(info_text)]
+
+            # If the table does not exist
+            if not column_name_s:
+                # Raise exception
+                raise ValueError('Table not found: {}'.format(table_name))
+
+        # Get statement text
+        stmt_text = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            get_table_text(schema_name, table_name),
+            ', '.join(quote_name(x) for x in column_name_s),
+            ', '.join('?' * len(column_name_s)))
+
+    # Print message
+    print_stderr('{:20}{}'.format('Statement:', stmt_text))
+
+    # Create output function
+    def insert_func(rows):
+        # Begin transaction
+        connec.execute('BEGIN')
+
+        try:
+            # Execute statement
+            connec.executemany(stmt_text, rows)
+        except Exception:
+            # Roll back transaction so that the connection can be reused,
+            # e.g. by the caller to retry part of the rows.
+            connec.execute('ROLLBACK')
+
+            # Raise the exception
+            raise
+
+        # Commit transaction
+        connec.execute('COMMIT')
+
+    # Create context factory
+    @contextmanager
+    def output_context_factory():
+        try:
+            # Yield insert function
+            yield insert_func
+        finally:
+            # Close connection
+            connec.close()
+
+    # Create context object
+    output_context = output_context_factory()
+
+    # Return context object
+    return output_context
@@ -2,8 +2,32 @@
 #
 from __future__ import absolute_import
 
+import csv
+import errno
+import io
+import json
+import os
 import sys
 
+from .csv_io import _quoting_map
+from .print_util import print_stderr
+from .uri_util import uri_query_to_args
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+#
+if IS_PY2:
+    from cStringIO import StringIO
+else:
+    from io import StringIO
+
+
+# Output function returns this, or a tuple of this and written row count, to
+# tell program framework to stop processing
+STOP_OBJ = None.__class__
+
 
 #
 def stdin_factory(uri, query, args, cmd_args):
@@ -24,12 +48,163 @@ def stdin_factory(uri, query, args, cmd_args):
     return sys.stdin
 
 
+#
+def stdin_csv_factory(uri, query, args, cmd_args):
+    """
+    Input factory that parses stdin as CSV or TSV.
+
+    Stdin is read in binary mode with a large buffer and decoded with the
+    given encoding, so each row is a list of fields instead of a text line.
+
+    Input URI and input query are not used.
+
+    Input arguments:
+    - format: "csv" or "tsv". "tsv" defaults delimiter to tab and quoting to
+      "QUOTE_NONE". Default is "csv".
+    - encoding: Default is "utf-8".
+    - lineterminator, delimiter, quotechar, quoting: Same as "csv_io".
+    - buffer: Read buffer size in bytes. Default is 1048576.
+    - count_header: If true, the first line is the number of rows that
+      follow, used as total row count since stdin can not be read twice.
+      Default is false.
+
+    @param uri: Input URI.
+
+    @param query: Input query.
+
+    @param args: Input arguments string.
+
+    @param cmd_args: Command arguments dict.
+
+    @return: Factory info dict.
+    """
+    # Print message
+    print_stderr('{:20}{}'.format('Input:', 'stdin'))
+
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get format
+    format_name = args_dict.pop('format', 'csv')
+
+    # If format is not valid
+    if format_name not in ('csv', 'tsv'):
+        # Raise exception
+        raise ValueError(
+            '"format" argument must be "csv" or "tsv": {}'.format(args))
+
+    # Whether the format is TSV
+    is_tsv = format_name == 'tsv'
+
+    # Print message
+    print_stderr('{:20}{}'.format('format:', format_name))
+
+    # Get encoding
+    encoding = args_dict.pop('encoding', 'utf-8')
+
+    # Print message
+    print_stderr('{:20}{}'.format('encoding:', encoding))
+
+    # Get line terminator
+    lineterminator = args_dict.pop('lineterminator', '\n')
+
+    # Print message
+    print_stderr('{:20}{}'.format('lineterminator:', repr(lineterminator)))
+
+    # Get delimiter
+    delimiter = args_dict.pop('delimiter', '\t' if is_tsv else ',')
+
+    # Print message
+    print_stderr('{:20}{}'.format('delimiter:', repr(delimiter)))
+
+    # Get quote character
+    quotechar = args_dict.pop('quotechar', '"')
+
+    # Print message
+    print_stderr('{:20}{}'.format('quotechar', repr(quotechar)))
+
+    # Get quoting mode
+    quoting = args_dict.pop('quoting', 'QUOTE_NONE' if is_tsv else 'QUOTE_ALL')
+
+    # Print message
+    print_stderr('{:20}{}'.format('quoting', quoting))
+
+    # Get quoting mode int
+    quoting_int = _quoting_map[quoting]
+
+    # Get buffer size
+    buffer_size = int(args_dict.pop('buffer', '1048576'))
+
+    # Get count header flag
+    has_count_header = \
+        args_dict.pop('count_header', '0') not in ('', '0', 'false')
+
+    # Open stdin in binary mode with a large buffer.
+    # Do not close stdin's file descriptor when the file object is closed.
+    input_file = io.open(
+        sys.stdin.fileno(), mode='rb', buffering=buffer_size, closefd=False)
+
+    # If not Python 2
+    if not IS_PY2:
+        # Decode stdin.
+        # Use "newline=''" so that the CSV reader handles line ends in quoted
+        # fields.
+        input_file = io.TextIOWrapper(
+            input_file, encoding=encoding, newline='')
+
+    # Get factory info dict
+    factory_info = {}
+
+    # If count header is used
+    if has_count_header:
+        # Read the count line
+        count_text = input_file.readline().strip()
+
+        try:
+            # Parse text to int
+            count = int(count_text)
+        except ValueError:
+            # Raise exception
+            raise ValueError(
+                'Count header is not an integer: {!r}'.format(count_text))
+
+        # Tell program framework the total row count
+        factory_info['count'] = count
+
+    # Get CSV reader
+    factory_info['input_obj'] = csv.reader(
+        input_file,
+        lineterminator=lineterminator,
+        delimiter=delimiter,
+        quotechar=quotechar,
+        quoting=quoting_int)
+
+    # Return factory info dict
+    return factory_info
+
+
 #
 def stdout_factory(uri, query, args, cmd_args):
     """
     Output factory that produces an output function that writes to
     "sys.stdout".
 
+    Each batch is formatted into one buffer and written to stdout's file
+    descriptor. If stdout's reader goes away, e.g. "| head", the output
+    function asks the program framework to stop processing, and tells how
+    many rows of the batch were written before that.
+
+    Output URI and output query are not used.
+
+    Output arguments:
+    - format: "repr", "csv", "tsv" or "ndjson". "repr" writes each row's
+      "repr" text on a line. "ndjson" writes each row as a JSON array on a
+      line. Default is "repr".
+    - encoding: Default is "utf-8".
+    - lineterminator, delimiter, quotechar, quoting: Same as "csv_io", for
+      "csv" and "tsv". "tsv" defaults delimiter to tab and quoting to
+      "QUOTE_NONE", so fields can not contain tab or line end.
+
     @param uri: Output URI.
 
     @param query: Output query.
@@ -40,20 +215,154 @@ def stdout_factory(uri, query, args, cmd_args):
 
     @return: An output function that writes to "sys.stdout".
     """
+    # Get arguments dict
+    args_dict = uri_query_to_args(args, flatten=True)
+
+    # Get format
+    format_name = args_dict.pop('format', 'repr')
+
+    # If format is not valid
+    if format_name not in ('repr', 'csv', 'tsv', 'ndjson'):
+        # Raise exception
+        raise ValueError(
+            '"format" argument must be "repr", "csv", "tsv" or "ndjson": {}'
+            .format(args))
+
+    # Print message
+    print_stderr('{:20}{}'.format('Output:', 'stdout'))
+
+    print_stderr('{:20}{}'.format('format:', format_name))
+
+    # Get encoding
+    encoding = args_dict.pop('encoding', 'utf-8')
+
+    # Print message
+    print_stderr('{:20}{}'.format('encoding:', encoding))
+
+    # If format is CSV or TSV
+    if format_name in ('csv', 'tsv'):
+        # Whether the format is TSV
+        is_tsv = format_name == 'tsv'
+
+        # Create buffer
+        buffer_file = StringIO()
+
+        # Get CSV writer
+        csv_writer = csv.writer(
+            buffer_file,
+            lineterminator=args_dict.pop('lineterminator', '\n'),
+            delimiter=args_dict.pop('delimiter', '\t' if is_tsv else ','),
+            quotechar=args_dict.pop('quotechar', '"'),
+            quoting=_quoting_map[args_dict.pop(
+                'quoting', 'QUOTE_NONE' if is_tsv else 'QUOTE_ALL')])
+
+        # Create format function
+        def format_func(rows):
+            # Empty the buffer
+            buffer_file.seek(0)
+
+            buffer_file.truncate()
+
+            # Format rows into the buffer
+            csv_writer.writerows(rows)
+
+            # Return the buffer's text
+            return buffer_file.getvalue()
+
+    # If format is NDJSON
+    elif format_name == 'ndjson':
+        # Create format function
+        def format_func(rows):
+            # Format each row as a JSON array on a line.
+            # Values JSON does not support, e.g. dates, are written as text.
+            return ''.join([
+                json.dumps(row, ensure_ascii=False, default=str) + '\n'
+                for row in rows
+            ])
+
+    # If format is repr
+    else:
+        # Create format function
+        def format_func(rows):
+            # Format each row's repr text on a line
+            return ''.join([repr(row) + '\n' for row in rows])
+
+    # Flush text already written to stdout
+    sys.stdout.flush()
+
+    # If not Python 2
+    if not IS_PY2:
+        # Flush stdout's binary layer
+        sys.stdout.buffer.flush()
+
+    # Get stdout's file descriptor.
+    # Write to it directly, so that the number of bytes written is known
+    # when the pipe breaks.
+    output_fd = sys.stdout.fileno()
+
+    # Create function that encodes text
+    def encode_func(text):
+        # Encode text
+        if not IS_PY2 or isinstance(text, unicode):  # noqa: F821
+            return text.encode(encoding)
+        else:
+            return text
+
     # Create output function
     def output_func(rows):
-        # For each row
-        for row in rows:
-            # Get row string
-            row_str = repr(row)
-
-            # Write row string
-            sys.stdout.write(row_str)
-
-            # If row string is not empty and last character is not newline
-            if row_str and row_str[-1] != '\n':
-                # Write newline
-                sys.stdout.write('\n')
+        # Format and encode rows
+        data = encode_func(format_func(rows))
+
+        # Number of bytes written
+        byte_count = 0
+
+        try:
+            # While not all bytes are written
+            while byte_count < len(data):
+                # Write the bytes left. Add number of bytes written.
+                byte_count += os.write(output_fd, data[byte_count:])
+        except (IOError, OSError) as exc:
+            # If the error is not broken pipe
+            if exc.errno != errno.EPIPE:
+                # Raise the exception
+                raise
+
+            # Point stdout to devnull, so that flushing stdout on exit does
+            # not fail again
+            devnull_fd = os.open(os.devnull, os.O_WRONLY)
+
+            os.dup2(devnull_fd, output_fd)
+
+            os.close(devnull_fd)
+
+            # Number of rows written completely
+            row_count = 0
+
+            # Ending byte offset of the current row
+            row_end = 0
+
+            # For each row
+            for row in rows:
+                # Get the row's ending byte offset
+                row_end += len(encode_func(format_func([row])))
+
+                # If the row is not written completely
+                if row_end > byte_count:
+                    # Stop
+                    break
+
+                # Increment number of rows written completely
+                row_count += 1
+
+            # Print message
+            print_stderr('{:20}{}'.format(
+                'Output:',
+                'broken pipe, stop after {} of {} rows in batch'.format(
+                    row_count, len(rows))))
+
+            # Tell program framework to stop processing, and how many rows
+            # are written
+            return STOP_OBJ, row_count
 
     # Return output function
     return output_func
@@ -0,0 +1,226 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import math
+
+try:
+    # Python 3.3+
+    from time import perf_counter as time_clock
+except ImportError:
+    # Python 2
+    from time import time as time_clock
+
+
+#
+def timing_info_create():
+    """
+    Create timing info dict that accumulates time spent in each stage.
+
+    @return: Timing info dict, in the format:
+    {
+        'input': ...,
+        'convert': ...,
+        'output': ...,
+        'filtered': ...,
+        'output_duras': [...],
+    }
+    "input", "convert" and "output" are seconds spent in each stage.
+    "filtered" is the number of rows filtered by the convert stage.
+    "output_duras" is the list of seconds spent on each batch output.
+    """
+    # Return timing info dict
+    return {
+        'input': 0.0,
+        'convert': 0.0,
+        'output': 0.0,
+        'filtered': 0,
+        'output_duras': [],
+    }
+
+
+#
+def timed_iter(iterable, timing_info):
+    """
+    Generator that yields items from the iterable, adding time spent in getting
+    each item to timing info dict's "input" value.
+
+    @param iterable: Iterable to get items from.
+
+    @param timing_info: Timing info dict. See "timing_info_create".
+
+    @return: A generator.
+    """
+    # Get iterator
+    iterator = iter(iterable)
+
+    # Repeat
+    while True:
+        # Get starting time
+        start_time = time_clock()
+
+        try:
+            # Get next item
+            item = next(iterator)
+        except StopIteration:
+            # Add time spent
+            timing_info['input'] += time_clock() - start_time
+
+            # Stop
+            return
+
+        # Add time spent
+        timing_info['input'] += time_clock() - start_time
+
+        # Yield the item
+        yield item
+
+
+#
+def get_percentile(sorted_values, percent):
+    """
+    Get percentile value using nearest-rank method.
+
+    @param sorted_values: Sorted values list, not empty.
+
+    @param percent: Percent, in range [0, 100].
+
+    @return: Percentile value.
+    """
+    # Get rank, one-based.
+    # Use "ceil" instead of "round", whose round-half-to-even on Python 3
+    # gives one rank too many for some values.
+    rank = max(1, int(math.ceil(percent / 100.0 * len(sorted_values))))
+
+    # Limit rank to valid range
+    rank = min(rank, len(sorted_values))
+
+    # Return percentile value
+    return sorted_values[rank - 1]
+
+
+#
+def format_timing_info(timing_info, total_dura):
+    """
+    Format timing info dict to human-readable messages.
+
+    @param timing_info: Timing info dict. See "timing_info_create".
+
+    @param total_dura: Total seconds of the processing.
+
+    @return: Messages list.
+    """
+    # Messages list
+    msg_s = []
+
+    # Stage parts list
+    part_s = []
+
+    # Time spent in stages
+    stages_dura = 0.0
+
+    # For each stage
+    for stage in ['input', 'convert', 'output']:
+        # Get time spent in the stage
+        stage_dura = timing_info[stage]
+
+        # Add to total time spent in stages
+        stages_dura += stage_dura
+
+        # Add stage part
+        part_s.append('{} {:.3f}s {:.0f}%'.format(
+            stage,
+            stage_dura,
+            stage_dura * 100.0 / total_dura if total_dura else 0))
+
+    # Get time spent outside the stages, e.g. progress report and checkpoint
+    other_dura = max(total_dura - stages_dura, 0.0)
+
+    # Add other part
+    part_s.append('other {:.3f}s {:.0f}%'.format(
+        other_dura,
+        other_dura * 100.0 / total_dura if total_dura else 0))
+
+    # Add message
+    msg_s.append('{:20}{}'.format('Timing:', ', '.join(part_s)))
+
+    # Get filtered row count
+    filtered_count = timing_info['filtered']
+
+    # Add message
+    msg_s.append('{:20}{} row{}'.format(
+        'Filtered:',
+        filtered_count,
+        '' if filtered_count <= 1 else 's'))
+
+    # Get batch output durations, sorted
+    output_dura_s = sorted(timing_info['output_duras'])
+
+    # If there are batch output durations
+    if output_dura_s:
+        # Add message
+        msg_s.append(
+            '{:20}p50 {:.2f}ms, p90 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms,'
+            ' {} batch{}'.format(
+                'Output latency:',
+                get_percentile(output_dura_s, 50) * 1000,
+                get_percentile(output_dura_s, 90) * 1000,
+                get_percentile(output_dura_s, 99) * 1000,
+                output_dura_s[-1] * 1000,
+                len(output_dura_s),
+                '' if len(output_dura_s) <= 1 else 'es'))
+
+    # Return messages list
+    return msg_s
+
+
+#
+def format_startup_info(step_time_s):
+    """
+    Format startup step times to human-readable messages, in the spirit of
+    "python -X importtime".
+
+    @param step_time_s: List of (step title, time, loaded module count)
+    tuples, one for each step, in order. The last step is the one where
+    startup ends.
+
+    @return: Messages list.
+    """
+    # Messages list
+    msg_s = []
+
+    # If there are less than two steps
+    if len(step_time_s) < 2:
+        # Return empty messages list
+        return msg_s
+
+    # Get total startup time
+    total_dura = step_time_s[-1][1] - step_time_s[0][1]
+
+    # Get number of modules loaded during startup
+    total_module_count = step_time_s[-1][2] - step_time_s[0][2]
+
+    # Add message
+    msg_s.append('{:20}{:.2f}ms, {} module{} loaded'.format(
+        'Startup:',
+        total_dura * 1000,
+        total_module_count,
+        '' if total_module_count == 1 else 's'))
+
+    # For each step and the next step
+    for step_time, next_step_time in zip(step_time_s, step_time_s[1:]):
+        # Get step title, starting time and loaded module count
+        title, start_time, module_count = step_time
+
+        # Get step duration
+        step_dura = next_step_time[1] - start_time
+
+        # Get number of modules loaded during the step
+        step_module_count = next_step_time[2] - module_count
+
+        # Add message
+        msg_s.append('  {:>10.2f}ms {:>6}  {}'.format(
+            step_dura * 1000, step_module_count, title))
+
+    # Return messages list
+    return msg_s
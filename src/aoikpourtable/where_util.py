@@ -0,0 +1,819 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import itertools
+import numbers
+import operator
+import re
+import sys
+
+
+#
+IS_PY2 = (sys.version_info[0] == 2)
+
+# Text value types
+if IS_PY2:
+    _TEXT_TYPES = (str, unicode)  # noqa: F821
+else:
+    _TEXT_TYPES = (str,)
+
+
+# Regex that matches one token of a filter expression
+_TOKEN_REO = re.compile(r'''
+    \s*(?:
+        (?P<num>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+        |(?P<str>'(?:[^']|'')*'|"(?:[^"]|"")*")
+        |(?P<col>\$\d+)
+        |(?P<op><=|>=|<>|!=|==|=|<|>)
+        |(?P<paren>[()])
+        |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )''', re.VERBOSE)
+
+# Keywords, matched case-insensitively
+_KEYWORDS = ('and', 'or', 'not', 'is', 'null')
+
+# Map comparison operator to normalized operator
+_OP_MAP = {
+    '=': '=',
+    '==': '=',
+    '!=': '!=',
+    '<>': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+}
+
+# Map normalized operator to Python operator
+_PY_OP_MAP = {
+    '=': '==',
+    '!=': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+}
+
+# Map normalized operator to operator function
+_OP_FUNC_MAP = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Input object returns None.__class__ to mean "stop processing"
+STOP_OBJ = None.__class__
+
+
+#
+def tokenize(where_text):
+    """
+    Split filter expression into tokens.
+
+    @param where_text: Filter expression.
+
+    @return: List of (token kind, token value) tuples. Token kind is one of
+    "num", "str", "col", "op", "paren", "name" and "kw".
+    """
+    # The tokens list
+    token_s = []
+
+    # Current position
+    position = 0
+
+    # Get text length, ignoring trailing spaces
+    text_len = len(where_text.rstrip())
+
+    # While not at end of text
+    while position < text_len:
+        # Match a token
+        match = _TOKEN_REO.match(where_text, position)
+
+        # If no token matches
+        if match is None:
+            # Raise exception
+            raise ValueError(
+                'Invalid filter expression at position {}: {}'.format(
+                    position, where_text))
+
+        # Get token kind
+        kind = match.lastgroup
+
+        # Get token value
+        value = match.group(kind)
+
+        # If the token is a number
+        if kind == 'num':
+            # Convert to int or float
+            if re.match(r'^-?\d+$', value):
+                value = int(value)
+            else:
+                value = float(value)
+
+        # If the token is a string
+        elif kind == 'str':
+            # Remove quotes and unescape doubled quotes
+            value = value[1:-1].replace(value[0] * 2, value[0])
+
+        # If the token is a column index
+        elif kind == 'col':
+            # Get 1-based column index
+            value = int(value[1:])
+
+            # If the index is not valid
+            if value <= 0:
+                # Raise exception
+                raise ValueError(
+                    'Column index must be greater than 0: {}'.format(
+                        where_text))
+
+            # Convert to 0-based column index
+            value -= 1
+
+        # If the token is an operator
+        elif kind == 'op':
+            # Normalize operator
+            value = _OP_MAP[value]
+
+        # If the token is a name and is a keyword
+        elif kind == 'name' and value.lower() in _KEYWORDS:
+            # Use keyword kind
+            kind = 'kw'
+
+            value = value.lower()
+
+        # Add token
+        token_s.append((kind, value))
+
+        # Move to the token end
+        position = match.end()
+
+    # Return the tokens list
+    return token_s
+
+
+#
+def parse_where(where_text):
+    """
+    Parse filter expression to expression tree.
+
+    Grammar:
+    expr := and_expr ("or" and_expr)*
+    and_expr := not_expr ("and" not_expr)*
+    not_expr := "not" not_expr | "(" expr ")" | comparison
+    comparison := operand op operand | operand "is" ["not"] "null"
+    operand := $N | column name | number | 'string' | "string"
+    op := = | == | != | <> | < | <= | > | >=
+
+    Keywords are case-insensitive.
+
+    @param where_text: Filter expression.
+
+    @return: Expression tree. Each node is a tuple, one of:
+    ('or', [node, ...])
+    ('and', [node, ...])
+    ('not', node)
+    ('cmp', op, operand, operand)
+    ('null', operand, is_not)
+    Each operand is ('col', 0-based column index or column name) or
+    ('lit', value).
+    """
+    # Get tokens
+    token_s = tokenize(where_text)
+
+    # Parser state dict.
+    # Use a dict so that the functions below can update it.
+    state = {
+        'index': 0,
+    }
+
+    # Create function that returns the current token
+    def peek():
+        # If not at end of tokens
+        if state['index'] < len(token_s):
+            # Return the current token
+            return token_s[state['index']]
+
+        # Return end marker
+        return (None, None)
+
+    # Create function that raises syntax error
+    def raise_error(expected):
+        raise ValueError(
+            'Invalid filter expression, expected {} at token {}: {}'.format(
+                expected, state['index'] + 1, where_text))
+
+    # Create function that consumes the current token
+    def take():
+        # Get the current token
+        token = peek()
+
+        # Move to next token
+        state['index'] += 1
+
+        # Return the token
+        return token
+
+    # Create function that parses an operand
+    def parse_operand():
+        # Get the token
+        kind, value = take()
+
+        # If the token is a column index or a column name
+        if kind in ('col', 'name'):
+            # Return column operand
+            return ('col', value)
+
+        # If the token is a number or a string
+        if kind in ('num', 'str'):
+            # Return literal operand
+            return ('lit', value)
+
+        # Raise exception
+        raise_error('column or value')
+
+    # Create function that parses a "not" expression
+    def parse_not():
+        # If the token is "not"
+        if peek() == ('kw', 'not'):
+            # Consume the token
+            take()
+
+            # Return "not" node
+            return ('not', parse_not())
+
+        # If the token is "("
+        if peek() == ('paren', '('):
+            # Consume the token
+            take()
+
+            # Parse inner expression
+            node = parse_or()
+
+            # If the token is not ")"
+            if take() != ('paren', ')'):
+                # Raise exception
+                raise_error('")"')
+
+            # Return inner expression
+            return node
+
+        # Parse left operand
+        left = parse_operand()
+
+        # If the token is "is"
+        if peek() == ('kw', 'is'):
+            # Consume the token
+            take()
+
+            # Whether it is "is not"
+            is_not = peek() == ('kw', 'not')
+
+            # If it is "is not"
+            if is_not:
+                # Consume the token
+                take()
+
+            # If the token is not "null"
+            if take() != ('kw', 'null'):
+                # Raise exception
+                raise_error('"null"')
+
+            # Return null node
+            return ('null', left, is_not)
+
+        # Get operator token
+        kind, op = take()
+
+        # If the token is not an operator
+        if kind != 'op':
+            # Raise exception
+            raise_error('comparison operator')
+
+        # Parse right operand
+        right = parse_operand()
+
+        # Return comparison node
+        return ('cmp', op, left, right)
+
+    # Create function that parses an "and" expression
+    def parse_and():
+        # Parse the first operand
+        node_s = [parse_not()]
+
+        # While the token is "and"
+        while peek() == ('kw', 'and'):
+            # Consume the token
+            take()
+
+            # Parse the next operand
+            node_s.append(parse_not())
+
+        # Return the node
+        return node_s[0] if len(node_s) == 1 else ('and', node_s)
+
+    # Create function that parses an "or" expression
+    def parse_or():
+        # Parse the first operand
+        node_s = [parse_and()]
+
+        # While the token is "or"
+        while peek() == ('kw', 'or'):
+            # Consume the token
+            take()
+
+            # Parse the next operand
+            node_s.append(parse_and())
+
+        # Return the node
+        return node_s[0] if len(node_s) == 1 else ('or', node_s)
+
+    # Parse expression
+    node = parse_or()
+
+    # If there are tokens left
+    if state['index'] < len(token_s):
+        # Raise exception
+        raise_error('end of expression')
+
+    # Return expression tree
+    return node
+
+
+#
+def map_where_columns(node, map_func):
+    """
+    Create a copy of expression tree with each column operand's reference
+    mapped by a function.
+
+    @param node: Expression tree. See "parse_where".
+
+    @param map_func: Function that takes a column reference, which is a
+    0-based column index or a column name, and returns the new reference.
+
+    @return: New expression tree.
+    """
+    # Get node kind
+    kind = node[0]
+
+    # If the node is "or" or "and"
+    if kind in ('or', 'and'):
+        return (kind, [map_where_columns(x, map_func) for x in node[1]])
+
+    # If the node is "not"
+    if kind == 'not':
+        return (kind, map_where_columns(node[1], map_func))
+
+    # Create function that maps an operand
+    def map_operand(operand):
+        # If the operand is a column
+        if operand[0] == 'col':
+            # Map the column reference
+            return ('col', map_func(operand[1]))
+
+        # Return literal operand as is
+        return operand
+
+    # If the node is a comparison
+    if kind == 'cmp':
+        return (kind, node[1], map_operand(node[2]), map_operand(node[3]))
+
+    # The node is a null check
+    return (kind, map_operand(node[1]), node[2])
+
+
+#
+def resolve_where_columns(node, column_name_s):
+    """
+    Resolve column names in expression tree to 0-based column indices.
+
+    @param node: Expression tree. See "parse_where".
+
+    @param column_name_s: Column names of input rows. None if unknown.
+
+    @return: New expression tree with column indices only.
+    """
+    # Create function that maps a column reference to column index
+    def map_func(column_ref):
+        # If the reference is a column index
+        if not isinstance(column_ref, str):
+            # If column names are known and the index is out of range
+            if column_name_s is not None \
+                    and column_ref >= len(column_name_s):
+                # Raise exception
+                raise ValueError(
+                    'Filter column index ${} is out of range, the input has'
+                    ' {} columns.'.format(column_ref + 1, len(column_name_s)))
+
+            # Return the index
+            return column_ref
+
+        # If column names are not known
+        if column_name_s is None:
+            # Raise exception
+            raise ValueError(
+                'Filter column name "{}" can not be used because the input'
+                ' does not tell column names. Use "$N" instead.'.format(
+                    column_ref))
+
+        # If the name is not a column name
+        if column_ref not in column_name_s:
+            # Raise exception
+            raise ValueError(
+                'Filter column name "{}" is not one of the input columns:'
+                ' {}'.format(column_ref, ', '.join(column_name_s)))
+
+        # Return the index
+        return column_name_s.index(column_ref)
+
+    # Return new expression tree
+    return map_where_columns(node, map_func)
+
+
+#
+def where_to_python(node, is_true=True):
+    """
+    Convert expression tree to Python expression source that tests "row".
+
+    The source follows SQL three-valued logic, so that a filter gives the same
+    rows whether it runs in Python or in the database. A comparison with a
+    None operand is neither true nor false, and so is "not" of it. Because
+    Python has only two values, the source tests either that the expression
+    is true, or that it is false.
+
+    A comparison with a number converts the column value to a number, so that
+    e.g. CSV fields compare as numbers. A value that is not a number compares
+    as NaN, which means all comparisons are false except "!=". Other
+    comparisons use "compare_values", so that values of mixed types, e.g. an
+    integer column and a string, do not raise.
+
+    @param node: Expression tree with column indices only.
+
+    @param is_true: Whether the source tests that the expression is true.
+    Otherwise the source tests that the expression is false.
+
+    @return: Python expression source.
+    """
+    # Get node kind
+    kind = node[0]
+
+    # If the node is "or" or "and"
+    if kind in ('or', 'and'):
+        # Get the joining operator.
+        # "or" is true if any is true, and false if all are false. "and" is
+        # true if all are true, and false if any is false.
+        join_op = kind if is_true else ('and' if kind == 'or' else 'or')
+
+        # Return joined source
+        return '({})'.format(' {} '.format(join_op).join(
+            where_to_python(x, is_true) for x in node[1]))
+
+    # If the node is "not"
+    if kind == 'not':
+        # "not" is true if the operand is false, and false if the operand is
+        # true
+        return where_to_python(node[1], not is_true)
+
+    # Create function that converts an operand
+    def operand_to_python(operand, is_numeric):
+        # If the operand is a column
+        if operand[0] == 'col':
+            # Get column value source
+            value_src = 'row[{}]'.format(operand[1])
+
+            # If compared with a number
+            if is_numeric:
+                # Convert the value to number
+                value_src = '_n({})'.format(value_src)
+
+            # Return column value source
+            return value_src
+
+        # Return literal source
+        return repr(operand[1])
+
+    # If the node is a comparison
+    if kind == 'cmp':
+        # Get operator and operands
+        _, op, left, right = node
+
+        # Whether the comparison is numeric
+        is_numeric = any(
+            x[0] == 'lit' and not isinstance(x[1], str)
+            for x in (left, right))
+
+        # If the comparison is not numeric
+        if not is_numeric:
+            # Get comparison source, which is None if unknown
+            cmp_src = '_c({!r}, {}, {})'.format(
+                op,
+                operand_to_python(left, False),
+                operand_to_python(right, False))
+
+            # Return source that tests the comparison is true or false
+            return '({} is {})'.format(cmp_src, is_true)
+
+        # Get comparison source
+        cmp_src = '{} {} {}'.format(
+            operand_to_python(left, is_numeric),
+            _PY_OP_MAP[op],
+            operand_to_python(right, is_numeric))
+
+        # If testing that the comparison is false
+        if not is_true:
+            # Negate the comparison
+            cmp_src = 'not ({})'.format(cmp_src)
+
+        # Return comparison source, which is neither true nor false if a
+        # column value is None
+        return '({})'.format(' and '.join(
+            ['row[{}] is not None'.format(x[1])
+             for x in (left, right) if x[0] == 'col'] + [cmp_src]))
+
+    # The node is a null check.
+    # It is never unknown, so testing false is testing the opposite check.
+    return '({} is {}None)'.format(
+        operand_to_python(node[1], False),
+        'not ' if node[2] == is_true else '')
+
+
+#
+def to_number(value):
+    """
+    Convert value to number for numeric comparison.
+
+    @param value: Value.
+
+    @return: The value if it is a number, the converted value if it is number
+    text, otherwise NaN.
+    """
+    # If the value is a number
+    if isinstance(value, (int, float)):
+        # Return the value
+        return value
+
+    try:
+        # Convert to float
+        return float(value)
+    except (TypeError, ValueError):
+        # Return NaN
+        return float('nan')
+
+
+#
+def compare_values(op, left, right):
+    """
+    Compare two values, following SQL rules for None and mixed types.
+
+    Text compared with a number is converted to a number, as SQL databases do
+    for a text literal compared with a number column. Text that is not a
+    number compares as NaN, because databases do not agree on that case.
+    Other values of mixed types, e.g. a date and text, are compared as text.
+
+    @param op: Normalized operator.
+
+    @param left: Left value.
+
+    @param right: Right value.
+
+    @return: True or False. None if unknown, i.e. a value is None or the
+    values can not be compared.
+    """
+    # If a value is None
+    if left is None or right is None:
+        # Return unknown
+        return None
+
+    # Whether the values are text
+    left_is_text = isinstance(left, _TEXT_TYPES)
+
+    right_is_text = isinstance(right, _TEXT_TYPES)
+
+    # If only one value is text
+    if left_is_text != right_is_text:
+        # If the other value is a number
+        if isinstance(right if left_is_text else left, numbers.Number):
+            # Convert the text value to number
+            if left_is_text:
+                left = to_number(left)
+            else:
+                right = to_number(right)
+        # If the other value is not a number
+        else:
+            # Compare as text
+            if left_is_text:
+                right = str(right)
+            else:
+                left = str(left)
+
+    try:
+        # Compare the values
+        return _OP_FUNC_MAP[op](left, right)
+    except TypeError:
+        # Return unknown
+        return None
+
+
+#
+def compile_where(node):
+    """
+    Compile expression tree to filter functions.
+
+    @param node: Expression tree with column indices only.
+
+    @return: Filter functions dict, in the format:
+    {
+        'row_func': ...,
+        'batch_func': ...,
+    }
+    "row_func(row)" returns whether a row matches. "batch_func(rows)" returns
+    the list of matching rows, testing all rows in one list comprehension.
+    Both let through None and the stop object, which input objects yield to
+    mean "ignore current row" and "stop processing".
+    """
+    # Get expression source
+    expr_src = where_to_python(node)
+
+    # Get namespace of compiled functions
+    namespace = {
+        '_n': to_number,
+        '_c': compare_values,
+        '_stop': STOP_OBJ,
+    }
+
+    # Get function source
+    func_src = '''
+def row_func(row):
+    return row is None or row is _stop or {expr}
+
+def batch_func(rows):
+    return [row for row in rows if row is None or row is _stop or {expr}]
+'''.format(expr=expr_src)
+
+    # Compile functions
+    exec(compile(func_src, '<where>', 'exec'), namespace)
+
+    # Return filter functions dict
+    return {
+        'row_func': namespace['row_func'],
+        'batch_func': namespace['batch_func'],
+    }
+
+
+#
+def where_filter_iter(row_iter, batch_func, chunk_size):
+    """
+    Generator that yields matching rows, reading and testing rows in chunks.
+
+    @param row_iter: Row iterator.
+
+    @param batch_func: Batch filter function. See "compile_where".
+
+    @param chunk_size: Number of rows tested at a time.
+
+    @return: A generator.
+    """
+    # Get iterator
+    row_iter = iter(row_iter)
+
+    # Repeat
+    while True:
+        # Read a chunk of rows
+        row_s = list(itertools.islice(row_iter, chunk_size))
+
+        # If no more rows
+        if not row_s:
+            # Stop
+            return
+
+        # For each matching row
+        for row in batch_func(row_s):
+            # Yield the row
+            yield row
+
+
+#
+def where_to_sqlalchemy(node, column_s):
+    """
+    Convert expression tree to SQLAlchemy clause.
+
+    @param node: Expression tree with column indices only.
+
+    @param column_s: SQLAlchemy column objects, in input column order.
+
+    @return: SQLAlchemy clause.
+    """
+    # Import here because SQLAlchemy is needed only for database inputs
+    from sqlalchemy import and_
+    from sqlalchemy import literal
+    from sqlalchemy import not_
+    from sqlalchemy import or_
+
+    # Get node kind
+    kind = node[0]
+
+    # If the node is "or"
+    if kind == 'or':
+        return or_(*[where_to_sqlalchemy(x, column_s) for x in node[1]])
+
+    # If the node is "and"
+    if kind == 'and':
+        return and_(*[where_to_sqlalchemy(x, column_s) for x in node[1]])
+
+    # If the node is "not"
+    if kind == 'not':
+        return not_(where_to_sqlalchemy(node[1], column_s))
+
+    # Create function that converts an operand
+    def operand_to_sqlalchemy(operand):
+        # If the operand is a column
+        if operand[0] == 'col':
+            # Return column object
+            return column_s[operand[1]]
+
+        # Return literal object
+        return literal(operand[1])
+
+    # If the node is a comparison
+    if kind == 'cmp':
+        # Get operator function
+        op_func = _OP_FUNC_MAP[node[1]]
+
+        # Return comparison clause
+        return op_func(
+            operand_to_sqlalchemy(node[2]),
+            operand_to_sqlalchemy(node[3]))
+
+    # Get operand object
+    operand_obj = operand_to_sqlalchemy(node[1])
+
+    # Return null check clause
+    if node[2]:
+        return operand_obj.isnot(None)
+    else:
+        return operand_obj.is_(None)
+
+
+#
+def where_to_sql_text(node, column_text_s):
+    """
+    Convert expression tree to SQL text with "?" parameters.
+
+    @param node: Expression tree with column indices only.
+
+    @param column_text_s: Quoted column names, in input column order.
+
+    @return: A tuple of 2 elements: (SQL text, parameters list).
+    """
+    # Parameters list
+    param_s = []
+
+    # Create function that converts a node
+    def node_to_text(node):
+        # Get node kind
+        kind = node[0]
+
+        # If the node is "or" or "and"
+        if kind in ('or', 'and'):
+            return '({})'.format(
+                ' {} '.format(kind.upper()).join(
+                    node_to_text(x) for x in node[1]))
+
+        # If the node is "not"
+        if kind == 'not':
+            return '(NOT {})'.format(node_to_text(node[1]))
+
+        # Create function that converts an operand
+        def operand_to_text(operand):
+            # If the operand is a column
+            if operand[0] == 'col':
+                # Return quoted column name
+                return column_text_s[operand[1]]
+
+            # Add parameter
+            param_s.append(operand[1])
+
+            # Return parameter placeholder
+            return '?'
+
+        # If the node is a comparison
+        if kind == 'cmp':
+            return '({} {} {})'.format(
+                operand_to_text(node[2]),
+                node[1],
+                operand_to_text(node[3]))
+
+        # The node is a null check
+        return '({} IS {}NULL)'.format(
+            operand_to_text(node[1]),
+            'NOT ' if node[2] else '')
+
+    # Convert the node
+    sql_text = node_to_text(node)
+
+    # Return the tuple
+    return sql_text, param_s
@@ -0,0 +1,14 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import os.path
+import sys
+
+
+# Add "src" directory to "sys.path" so that tests run without installing the
+# package
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 'src'))
@@ -0,0 +1,108 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import os.path
+import sqlite3
+
+import pytest
+
+from aoikpourtable.async_db_io import insert_factory
+
+
+#
+def _has_async_support():
+    try:
+        import sqlalchemy.ext.asyncio  # noqa: F401
+        import aiosqlite  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+#
+HAS_ASYNC_SUPPORT = _has_async_support()
+
+
+#
+def _create_table(db_path):
+    db_conn = sqlite3.connect(db_path)
+
+    db_conn.execute('CREATE TABLE dst (a INTEGER, b TEXT)')
+
+    db_conn.commit()
+
+    db_conn.close()
+
+
+#
+def _read_rows(db_path):
+    db_conn = sqlite3.connect(db_path)
+
+    row_s = db_conn.execute('SELECT a, b FROM dst ORDER BY a').fetchall()
+
+    db_conn.close()
+
+    return row_s
+
+
+#
+@pytest.mark.skipif(HAS_ASYNC_SUPPORT, reason='async support is installed')
+def test_insert_factory_requires_async_support(tmpdir):
+    with pytest.raises(ValueError) as exc_info:
+        insert_factory(
+            'sqlite+aiosqlite:///' + str(tmpdir.join('out.db')),
+            '',
+            'table=dst&columns=a,b',
+            {})
+
+    assert 'AoikPourTable[async]' in str(exc_info.value)
+
+
+#
+@pytest.mark.skipif(
+    not HAS_ASYNC_SUPPORT, reason='requires SQLAlchemy 1.4+ and aiosqlite')
+@pytest.mark.parametrize('ordered', ['0', '1'])
+def test_insert_factory_aiosqlite(tmpdir, ordered):
+    db_path = str(tmpdir.join('out.db'))
+
+    _create_table(db_path)
+
+    output_ctx = insert_factory(
+        'sqlite+aiosqlite:///' + db_path,
+        '',
+        'table=dst&columns=a,b&window=3&ordered=' + ordered,
+        {})
+
+    with output_ctx as output_func:
+        for batch_index in range(10):
+            output_func([
+                [batch_index * 5 + x, 'r{}'.format(batch_index * 5 + x)]
+                for x in range(5)
+            ])
+
+    assert _read_rows(db_path) == [(x, 'r{}'.format(x)) for x in range(50)]
+
+
+#
+@pytest.mark.skipif(
+    not HAS_ASYNC_SUPPORT, reason='requires SQLAlchemy 1.4+ and aiosqlite')
+def test_insert_factory_aiosqlite_reports_failed_batch(tmpdir):
+    db_path = str(tmpdir.join('out.db'))
+
+    _create_table(db_path)
+
+    output_ctx = insert_factory(
+        'sqlite+aiosqlite:///' + db_path,
+        '',
+        'table=dst&columns=a,no_such_column',
+        {})
+
+    with pytest.raises(Exception):
+        with output_ctx as output_func:
+            output_func([[1, 'x']])
+
+    assert os.path.isfile(db_path)
+
+    assert _read_rows(db_path) == []
@@ -0,0 +1,63 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import io
+
+import pytest
+
+from aoikpourtable.csv_io import csv_input_factory
+from aoikpourtable.csv_io import csv_record_generator
+
+
+# Lines with one unbalanced quote
+_DATA = b'a,5" tall\nb,6\nc,7\n'
+
+
+#
+def test_record_generator_counts_quotes():
+    position_info = {'position': 0}
+
+    record_s = list(csv_record_generator(
+        io.BytesIO(b'"a\nb",1\nc,2\n'), '"', position_info))
+
+    assert record_s == [b'"a\nb",1\n', b'c,2\n']
+
+    assert position_info['position'] == 12
+
+
+#
+def test_record_generator_without_quotes_splits_every_line():
+    position_info = {'position': 0}
+
+    record_s = list(csv_record_generator(
+        io.BytesIO(_DATA), None, position_info))
+
+    assert record_s == [b'a,5" tall\n', b'b,6\n', b'c,7\n']
+
+    assert position_info['position'] == len(_DATA)
+
+
+#
+def test_binary_input_with_quote_none_splits_every_line(tmp_path):
+    input_path = tmp_path / 'in.csv'
+
+    input_path.write_bytes(_DATA)
+
+    factory_info = csv_input_factory(
+        str(input_path), None, 'quoting=QUOTE_NONE',
+        {'binary_transport': True})
+
+    assert len(list(factory_info['input_obj'])) == 3
+
+
+#
+def test_binary_input_rejects_escapechar(tmp_path):
+    input_path = tmp_path / 'in.csv'
+
+    input_path.write_bytes(_DATA)
+
+    with pytest.raises(ValueError):
+        csv_input_factory(
+            str(input_path), None, 'quoting=QUOTE_NONE&escapechar=%5C',
+            {'binary_transport': True})
@@ -0,0 +1,110 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from aoikpourtable.db_io import swap_get_sequences
+from aoikpourtable.db_io import swap_tables
+
+
+#
+class _FakeTransaction(object):
+    """
+    Transaction stub that records whether it is committed.
+    """
+
+    def __init__(self):
+        self.is_committed = False
+
+    def commit(self):
+        self.is_committed = True
+
+    def rollback(self):
+        pass
+
+
+#
+class _FakeConnection(object):
+    """
+    PostgreSQL connection stub that records executed statements.
+    """
+
+    def __init__(self):
+        self.dialect = postgresql.dialect()
+
+        self.statement_s = []
+
+        self.transaction = _FakeTransaction()
+
+    def begin(self):
+        return self.transaction
+
+    def execute(self, statement, *args, **kwargs):
+        self.statement_s.append(str(statement))
+
+
+#
+def _make_serial_tables():
+    # Get MetaData object
+    metadata = MetaData()
+
+    # Target table as reflected from PostgreSQL, with a "serial" column
+    target_table = Table(
+        'items',
+        metadata,
+        Column(
+            'id',
+            Integer,
+            primary_key=True,
+            server_default=text("nextval('items_id_seq'::regclass)")),
+        Column('name', String),
+        Column('code', String, server_default=text("'x'::text")),
+        schema='public')
+
+    # Staging table, with copies of target table columns
+    stage_table = Table(
+        'items__stage',
+        metadata,
+        *[x.copy() for x in target_table.columns],
+        schema='public')
+
+    # Return the tuple
+    return target_table, stage_table
+
+
+#
+def test_swap_get_sequences():
+    target_table, _ = _make_serial_tables()
+
+    assert swap_get_sequences(target_table) == [('id', 'items_id_seq')]
+
+
+#
+def test_swap_tables_reowns_serial_sequence_before_drop():
+    target_table, stage_table = _make_serial_tables()
+
+    connec = _FakeConnection()
+
+    swap_tables(connec, target_table, stage_table, [])
+
+    statement_s = connec.statement_s
+
+    # The sequence is given to the new table before the old table is dropped
+    reown_index = statement_s.index(
+        'ALTER SEQUENCE items_id_seq OWNED BY public.items.id')
+
+    drop_index = statement_s.index('DROP TABLE public.items__old')
+
+    assert statement_s.index(
+        'ALTER TABLE public.items__stage RENAME TO items') < reown_index
+
+    assert reown_index < drop_index
+
+    assert connec.transaction.is_committed
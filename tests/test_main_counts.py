@@ -0,0 +1,78 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+from aoikpourtable.main import main_wrap
+
+
+#
+def _pour(tmp_path, line_s, extra_arg_s):
+    # Create input file
+    input_path = tmp_path / 'in.csv'
+
+    input_path.write_text(u''.join(line_s))
+
+    # Get output file path
+    output_path = tmp_path / 'out.csv'
+
+    # Result info dict the program puts processed row count in
+    result_info = {}
+
+    exit_code = main_wrap(
+        args=[
+            '--input', str(input_path),
+            '--input-factory', 'aoikpourtable.csv_io::csv_input_factory',
+            '--output', str(output_path),
+            '--output-factory', 'aoikpourtable.csv_io::csv_output_factory',
+            '--timing',
+        ] + extra_arg_s,
+        result_info=result_info)
+
+    assert exit_code == 0
+
+    # Return processed row count and output lines
+    return result_info['row_count'], output_path.read_text().splitlines()
+
+
+#
+def test_dedup_dropped_rows_do_not_block_batches(tmp_path, capsys):
+    # Every second row repeats the key of the row before it, so a duplicate
+    # lands on every batch boundary
+    line_s = [
+        u'"{}","0"\n'.format(i - i % 2) for i in range(40)]
+
+    row_count, output_line_s = _pour(
+        tmp_path, line_s, ['--dedup-key', '1', '--batch-size', '4'])
+
+    # Dropped rows are not counted
+    assert row_count == 20
+
+    assert len(output_line_s) == 20
+
+    # Rows are output in full batches
+    assert '5 batches' in capsys.readouterr().err
+
+
+#
+def test_rejected_rows_are_not_counted(tmp_path, capsys):
+    # The 4th row fails to convert, at the first batch boundary
+    line_s = [
+        u'"{}","0"\n'.format('x' if i == 3 else i) for i in range(10)]
+
+    reject_path = tmp_path / 'reject.jsonl'
+
+    row_count, output_line_s = _pour(tmp_path, line_s, [
+        '--convert-args', 'i,i',
+        '--reject-file', str(reject_path),
+        '--batch-size', '3',
+    ])
+
+    # Rejected rows are not counted
+    assert row_count == 9
+
+    assert len(output_line_s) == 9
+
+    assert len(reject_path.read_text().splitlines()) == 1
+
+    # Rows are output in full batches
+    assert '3 batches' in capsys.readouterr().err
@@ -0,0 +1,53 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import json
+
+import pytest
+
+from aoikpourtable.main import main_core
+
+
+#
+def _run_jobs(tmp_path, extra_arg_s):
+    # Create input file
+    input_path = tmp_path / 'in.csv'
+
+    input_path.write_text(u'"1","2"\n"3","4"\n')
+
+    # Create job manifest
+    jobs_path = tmp_path / 'jobs.json'
+
+    jobs_path.write_text(json.dumps([{
+        'name': 'a',
+        'input': str(input_path),
+        'input-factory': 'aoikpourtable.csv_io::csv_input_factory',
+        'output': str(tmp_path / 'out.csv'),
+        'output-factory': 'aoikpourtable.csv_io::csv_output_factory',
+    }]))
+
+    return main_core(
+        args=['--jobs', str(jobs_path)] + extra_arg_s,
+        step_info_set_func=lambda **kwargs: None)
+
+
+#
+def test_jobs_accepts_job_runner_arguments(tmp_path):
+    assert _run_jobs(tmp_path, ['--jobs-workers', '2']) == 0
+
+    assert (tmp_path / 'out.csv').read_text().splitlines() == [
+        '"1","2"', '"3","4"']
+
+
+#
+@pytest.mark.parametrize('extra_arg_s', [
+    ['--timing'],
+    ['--profile', 'prof.out'],
+    ['--progress-file', 'progress.txt'],
+])
+def test_jobs_rejects_other_arguments(tmp_path, extra_arg_s):
+    with pytest.raises(ValueError) as exc_info:
+        _run_jobs(tmp_path, extra_arg_s)
+
+    assert extra_arg_s[0] in str(exc_info.value)
@@ -0,0 +1,79 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import pytest
+
+from aoikpourtable import partition_util
+from aoikpourtable.main import main_core
+
+
+#
+class _PartitionsRunCalled(Exception):
+    """
+    Raised by the fake "partitions_run" to stop the pour after dispatch.
+    """
+
+
+#
+def _get_partition_mode(monkeypatch, tmp_path, extra_arg_s):
+    # Create input file
+    input_path = tmp_path / 'in.csv'
+
+    input_path.write_text(
+        u''.join(u'"{}","{}"\n'.format(i, i % 5) for i in range(20)))
+
+    # Arguments the fake "partitions_run" is called with
+    call_info = {}
+
+    def fake_partitions_run(argv, partition_count, mode, **kwargs):
+        call_info['mode'] = mode
+
+        call_info['key_index_s'] = kwargs.get('key_index_s', None)
+
+        raise _PartitionsRunCalled()
+
+    monkeypatch.setattr(partition_util, 'partitions_run', fake_partitions_run)
+
+    with pytest.raises(_PartitionsRunCalled):
+        main_core(
+            args=[
+                '--input', str(input_path),
+                '--input-factory', 'aoikpourtable.csv_io::csv_input_factory',
+                '--output', str(tmp_path / 'out{partition}.csv'),
+                '--output-factory',
+                'aoikpourtable.csv_io::csv_output_factory',
+                '--partitions', '3',
+            ] + extra_arg_s,
+            step_info_set_func=lambda **kwargs: None)
+
+    return call_info
+
+
+#
+def test_partition_key_uses_key_mode(monkeypatch, tmp_path):
+    call_info = _get_partition_mode(
+        monkeypatch, tmp_path, ['--partition-key', '1'])
+
+    assert call_info == {'mode': 'key', 'key_index_s': [0]}
+
+
+#
+def test_partition_key_within_dedup_key_uses_key_mode(monkeypatch, tmp_path):
+    call_info = _get_partition_mode(
+        monkeypatch, tmp_path, ['--partition-key', '2', '--dedup-key', '2'])
+
+    assert call_info == {'mode': 'key', 'key_index_s': [1]}
+
+
+#
+def test_no_partition_key_uses_ordinal_mode(monkeypatch, tmp_path):
+    call_info = _get_partition_mode(monkeypatch, tmp_path, [])
+
+    assert call_info['mode'] == 'ordinal'
+
+
+#
+def test_dedup_key_requires_partition_key(monkeypatch, tmp_path):
+    with pytest.raises(ValueError):
+        _get_partition_mode(monkeypatch, tmp_path, ['--dedup-key', '2'])
@@ -0,0 +1,165 @@
+# coding: utf-8
+#
+from __future__ import absolute_import
+
+import datetime
+import sqlite3
+
+import pytest
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import Table
+
+from aoikpourtable.where_util import compile_where
+from aoikpourtable.where_util import parse_where
+from aoikpourtable.where_util import resolve_where_columns
+from aoikpourtable.where_util import where_to_sql_text
+from aoikpourtable.where_util import where_to_sqlalchemy
+
+
+# Rows with NULLs in every column
+_ROWS = [
+    (1, 'x', 5),
+    (2, 'z', 7),
+    (3, None, None),
+    (4, 'a', None),
+    (5, None, 5),
+]
+
+# Column names
+_COLUMN_NAMES = ['id', 'name', 'num']
+
+# Filter expressions that must give the same rows in Python and SQL
+_WHERE_TEXTS = [
+    '$3 = 5',
+    '$3 != 5',
+    'not ($3 = 5)',
+    'not ($3 != 5)',
+    '$2 < "y"',
+    'not ($2 < "y")',
+    '$2 >= "b"',
+    '$2 = $2',
+    '$2 is null',
+    'not ($2 is null)',
+    '$3 is not null and $3 > 6',
+    '$3 = 5 or $2 = "a"',
+    'not ($3 = 5 or $2 = "a")',
+    'not ($3 = 5 and $1 > 1)',
+    'not (not ($3 != 7))',
+    'num > 5 or name < "b"',
+    '$1 < "3"',
+    '$1 = "2"',
+    'not ($1 >= "4")',
+    '$3 != "5"',
+]
+
+
+#
+def _python_ids(where_text):
+    # Compile the filter in the same way as the Python path of the program
+    row_func = compile_where(resolve_where_columns(
+        parse_where(where_text), _COLUMN_NAMES))['row_func']
+
+    return [row[0] for row in _ROWS if row_func(row)]
+
+
+#
+def _sql_text_ids(where_text):
+    db_conn = sqlite3.connect(':memory:')
+
+    db_conn.execute('CREATE TABLE t (id INTEGER, name TEXT, num INTEGER)')
+
+    db_conn.executemany('INSERT INTO t VALUES (?, ?, ?)', _ROWS)
+
+    sql_text, param_s = where_to_sql_text(
+        resolve_where_columns(parse_where(where_text), _COLUMN_NAMES),
+        ['"{}"'.format(x) for x in _COLUMN_NAMES])
+
+    id_s = [x[0] for x in db_conn.execute(
+        'SELECT id FROM t WHERE {} ORDER BY id'.format(sql_text), param_s)]
+
+    db_conn.close()
+
+    return id_s
+
+
+#
+def _sqlalchemy_ids(where_text):
+    engine = create_engine('sqlite://')
+
+    table = Table(
+        't',
+        MetaData(),
+        Column('id', Integer),
+        Column('name', String),
+        Column('num', Integer))
+
+    table.create(engine)
+
+    with engine.connect() as connec:
+        connec.execute(table.insert(), [
+            dict(zip(_COLUMN_NAMES, x)) for x in _ROWS])
+
+        clause = where_to_sqlalchemy(
+            resolve_where_columns(parse_where(where_text), _COLUMN_NAMES),
+            list(table.columns))
+
+        id_s = [x[0] for x in connec.execute(
+            select([table.c.id]).where(clause).order_by(table.c.id))]
+
+    engine.dispose()
+
+    return id_s
+
+
+#
+@pytest.mark.parametrize('where_text', _WHERE_TEXTS)
+def test_python_path_matches_sql_text_path(where_text):
+    assert _python_ids(where_text) == _sql_text_ids(where_text)
+
+
+#
+@pytest.mark.parametrize('where_text', _WHERE_TEXTS)
+def test_python_path_matches_sqlalchemy_path(where_text):
+    assert _python_ids(where_text) == _sqlalchemy_ids(where_text)
+
+
+#
+def test_python_path_null_comparisons_are_not_true():
+    # A comparison with NULL is unknown, and so is its negation
+    assert _python_ids('$3 != 5') == [2]
+
+    assert _python_ids('not ($3 = 5)') == [2]
+
+    # Comparing NULL with a string does not raise TypeError
+    assert _python_ids('$2 < "y"') == [1, 4]
+
+
+#
+def test_python_path_non_number_compares_as_nan():
+    row_func = compile_where(parse_where('$1 = 5'))['row_func']
+
+    assert not row_func(['abc'])
+
+    assert compile_where(parse_where('$1 != 5'))['row_func'](['abc'])
+
+    assert compile_where(parse_where('not ($1 = 5)'))['row_func'](['abc'])
+
+
+#
+def test_python_path_typed_rows_compare_with_strings():
+    # Integer fields compared with strings do not raise TypeError
+    assert _python_ids('$1 < "5"') == [1, 2, 3, 4]
+
+    assert _python_ids('$1 = "2" or $3 = "7"') == [2]
+
+    # A date field compared with a string is compared as text
+    row_func = compile_where(parse_where('$1 >= "2020-01-02"'))['row_func']
+
+    assert row_func([datetime.date(2020, 1, 3)])
+
+    assert not row_func([datetime.date(2020, 1, 1)])